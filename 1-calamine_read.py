@@ -1,7 +1,25 @@
 import python_calamine
 import time
 
+from excel_to_duckdb_preview import preview_workbook
+
 file_path = "sample_data.xlsx"
+# 只看前几行时使用快速预览: 读到所需行数即停止，不解码整张表
+PREVIEW = True
+
+if PREVIEW:
+    t1 = time.time()
+    info = preview_workbook(file_path, nrows=10)
+    print(f"工作表: {info['sheet_names']}")
+    print(f"表头: {info['headers']}")
+    print("前10行数据:")
+    for row in info['rows']:
+        print(row)
+    print(f"数据行数: {'约 ' if not info['exact'] else ''}{info['estimated_rows']}")
+    t2 = time.time()
+    print(f"查询时间: {t2 - t1:.2f} 秒")
+    exit()
+
 # 推荐使用二进制模式读取
 with open(file_path, 'rb') as f_r:
     xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
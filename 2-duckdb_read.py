@@ -2,6 +2,8 @@ import os
 import time
 import duckdb
 
+from excel_to_duckdb_resources import connect
+
 '''
 在你的代码里 con = duckdb.connect() 没有传入文件路径，DuckDB 默认创建的是 内存数据库 ，
 不会在当前目录生成类似 *.duckdb 的临时数据库文件；只有你写成 duckdb.connect("xxx.duckdb") 才会落盘生成数据库文件。
@@ -29,7 +31,7 @@ def save_excel_to_duckdb(excel_file, db_path):
     try:
         t1 = time.time()
         # 连接到数据库文件
-        con = duckdb.connect(db_path)
+        con = connect(db_path)
 
         # 安装并加载 spatial 扩展 (需要联网一次)
         # spatial 扩展包含 GDAL，支持读取 Excel 等多种格式
@@ -79,7 +81,7 @@ def read_from_duckdb(db_path, table_name):
         print(f"错误：数据库文件不存在 {db_path}")
         return
 
-    con = duckdb.connect(db_path)
+    con = connect(db_path)
 
     try:
         # 1. 简单展示前5行
@@ -1,13 +1,19 @@
 import python_calamine
-import duckdb
+from excel_to_duckdb_resources import connect
+import multiprocessing
 import os
 import time
 
+from excel_to_duckdb_clean import split_sheet
+
 # excel_file = "sample_data.xlsx"
 excel_file = "large_test.xlsx"
 db_dir = "duckdb_output"
 tablie_name = excel_file.split('.')[0]
 db_path = os.path.join(db_dir, f"{excel_file.split('.')[0]}.duckdb")
+# 流式模式: 按块读取行并逐块追加写入，不再把整个工作表读成 Python 列表
+STREAMING = True
+CHUNK_SIZE = 50000
 
 # 1. 确保临时目录存在
 if not os.path.exists(db_dir):
@@ -16,6 +22,24 @@ if not os.path.exists(db_dir):
 
 print(f"正在读取 {excel_file} 并保存到 {db_path}...")
 
+if STREAMING:
+    from excel_to_duckdb_processor import save_excel_to_duckdb_streaming
+
+    try:
+        t1 = time.time()
+        row_count = save_excel_to_duckdb_streaming(
+            excel_file, db_path, tablie_name, CHUNK_SIZE,
+            on_chunk=lambda n: print(f"  已写入 {n} 行..."))
+        if row_count == 0:
+            print("Excel 文件为空！")
+            exit()
+        t2 = time.time()
+        print(f"数据导入耗时 {t2 - t1:.2f} 秒，共 {row_count} 行。")
+        print(f"\n成功！数据库已保存至: {os.path.abspath(db_path)}")
+    except Exception as e:
+        print(f"错误: {e}")
+    exit()
+
 try:
     # 2. 使用 calamine 读取 Excel (保持原有逻辑)
     with open(excel_file, 'rb') as f_r:
@@ -28,59 +52,37 @@ try:
         exit()
 
     # 3. 将数据写入 DuckDB 文件
-    # 连接到持久化数据库文件
-    con = duckdb.connect(db_path)
-
     t1 = time.time()
-    
-    # 获取列名 (第一行是表头)
-    headers = [str(h) for h in sheet_data[0]] 
-    rows = sheet_data[1:]
-    
-    # 方式 A: 借助 Pandas 转 DuckDB (最稳健，自动处理空值类型转换)
-    # 注意：如果导入 pandas 失败，会抛出 ImportError，然后进入 except 块使用原生 SQL 插入
+
+    # 方式 A: 借助 Pandas 转 DuckDB (最稳健，自动处理空值类型转换)；数据行较多时按行范围分段，多进程并行转换。
+    # 本脚本没有 __main__ 保护，spawn 方式启动的子进程会重新执行整个脚本，因此只在 fork 可用时分段
+    # 注意：如果导入 pandas 失败，会抛出 ImportError，然后进入 except 块使用列式批量写入
     try:
-        import pandas as pd
-        import numpy as np
-        # 消除 FutureWarning: Downcasting behavior in `replace` is deprecated
-        pd.set_option('future.no_silent_downcasting', True)
-        
-        # 注意：如果 Excel 有空行可能会导致类型推断错误，Pandas 处理比较好
-        # 将空字符串替换为 NaN，以便 DuckDB 正确识别为 NULL
-        df = pd.DataFrame(rows, columns=headers)
-        df = df.replace('', np.nan).infer_objects(copy=False)
-        
-        # 将 DataFrame 写入 DuckDB 表 'sample_data'
-        con.execute(f"CREATE OR REPLACE TABLE {tablie_name} AS SELECT * FROM df")
-        print("表 'sample_data' 已通过 Pandas 桥接创建成功。")
-        
-        
+        from excel_to_duckdb_processor import SHARD_WORKERS, save_sheet_sharded
+
+        workers = SHARD_WORKERS if 'fork' in multiprocessing.get_all_start_methods() else 1
+        row_count = save_sheet_sharded(sheet_data, db_path, tablie_name, workers)
+        print(f"表 '{tablie_name}' 已通过 Pandas 桥接创建成功 ({row_count} 行)。")
+
     except ImportError:
-        # 如果没有 Pandas，回退到原生 SQL 插入
-        # 简单粗暴：全部当做 VARCHAR 处理以避免类型错误 (比如空字符串转数字失败)
-        print("未找到 Pandas。正在使用原生 SQL (为安全起见，所有列均视为 VARCHAR)...")
-        
-        # 创建表，所有列都设为 VARCHAR
-        cols_def = ", ".join([f'"{h}" VARCHAR' for h in headers])
-        create_sql = f"CREATE OR REPLACE TABLE {tablie_name} ({cols_def})"
-        con.execute(create_sql)
-        
-        # 插入数据 (需将所有值转为字符串，处理 None)
-        # 这是一个比较慢的方法，但最通用
-        placeholders = ', '.join(['?'] * len(headers))
-        insert_sql = f"INSERT INTO {tablie_name} VALUES ({placeholders})"
-        
-        # 转换数据为字符串，避免类型转换错误
-        safe_rows = [[str(cell) if cell is not None else None for cell in row] for row in rows]
-        con.executemany(insert_sql, safe_rows)
+        # 如果没有 Pandas，回退到列式批量写入: 行数据转置为列数组 (有 pyarrow 时为 Arrow 数组)，
+        # 整批交给 DuckDB；每列按值的 Python 类型确定列类型，类型混杂的列存为 VARCHAR
+        from excel_to_duckdb_columnar import bulk_insert
+
+        print("未找到 Pandas。正在使用列式批量写入...")
+        # 获取列名 (自动识别表头行，过滤合计行和空行)
+        header_row, rows = split_sheet(sheet_data)
+        headers = [str(h) for h in header_row]
+        # 连接到持久化数据库文件
+        con = connect(db_path)
+        bulk_insert(con, tablie_name, headers, rows)
+        con.close()
 
     t2 = time.time()
     print(f"数据导入耗时 {t2 - t1:.2f} 秒。")
     
     # 4. 验证读取
     print(f"\n正在验证 DuckDB 文件中的数据 ({db_path}):")
-    # 关闭连接
-    con.close()
     
     print(f"\n成功！数据库已保存至: {os.path.abspath(db_path)}")
 
@@ -1,26 +1,31 @@
 import os
 import time
 
-import duckdb
+from excel_to_duckdb_reader import iter_batches
+
+# 分批读取，每批 BATCH_SIZE 行，内存占用与表大小无关
+BATCH_SIZE = 10000
+# 只读取部分列 (None 表示全部) 和过滤条件 (如 "月结卡号 = '0123'")，由 DuckDB 在扫描时完成
+COLUMNS = None
+WHERE = None
+
 for db_name in os.listdir("duckdb_output"):
-    con = duckdb.connect(f'duckdb_output/{db_name}')
+    # 跳过增量清单 (*.manifest.json) 等非数据库文件
+    if not db_name.endswith('.duckdb'):
+        continue
     # con.sql("SELECT * FROM excel_data LIMIT 100").show()
-    # 方法 1: 使用 fetchall() 一次性获取所有行 (适合小数据量)
     table_name = db_name.split('.')[0]
     t1 = time.time()
-    rows =con.sql(f"SELECT * FROM {table_name}").fetchall()
+    num = 0
+    # 不再 fetchall() 一次性取出所有行，而是按批 fetchmany
+    for rows in iter_batches(f'duckdb_output/{db_name}', table_name, COLUMNS, WHERE, batch_size=BATCH_SIZE):
+        for row in rows:
+            print(num, row)
+            num += 1
     t2 = time.time()
-    print(f"加载数据库 {db_name} 中表 {table_name}，耗时{t2-t1:.2f}s")
-    for num, row in enumerate(rows):
-        print(num,row)
+    print(f"加载数据库 {db_name} 中表 {table_name}，共 {num} 行，耗时{t2-t1:.2f}s")
 
-# 方法 2 (更推荐): 使用 fetchone() 逐行获取 (内存友好)
-# result = con.sql("SELECT * FROM excel_data")
-# num = 0
-# while True:
-#     row = result.fetchone()
-#     if not row:
-#         break
-#     # print(num, row)
-#     print(num)
-#     num += 1
\ No newline at end of file
+# 大表需要分段处理或中断后继续时，可以使用键集分页 (每页一个独立查询):
+# from excel_to_duckdb_reader import iter_pages
+# for rows, last_key in iter_pages('duckdb_output/xxx.duckdb', 'xxx', page_size=BATCH_SIZE):
+#     print(len(rows), last_key)
@@ -3,40 +3,107 @@ import duckdb
 import os
 import time
 import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from excel_to_duckdb_clean import HEADER_KEYWORDS as DEFAULT_HEADER_KEYWORDS, split_sheet
+from excel_to_duckdb_schema import (sample_rows, infer_schema, write_typed_table, has_values, merge_column_type,
+                                    widen_column, reconcile_headers)
+from excel_to_duckdb_manifest import (SOURCE_COLUMN, load_manifest, save_manifest, plan_changes,
+                                      delete_source_rows)
+from excel_to_duckdb_sink import open_staging, export_parquet, PARQUET_DIR
+from excel_to_duckdb_catalog import CATALOG_PATH, month_databases, refresh_catalog
+from excel_to_duckdb_metrics import StageMetrics, new_run_id, timed_chunks, emit as emit_metrics
+from excel_to_duckdb_dedup import DUPLICATES_SUFFIX, dedup_table, dedup_incremental, file_priority
+from excel_to_duckdb_pipeline import PARSE_WORKERS, parse_ahead
+from excel_to_duckdb_summary import SUMMARY_CONFIG, summary_table, update_summary_table
+from excel_to_duckdb_resources import set_profile
+from excel_to_duckdb_lookup import WAYBILL_INDEX_PATH, drop_waybill_index, create_waybill_index, refresh_waybill_index
 
 # JSON文件路径
 json_file = 'json数据/file.json'
 
-# 读取JSON文件获取月结卡号信息
-try:
-    with open(json_file, 'r', encoding='utf-8') as f:
-        month_id_dict = json.load(f)
-    print(f"成功读取JSON文件，包含 {len(month_id_dict)} 个月结卡号")
-    print(f"JSON中的月结卡号: {list(month_id_dict.keys())}")
-except FileNotFoundError:
-    print(f"错误: 找不到JSON文件 {json_file}")
-    exit()
-except json.JSONDecodeError:
-    print(f"错误: JSON文件格式不正确")
-    exit()
-
 db_dir = "duckdb_output"
 tablie_name = "sftable"  # 统一表名为sftable
 
-# 确保输出目录存在
-if not os.path.exists(db_dir):
-    os.makedirs(db_dir)
-    print(f"已创建目录: {db_dir}")
-
 # 获取系统账单目录
 system_bill_dir = './系统账单/'
 
-# 按月份卡号处理文件
-total_processed = 0
-for month_id, files in month_id_dict.items():
-    print(f"\n{'=' * 50}")
-    print(f"处理月结卡号: {month_id}")
-    print(f"{'=' * 50}")
+# 并行处理的进程数: 1 表示逐个月结卡号串行处理；各月结卡号写入各自的数据库文件，互不影响
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# 流水线: 每个月结卡号内由 PARSE_WORKERS 个解析线程提前读取后续文件 (calamine 解码时释放 GIL)，
+# 与当前文件写入 DuckDB 重叠 (最多提前解析 excel_to_duckdb_pipeline.PIPELINE_DEPTH 个文件)；单核机器上默认逐个文件串行
+PIPELINE = (os.cpu_count() or 1) > 1
+
+# 类型推断: 从该月结卡号的所有文件中抽样推断每列的 DuckDB 类型并批量转换，
+# 无法转换的单元格置为 NULL 并记录到 sftable_rejects；False 时沿用全部转为字符串的旧逻辑
+# (批量转换依赖 pandas，没有安装 pandas 时同样全部存为字符串)
+TYPED_SCHEMA = True
+
+# 列别名: 不同文件中同一列的不同写法统一为标准列名，各文件的列按名称对齐 (缺少的列为 NULL)
+COLUMN_ALIASES = {
+    '运单号': '运单号码',
+    '运单编号': '运单号码',
+}
+# 识别表头的关键字: 标准列名和别名都算，表头使用别名 (如 '运单号') 的文件不会把上方的 '月结卡号' 等行误认为表头
+HEADER_KEYWORDS = tuple(dict.fromkeys(DEFAULT_HEADER_KEYWORDS + tuple(COLUMN_ALIASES) + tuple(COLUMN_ALIASES.values())))
+
+# 跨文件去重: 同一月结卡号的多个账单文件中 DEDUP_KEYS 相同的行只保留一行 (重开/更正的账单)，
+# 写入后在 DuckDB 中完成，去掉的行移入 sftable_duplicates；增量导入时只重新比较新文件中出现的键
+# (及保留行所在文件已变化/移除的键)，不重新导入未变化的文件；DEDUP_KEYS 为空时不去重
+# DEDUP_POLICY: 'first' 保留 JSON 中靠前的文件的行，'last' 保留靠后的文件的行，'latest_file' 保留修改时间最新的文件的行
+DEDUP_KEYS = ('运单号码',)
+DEDUP_POLICY = 'last'
+
+# 汇总表: 导入时按 (来源文件, SUMMARY_CONFIG['rollup_by'] 维度) 预先聚合写入 sftable_summary，
+# 只更新本次新增/变化/移除的文件对应的行；SF-2 透视只读取汇总表，不再扫描明细
+SUMMARY_TABLES = True
+
+# 增量模式: 清单 ({month_id}.manifest.json) 记录已导入文件的路径/大小/修改时间/内容哈希，
+# 未变化的文件跳过，新增文件追加，移除或变化的文件按 _source_file 删除后重新导入
+INCREMENTAL = True
+
+# 输出目标: 'duckdb' 写 duckdb_output/{month_id}.duckdb；'parquet' 写 zstd 压缩的 Parquet，
+# 按 hive 风格分区到 parquet_output/sftable/month_id=.../part-*.parquet，下游可只读取需要的分区
+OUTPUT_SINKS = ('duckdb',)
+
+# 合并库: 处理完成后把所有月结卡号数据库合并到 CATALOG_PATH 的同一张表 (附加 month_id 列并按其排序)，
+# 只重新载入本次有变化的月结卡号；跨月查询也可以不建合并库，用 excel_to_duckdb_catalog.open_union
+CONSOLIDATE = False
+
+# 运单索引: 各月结卡号数据库的明细表在运单号码列上建 ART 索引 (每次写入后重建)，处理完成后更新全局运单表
+# WAYBILL_INDEX_PATH (运单号 -> 月结卡号/账单文件)，供 excel2duckdb.py search 按运单号查找
+WAYBILL_INDEX = True
+
+# DuckDB 资源预设 (excel_to_duckdb_resources.PROFILES，如 'shared' / 'low_memory')，作用于所有连接，None 时为默认预设。
+# memory_limit 按进程计算，MAX_WORKERS 个进程同时导入时总内存约为其 MAX_WORKERS 倍；超出上限的部分溢出到临时目录
+RESOURCE_PROFILE = None
+
+
+def process_month_id(month_id, files, log=print, run_id=None):
+    """
+    处理一个月结卡号: 读取其所有 Excel 文件并写入 duckdb_output/{month_id}.duckdb
+    :param month_id: 月结卡号
+    :param files: 该月结卡号对应的文件名列表
+    :param log: 日志输出函数
+    :param run_id: 指标记录的运行标识 (同一次运行的各月结卡号相同)
+    :return: 处理结果汇总 dict (status 为 ok / unchanged / skipped / error)，
+             metrics 为分阶段指标记录，由主进程统一输出
+    """
+    metrics = StageMetrics('sf1', month_id, run_id)
+    summary = _process_month_id(month_id, files, log, metrics)
+    summary['metrics'] = metrics.records(summary['status'], summary['rows'],
+                                         [summary['db_path']] if summary['db_path'] else [])
+    return summary
+
+
+def _process_month_id(month_id, files, log, metrics):
+    summary = {'month_id': month_id, 'status': 'skipped', 'files': 0, 'rows': 0,
+               'db_path': None, 'seconds': 0.0, 'error': None}
+    t_start = time.time()
+
+    log(f"\n{'=' * 50}")
+    log(f"处理月结卡号: {month_id}")
+    log(f"{'=' * 50}")
 
     # 为该月结卡号创建单独的数据库文件
     db_path = os.path.join(db_dir, f"{month_id}.duckdb")
@@ -49,133 +116,458 @@ for month_id, files in month_id_dict.items():
             file_path = os.path.join(system_bill_dir, file_name)
             if os.path.exists(file_path):
                 excel_files.append(file_path)
-                print(f"找到Excel文件: {file_name}")
+                log(f"找到Excel文件: {file_name}")
             else:
-                print(f"警告: 文件不存在 {file_path}")
+                log(f"警告: 文件不存在 {file_path}")
 
     if not excel_files:
-        print(f"月结卡号 {month_id} 没有找到任何Excel文件，跳过")
-        continue
+        log(f"月结卡号 {month_id} 没有找到任何Excel文件，跳过")
+        return summary
 
-    print(f"月结卡号 {month_id} 共有 {len(excel_files)} 个Excel文件")
+    log(f"月结卡号 {month_id} 共有 {len(excel_files)} 个Excel文件")
+    summary['files'] = len(excel_files)
 
     try:
-        # 连接到该月结卡号对应的数据库文件
-        con = duckdb.connect(db_path)
-
-        all_data = []
-        headers = None
-
-        # 遍历处理当前月结卡号的所有Excel文件
-        for excel_file in excel_files:
-            print(f"  正在处理文件: {os.path.basename(excel_file)}")
-
-            # 使用 calamine 读取 Excel
-            with open(excel_file, 'rb') as f_r:
-                xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
-                # 获取第一个工作表
-                sheet_data = xls.get_sheet_by_index(0).to_python()
-
-            if not sheet_data:
-                print(f"  警告: Excel文件为空！")
-                continue
-
-            # 获取列名 (第一行是表头)
-            current_headers = [str(h) for h in sheet_data[0]]
-
-            # 检查表头是否一致
-            if headers is None:
-                headers = current_headers
-            elif headers != current_headers:
-                print(f"  警告: 文件表头与其他文件不一致")
-                print(f"    期望表头: {headers}")
-                print(f"    实际表头: {current_headers}")
-                # 可以选择跳过或尝试适配，这里选择跳过
-                continue
-
-            # 获取数据行
-            rows = sheet_data[1:]
-            all_data.extend(rows)
-
-            print(f"  从该文件读取了 {len(rows)} 行数据")
-
-        if not all_data:
-            print(f"月结卡号 {month_id} 没有读取到任何数据，跳过")
-            con.close()
-            continue
-
-        print(f"\n月结卡号 {month_id} 总共读取了 {len(all_data)} 行数据")
-        print(f"表头: {headers}")
+        # 连接到该月结卡号对应的数据库文件 (只输出 Parquet 时使用内存库中转)
+        con = open_staging(db_path, OUTPUT_SINKS)
+        use_manifest = INCREMENTAL and 'duckdb' in OUTPUT_SINKS
+
+        # 增量模式: 对比清单中的文件指纹，只读取新增/变化的文件，删除已移除文件的数据
+        file_keys = {os.path.basename(p): p for p in excel_files}
+        with metrics.stage('plan'):
+            existing_columns = _table_columns(con, tablie_name)
+            manifest = {}
+            if use_manifest and SOURCE_COLUMN in existing_columns:
+                manifest = load_manifest(db_path)
+            incremental = bool(manifest)
+            if use_manifest:
+                unchanged, changed, added, removed, fingerprints = plan_changes(manifest, file_keys)
+            else:
+                unchanged, changed, added, removed, fingerprints = [], [], list(file_keys), [], {}
+        if incremental:
+            log(f"  增量更新: 未变化 {len(unchanged)} 个，变化 {len(changed)} 个，"
+                f"新增 {len(added)} 个，移除 {len(removed)} 个")
+            if not (changed or added or removed):
+                log(f"月结卡号 {month_id} 的文件均未变化，跳过")
+                con.close()
+                summary['status'] = 'unchanged'
+                return summary
+            to_load = changed + added
+        if not incremental:
+            to_load = list(file_keys)
+
+        # 表中各列的类型 (不含 _source_file)；增量追加时从已有表开始，列的并集随文件逐个扩展
+        table_types = {c: t for c, t in existing_columns.items() if c != SOURCE_COLUMN} if incremental else {}
+        # 本次新建且目前只有 NULL 的列，后续文件有值时直接采用其推断类型
+        untyped = set()
+        created = incremental
+        loaded = {}
+        schema_report = []
 
         t1 = time.time()
 
-        # 将数据写入 DuckDB 文件
+        # 删除与逐个文件的追加在同一事务中完成；每个文件读取后立即写入并释放，不缓存所有文件的数据
+        con.begin()
         try:
-            import pandas as pd
-            import numpy as np
-
-            # 消除 FutureWarning
-            pd.set_option('future.no_silent_downcasting', True)
-
-            df = pd.DataFrame(all_data, columns=headers)
-            
-            # 解决 "Type DOUBLE does not match with TIMESTAMP" 等类型不匹配问题
-            # 将所有数据强制转换为字符串，并处理空值
-            # 这样 DuckDB 会将所有列作为 VARCHAR 导入，保证数据完整性
-            print("  正在统一数据类型为字符串，以避免DuckDB类型冲突...")
-            for col in df.columns:
-                # 先转为字符串
-                df[col] = df[col].astype(str)
-                # 清理 pandas 转换产生的 'nan', 'None' 字符串以及空字符串
-                df[col] = df[col].replace({'nan': None, 'None': None, 'NaT': None, '': None})
-
-            # 将 DataFrame 写入 DuckDB 表 'sftable'
-            con.execute(f"CREATE OR REPLACE TABLE {tablie_name} AS SELECT * FROM df")
-            print(f"表 '{tablie_name}' 已通过 Pandas 桥接创建成功。")
-
-        except ImportError:
-            # 如果没有 Pandas，回退到原生 SQL 插入
-            print("未找到 Pandas。正在使用原生 SQL (所有列均视为 VARCHAR)...")
-
-            # 创建表，所有列都设为 VARCHAR
-            cols_def = ", ".join([f'"{h}" VARCHAR' for h in headers])
-            create_sql = f"CREATE OR REPLACE TABLE {tablie_name} ({cols_def})"
-            con.execute(create_sql)
-
-            # 插入数据
-            placeholders = ', '.join(['?'] * len(headers))
-            insert_sql = f"INSERT INTO {tablie_name} VALUES ({placeholders})"
-
-            # 转换数据为字符串，避免类型转换错误
-            safe_rows = [[str(cell) if cell is not None else None for cell in row] for row in all_data]
-            con.executemany(insert_sql, safe_rows)
+            # 运单索引随写入和删除增量维护，只有需要放宽列类型时 (有索引的表不能修改列类型) 才删除，
+            # 写入完成后在同一事务中重建；整表重建时 CREATE OR REPLACE 会一并删除索引
+            max_rowid = None
+            if incremental:
+                # DuckDB 不允许在同一事务中先删除行再修改表结构 (提交时报错)，
+                # 因此旧数据在写入新数据之后再删除，用写入前的最大 rowid 区分新旧行
+                max_rowid = con.execute(f"SELECT COALESCE(MAX(rowid), -1) FROM {tablie_name}").fetchone()[0]
+                if _table_columns(con, f"{tablie_name}_rejects").get(SOURCE_COLUMN):
+                    with metrics.stage('delete'):
+                        delete_source_rows(con, f"{tablie_name}_rejects", changed + removed)
+
+            # 遍历处理当前月结卡号的所有Excel文件: 读取和清理可以在解析线程中提前进行，
+            # 写入始终在当前线程按文件顺序进行 (唯一使用该连接的线程)
+            def parse(key):
+                return _read_file(file_keys[key], metrics)
+
+            if PIPELINE and len(to_load) > 1:
+                parsed_files = timed_chunks(parse_ahead(parse, to_load, PARSE_WORKERS), metrics, 'wait', count=False)
+            else:
+                parsed_files = ((key, parse(key)) for key in to_load)
+            for key, (header_row, rows) in parsed_files:
+                log(f"  正在处理文件: {key}")
+                if header_row is None:
+                    log(f"  警告: Excel文件为空！")
+                    continue
+
+                # 表头按列名对齐 (别名统一为标准列名)，不同文件的列取并集，文件中缺少的列为 NULL
+                with metrics.stage('schema'):
+                    headers, renamed = reconcile_headers(header_row, COLUMN_ALIASES)
+                    types, report = _reconcile_file_schema(con, headers, rows, table_types, untyped, created)
+                report.update(file=key, rows=len(rows), renamed=renamed)
+                schema_report.append(report)
+                _log_schema_report(report, log)
+
+                with metrics.stage('write', rows=len(rows)):
+                    _write_file_rows(con, key, rows, headers, types if _typed_schema() else None,
+                                     create=not created, log=log)
+                created = True
+                loaded[key] = len(rows)
+                log(f"  从该文件读取了 {len(rows)} 行数据")
+                del rows
+
+            if incremental:
+                with metrics.stage('delete'):
+                    delete_source_rows(con, tablie_name, changed + removed, max_rowid)
+
+            duplicates = 0
+            # 去重改变了行的未变化文件，其汇总需要随本次写入的文件一起更新
+            dedup_affected = []
+            if DEDUP_KEYS and (loaded or incremental):
+                missing_keys = [k for k in DEDUP_KEYS if k not in table_types]
+                if missing_keys:
+                    log(f"  警告: 表中没有去重键列 {missing_keys}，跳过去重")
+                else:
+                    with metrics.stage('dedup'):
+                        if not fingerprints:
+                            fingerprints = {key: {'mtime': os.path.getmtime(path)} for key, path in file_keys.items()}
+                        # 表中现有行的来源文件 (增量时含未变化的文件)
+                        present = [key for key in file_keys if key in loaded or (incremental and key in unchanged)]
+                        order = file_priority(fingerprints, present, DEDUP_POLICY)
+                        if incremental:
+                            duplicates, dedup_affected = dedup_incremental(con, tablie_name, DEDUP_KEYS, DEDUP_POLICY,
+                                                                           order, loaded, changed + removed)
+                        else:
+                            duplicates = dedup_table(con, tablie_name, DEDUP_KEYS, DEDUP_POLICY, order)
+                    if duplicates:
+                        log(f"  去重: 按 {list(DEDUP_KEYS)} 去掉 {duplicates} 行重复数据 (策略 {DEDUP_POLICY})，"
+                            f"详见表 '{tablie_name}{DUPLICATES_SUFFIX}'")
+
+            if SUMMARY_TABLES and (loaded or incremental):
+                config = dict(SUMMARY_CONFIG, table=tablie_name)
+                if config.get('key_column') and config['key_column'] not in table_types:
+                    log(f"  警告: 表中没有列 '{config['key_column']}'，汇总时不按该列过滤有效行")
+                with metrics.stage('summarize'):
+                    rebuilt = update_summary_table(con, config, list(loaded) + dedup_affected if incremental else None,
+                                                   changed + removed)
+                log(f"  汇总表 '{summary_table(config)}' 已{'重建' if rebuilt else '更新'}")
+
+            if WAYBILL_INDEX:
+                with metrics.stage('index'):
+                    create_waybill_index(con, tablie_name)
+        except BaseException:
+            con.rollback()
+            raise
+        if not loaded and not (incremental and (changed or removed)):
+            con.rollback()
+            log(f"月结卡号 {month_id} 没有读取到任何数据，跳过")
+            con.close()
+            return summary
+        with metrics.stage('commit'):
+            con.commit()
+
+        log(f"\n月结卡号 {month_id} 本次读取了 {sum(loaded.values())} 行数据")
+        log(f"表头: {list(table_types)}")
+        if _typed_schema():
+            log(f"  列类型: {table_types}")
+        summary['schema'] = schema_report
+        summary['duplicates'] = duplicates
 
         t2 = time.time()
-        print(f"数据导入耗时 {t2 - t1:.2f} 秒。")
+        log(f"数据导入耗时 {t2 - t1:.2f} 秒。")
 
         # 验证数据
         result = con.execute(f"SELECT COUNT(*) FROM {tablie_name}").fetchone()
-        print(f"表 '{tablie_name}' 共有 {result[0]} 行数据")
+        log(f"表 '{tablie_name}' 共有 {result[0]} 行数据")
+
+        if 'parquet' in OUTPUT_SINKS:
+            with metrics.stage('export'):
+                parquet_path = export_parquet(con, tablie_name, os.path.join(PARQUET_DIR, tablie_name),
+                                              partition={'month_id': month_id})
+            log(f"已导出 Parquet 分区: {os.path.abspath(parquet_path)}")
 
         # 关闭连接
         con.close()
 
-        print(f"成功保存: {os.path.abspath(db_path)}")
-        total_processed += 1
+        # 更新清单: 保留未变化文件的记录，写入本次导入文件的指纹
+        if use_manifest:
+            with metrics.stage('manifest'):
+                files = {key: manifest[key] for key in unchanged}
+                for key, row_count in loaded.items():
+                    files[key] = dict(fingerprints[key], table=tablie_name, rows=row_count)
+                save_manifest(db_path, files)
+
+        if 'duckdb' in OUTPUT_SINKS:
+            log(f"成功保存: {os.path.abspath(db_path)}")
+        summary.update(status='ok', rows=result[0], db_path=db_path)
 
     except Exception as e:
-        print(f"处理月结卡号 {month_id} 时出错: {e}")
-        continue
-
-print(f"\n{'=' * 50}")
-print(f"处理完成！")
-print(f"总共处理了 {total_processed} 个月结卡号的数据库文件")
-print(f"数据库文件保存在: {os.path.abspath(db_dir)}")
-
-# 列出所有生成的数据库文件
-print(f"\n生成的数据库文件:")
-for file in os.listdir(db_dir):
-    if file.endswith('.duckdb'):
-        file_path = os.path.join(db_dir, file)
-        size = os.path.getsize(file_path) / (1024 * 1024)  # 转换为MB
-        print(f"  {file} ({size:.2f} MB)")
\ No newline at end of file
+        log(f"处理月结卡号 {month_id} 时出错: {e}")
+        summary.update(status='error', error=str(e))
+
+    summary['seconds'] = time.time() - t_start
+    return summary
+
+
+def _read_file(excel_file, metrics):
+    """
+    读取一个账单文件的第一个工作表，识别表头行 (跳过账单标题行)，过滤 "合 计" 等合计行和空行
+    可在解析线程中执行 (不使用 DuckDB 连接)
+    :return: (表头行, 数据行列表)；文件为空时表头为 None
+    """
+    # 使用 calamine 读取 Excel
+    with metrics.stage('read'):
+        with open(excel_file, 'rb') as f_r:
+            xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
+            # 获取第一个工作表
+            sheet_data = xls.get_sheet_by_index(0).to_python()
+    with metrics.stage('clean'):
+        return split_sheet(sheet_data, HEADER_KEYWORDS)
+
+
+def _table_columns(con, table_name):
+    """返回表的 {列名: 类型}，表不存在时返回空 dict"""
+    try:
+        return {r[0]: r[1] for r in con.execute(f"DESCRIBE {table_name}").fetchall()}
+    except duckdb.CatalogException:
+        return {}
+
+
+def _typed_schema():
+    """
+    是否按推断类型写入: 需要 TYPED_SCHEMA 为 True 且能导入 pandas
+    没有 pandas 时列式写入把所有列存为 VARCHAR，推断和记录的列类型也必须是 VARCHAR，
+    否则 table_types 与表的实际类型不一致，后续的新增列/放宽类型会基于错误的类型
+    """
+    if not TYPED_SCHEMA:
+        return False
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _reconcile_file_schema(con, headers, rows, table_types, untyped, created):
+    """
+    将一个文件的列与表的列按名称合并: 表中没有的列新增，同名列类型不一致时放宽表的列类型
+    :param table_types: 表的 {列名: 类型}，原地更新
+    :param untyped: 目前只有 NULL 的列名集合，原地更新
+    :param created: 表是否已存在 (False 时由本文件建表)
+    :return: (本文件各列写入时使用的类型, 结构报告 dict)
+    """
+    sample = sample_rows(rows)
+    if _typed_schema():
+        file_types = infer_schema(headers, sample)
+    else:
+        file_types = ['VARCHAR'] * len(headers)
+    columns = list(zip(*sample)) if sample else []
+    has_data = [i < len(columns) and has_values(columns[i]) for i in range(len(headers))]
+
+    report = {'missing': [c for c in table_types if c not in headers],
+              'added': [h for h in headers if created and h not in table_types],
+              'widened': {}}
+    for i, (header, file_type) in enumerate(zip(headers, file_types)):
+        current = table_types.get(header)
+        if current is None:
+            if created:
+                con.execute(f'ALTER TABLE {tablie_name} ADD COLUMN "{header}" {file_type}')
+            table_types[header] = file_type
+            if not has_data[i]:
+                untyped.add(header)
+        elif has_data[i] and file_type != current:
+            target = file_type if header in untyped else merge_column_type(current, file_type)
+            if target != current:
+                drop_waybill_index(con, tablie_name)
+                table_types[header] = widen_column(con, tablie_name, header, current, target)
+                report['widened'][header] = f"{current} -> {table_types[header]}"
+        if has_data[i]:
+            untyped.discard(header)
+    return [table_types[h] for h in headers], report
+
+
+def _log_schema_report(report, log=print):
+    """输出单个文件的列结构差异"""
+    parts = []
+    if report['renamed']:
+        parts.append(f"重命名 {report['renamed']}")
+    if report['missing']:
+        parts.append(f"缺少列 {report['missing']} (填充 NULL)")
+    if report['added']:
+        parts.append(f"新增列 {report['added']}")
+    if report['widened']:
+        parts.append(f"放宽类型 {report['widened']}")
+    if parts:
+        log(f"  列结构: " + "，".join(parts))
+
+
+def _write_file_rows(con, source, rows, headers, types, create, log=print):
+    """
+    将一个文件的数据行写入 sftable，并在 _source_file 列记录来源文件
+    :param types: 各列类型；为 None 时沿用全部存为 VARCHAR 的旧逻辑
+    :param create: True 时重建表，否则追加
+    """
+    literal = "'" + source.replace("'", "''") + "'"
+    try:
+        import pandas as pd
+        import numpy as np
+
+        # 消除 FutureWarning
+        pd.set_option('future.no_silent_downcasting', True)
+
+        if types is not None:
+            # 解决 "Type DOUBLE does not match with TIMESTAMP" 等类型不匹配问题:
+            # 按抽样推断出的最宽兼容类型批量转换，而不是把所有列都存成 VARCHAR
+            _, reject_count = write_typed_table(con, tablie_name, headers, rows, types,
+                                                replace=create, source=source)
+            if reject_count:
+                log(f"  警告: {source} 中 {reject_count} 个单元格无法转换为推断类型，已置为 NULL，"
+                    f"详见表 '{tablie_name}_rejects'")
+            log(f"  {source} 已按推断类型写入表 '{tablie_name}'。")
+            return
+
+        df = pd.DataFrame(rows, columns=headers)
+
+        # 解决 "Type DOUBLE does not match with TIMESTAMP" 等类型不匹配问题
+        # 将所有数据强制转换为字符串，并处理空值
+        # 这样 DuckDB 会将所有列作为 VARCHAR 导入，保证数据完整性
+        log("  正在统一数据类型为字符串，以避免DuckDB类型冲突...")
+        for col in df.columns:
+            # 先转为字符串
+            df[col] = df[col].astype(str)
+            # 清理 pandas 转换产生的 'nan', 'None' 字符串以及空字符串
+            df[col] = df[col].replace({'nan': None, 'None': None, 'NaT': None, '': None})
+
+        # 将 DataFrame 写入 DuckDB 表 'sftable'
+        select_sql = f'SELECT *, CAST({literal} AS VARCHAR) AS "{SOURCE_COLUMN}" FROM df'
+        if create:
+            con.execute(f"CREATE OR REPLACE TABLE {tablie_name} AS {select_sql}")
+        else:
+            con.execute(f"INSERT INTO {tablie_name} BY NAME {select_sql}")
+        log(f"  {source} 已通过 Pandas 桥接写入表 '{tablie_name}'。")
+
+    except ImportError:
+        # 如果没有 Pandas，回退到列式批量写入 (所有列均视为 VARCHAR)，整批交给 DuckDB 而不是逐行 executemany
+        from excel_to_duckdb_columnar import bulk_insert
+
+        log("未找到 Pandas。正在使用列式批量写入 (所有列均视为 VARCHAR)...")
+        bulk_insert(con, tablie_name, headers, rows, create=create, all_varchar=True,
+                    extra_columns={SOURCE_COLUMN: source})
+
+
+def _process_month_id_buffered(month_id, files, run_id=None):
+    """子进程入口: 缓存日志并随结果一起返回，由主进程按月结卡号顺序输出，保证输出确定"""
+    lines = []
+    try:
+        summary = process_month_id(month_id, files, log=lines.append, run_id=run_id)
+    except Exception as e:
+        summary = {'month_id': month_id, 'status': 'error', 'files': 0, 'rows': 0,
+                   'db_path': None, 'seconds': 0.0, 'error': str(e)}
+    return summary, lines
+
+
+def _failed_result(month_id, error):
+    """子进程异常退出 (崩溃、被系统终止) 时该月结卡号的处理结果和日志"""
+    summary = {'month_id': month_id, 'status': 'error', 'files': 0, 'rows': 0,
+               'db_path': None, 'seconds': 0.0, 'error': str(error)}
+    return summary, [f"处理月结卡号 {month_id} 时出错: {error}"]
+
+
+def _process_month_id_isolated(month_id, files, run_id=None):
+    """在单独的子进程中处理一个月结卡号，该进程崩溃只影响这一个月结卡号"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(_process_month_id_buffered, month_id, files, run_id).result()
+        except Exception as e:
+            return _failed_result(month_id, e)
+
+
+def process_all(month_id_dict, max_workers=MAX_WORKERS):
+    """
+    处理所有月结卡号，max_workers > 1 时使用进程池并行处理
+    :return: 按 JSON 中月结卡号顺序排列的处理结果列表
+    """
+    run_id = new_run_id()
+    if max_workers <= 1 or len(month_id_dict) <= 1:
+        return [process_month_id(month_id, files, run_id=run_id) for month_id, files in month_id_dict.items()]
+
+    print(f"使用 {max_workers} 个进程并行处理 {len(month_id_dict)} 个月结卡号...")
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(month_id, executor.submit(_process_month_id_buffered, month_id, files, run_id))
+                   for month_id, files in month_id_dict.items()]
+        # 按提交顺序收集结果。任一子进程崩溃时进程池失效，所有未完成的任务都以 BrokenProcessPool 结束，
+        # 无法区分是哪个月结卡号导致的: 这些月结卡号逐个在单独的子进程中重新处理 (未提交的事务不会写入数据库)，
+        # 只有确实导致崩溃的月结卡号记为失败
+        for month_id, future in futures:
+            try:
+                summary, lines = future.result()
+            except BrokenProcessPool:
+                summary, lines = _process_month_id_isolated(month_id, month_id_dict[month_id], run_id)
+            except Exception as e:
+                summary, lines = _failed_result(month_id, e)
+            for line in lines:
+                print(line)
+            summaries.append(summary)
+    return summaries
+
+
+def print_summary(summaries):
+    """输出所有月结卡号的合并汇总"""
+    ok = [s for s in summaries if s['status'] == 'ok']
+    failed = [s for s in summaries if s['status'] == 'error']
+    skipped = [s for s in summaries if s['status'] == 'skipped']
+    unchanged = [s for s in summaries if s['status'] == 'unchanged']
+
+    print(f"\n{'=' * 50}")
+    print(f"处理完成！")
+    print(f"总共处理了 {len(ok)} 个月结卡号的数据库文件")
+    print(f"未变化 {len(unchanged)} 个，跳过 {len(skipped)} 个，失败 {len(failed)} 个，共写入 {sum(s['rows'] for s in ok)} 行")
+    duplicates = sum(s.get('duplicates', 0) for s in ok)
+    if duplicates:
+        print(f"跨文件去重共去掉 {duplicates} 行重复数据")
+    for s in failed:
+        print(f"  失败: {s['month_id']} -> {s['error']}")
+    print(f"数据库文件保存在: {os.path.abspath(db_dir)}")
+
+    # 列出所有生成的数据库文件
+    print(f"\n生成的数据库文件:")
+    for file in sorted(os.listdir(db_dir)):
+        if file.endswith('.duckdb'):
+            file_path = os.path.join(db_dir, file)
+            size = os.path.getsize(file_path) / (1024 * 1024)  # 转换为MB
+            print(f"  {file} ({size:.2f} MB)")
+
+
+if __name__ == "__main__":
+    # 读取JSON文件获取月结卡号信息
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            month_id_dict = json.load(f)
+        print(f"成功读取JSON文件，包含 {len(month_id_dict)} 个月结卡号")
+        print(f"JSON中的月结卡号: {list(month_id_dict.keys())}")
+    except FileNotFoundError:
+        print(f"错误: 找不到JSON文件 {json_file}")
+        exit()
+    except json.JSONDecodeError:
+        print(f"错误: JSON文件格式不正确")
+        exit()
+
+    # 确保输出目录存在
+    if not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+        print(f"已创建目录: {db_dir}")
+
+    if RESOURCE_PROFILE:
+        set_profile(RESOURCE_PROFILE)
+
+    # 按月份卡号处理文件
+    summaries = process_all(month_id_dict)
+    print_summary(summaries)
+    # 分阶段指标由主进程统一输出 (子进程只随结果返回记录)
+    emit_metrics([record for s in summaries for record in s.get('metrics', [])])
+
+    if CONSOLIDATE and 'duckdb' in OUTPUT_SINKS:
+        changed = [s['month_id'] for s in summaries if s['status'] == 'ok']
+        total = refresh_catalog(month_databases(db_dir), CATALOG_PATH, tablie_name, changed=changed)
+        print(f"合并库已更新: {os.path.abspath(CATALOG_PATH)} (共 {total} 行)")
+
+    if WAYBILL_INDEX and 'duckdb' in OUTPUT_SINKS:
+        changed = [s['month_id'] for s in summaries if s['status'] == 'ok']
+        total = refresh_waybill_index(month_databases(db_dir), WAYBILL_INDEX_PATH, tablie_name, changed=changed)
+        print(f"运单索引已更新: {os.path.abspath(WAYBILL_INDEX_PATH)} (共 {total} 条)")
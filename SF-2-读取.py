@@ -7,61 +7,50 @@
 @Date    ：2026/2/28 10:16 
 '''
 
+import decimal
 import os
-import time
-import duckdb
+import multiprocessing
 import openpyxl
-
-table_name = 'sftable'
+from excel_to_duckdb_summary import SUMMARY_CONFIG, summary_headers, summarize_months
+from excel_to_duckdb_catalog import month_databases
+from excel_to_duckdb_metrics import StageMetrics, emit as emit_metrics
+from excel_to_duckdb_export import EXPORT_WORKERS, export_months
+
+db_dir = "duckdb_output"
+# True: ATTACH 所有月结卡号数据库并建立合并视图，按 month_id 分组一次扫描完成汇总；
+# False: 以只读方式打开各数据库，由线程池并行分别汇总 (excel_to_duckdb_pool.fan_out)
+USE_UNION_VIEW = True
+# True: 读取导入时维护的汇总表 (sftable_summary)，耗时与明细行数无关；
+# 汇总表缺失或与当前配置不一致 (如修改了 measures 后尚未重新导入) 时自动改为扫描明细表
+USE_SUMMARY_TABLES = True
+# True: 同时把各月结卡号的明细导出到 透视结果/明细/{月结卡号}.xlsx (超过 1048576 行时自动拆分工作表)
+EXPORT_DETAILS = False
+
+headers = summary_headers(SUMMARY_CONFIG)
 wb = openpyxl.Workbook()
 ws = wb.active
-ws.append(['月结卡号', '总单量', '总计费重量', '总应付金额'])
-for db_name in os.listdir("duckdb_output"):
-    con = duckdb.connect(f'duckdb_output/{db_name}')
-    print(f"加载数据库 {db_name} ing")
-    # con.sql("SELECT * FROM excel_data LIMIT 100").show()
-    # 方法 1: 使用 fetchall() 一次性获取所有行 (适合小数据量)
-
-    # 显示所有表
-    tables = con.execute("SHOW TABLES").fetchall()
-    print(f"所有表: {tables}")
-
-    t1 = time.time()
-    cursor = con.execute(f"SELECT * FROM '{table_name}' LIMIT 0")
-    column_names = [desc[0] for desc in cursor.description]
+ws.append(['月结卡号'] + headers)
 
-    运单号码_index = column_names.index('运单号码')
-    计费重量_index = column_names.index('计费重量')
-    应付金额_index = column_names.index('应付金额')
 
-    print(f"列名列表: {column_names}")
-    rows =con.sql(f"SELECT * FROM '{table_name}'").fetchall()
+def print_row(row):
+    print(', '.join(f'{name}: {value:.2f}' if isinstance(value, (float, decimal.Decimal)) else f'{name}: {value}'
+                    for name, value in zip(headers, row)))
 
-    t2 = time.time()
-    print(f"加载数据库 {db_name} 中表 sftable，耗时{t2-t1:.2f}s")
-    总单量 = 0
-    总计费重量 = 0
-    总应付金额 = 0
-    for num, row in enumerate(rows):
-        if '合 计' in row:
-            continue
 
-        if row[运单号码_index]:
-            总单量 += 1
-            总计费重量 += float(row[计费重量_index])
-            总应付金额 += float(row[应付金额_index])
-    print(f'总单量: {总单量}', f'总计费重量: {总计费重量:.2f}', f'总应付金额: {总应付金额:.2f}') ,
-    ws.append([db_name.split('.')[0], 总单量, 总计费重量, 总应付金额])
+metrics = StageMetrics('sf2', db_dir)
+for month_id, row in summarize_months(month_databases(db_dir), SUMMARY_CONFIG, USE_UNION_VIEW,
+                                      USE_SUMMARY_TABLES, metrics):
+    print_row(row)
+    ws.append([month_id, *row])
 
 os.makedirs('透视结果', exist_ok=True)
-wb.save('透视结果/透视汇总.xlsx')
-# 方法 2 (更推荐): 使用 fetchone() 逐行获取 (内存友好)
-# result = con.sql("SELECT * FROM excel_data")
-# num = 0
-# while True:
-#     row = result.fetchone()
-#     if not row:
-#         break
-#     # print(num, row)
-#     print(num)
-#     num += 1
+with metrics.stage('save', rows=ws.max_row - 1):
+    wb.save('透视结果/透视汇总.xlsx')
+if EXPORT_DETAILS:
+    # 本脚本没有 __main__ 保护，只有 fork 方式可用时才多进程导出
+    workers = EXPORT_WORKERS if 'fork' in multiprocessing.get_all_start_methods() else 1
+    with metrics.stage('export'):
+        exported = export_months(month_databases(db_dir), '透视结果/明细', workers=workers)
+    metrics.set_rows('export', sum(rows for _, rows in exported.values()))
+print(f"分阶段耗时: {metrics.breakdown()}")
+emit_metrics(metrics.records('ok', ws.max_row - 1, ['透视结果/透视汇总.xlsx']))
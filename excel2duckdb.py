@@ -0,0 +1,448 @@
+"""
+excel2duckdb 命令行入口
+
+把各个脚本的功能统一为子命令，路径和选项由参数指定，不再修改脚本中的常量:
+    python excel2duckdb.py ingest 账单/*.xlsx --db-dir duckdb_output
+    python excel2duckdb.py ingest --bills json数据/file.json --bill-dir 系统账单 --db-dir duckdb_output
+    python excel2duckdb.py preview large_test.xlsx --rows 20
+    python excel2duckdb.py query "SELECT COUNT(*) FROM sftable" --db duckdb_output/xxx.duckdb
+    python excel2duckdb.py query "SELECT month_id, COUNT(*) FROM all_months GROUP BY 1" --db-dir duckdb_output
+    python excel2duckdb.py pivot --db-dir duckdb_output --output 透视结果/透视汇总.xlsx
+    python excel2duckdb.py export --db-dir duckdb_output --output 导出/明细 --workers 4
+    python excel2duckdb.py search SF1234567890 SF1234567891 --details
+    python excel2duckdb.py search --file 运单列表.txt --format csv
+    python excel2duckdb.py bench --rows 100000 --engines streaming
+    python excel2duckdb.py --profile low_memory --temp-dir /data/spill ingest 账单/*.xlsx
+
+启动速度: 本模块顶层只导入标准库中的轻量模块，duckdb / calamine / pandas / openpyxl 等在子命令真正需要时才导入，
+--help 和 preview (.xlsx) 不导入 duckdb 和 pandas，适合被调度程序频繁调用
+"""
+import argparse
+import os
+import sys
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.xlsb', '.ods')
+# query 每批取回的行数
+QUERY_BATCH_SIZE = 10000
+
+
+def _excel_files(paths):
+    """展开命令行给出的文件和目录 (目录递归查找 Excel 文件)，保持顺序并去重"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                              if name.lower().endswith(EXCEL_EXTENSIONS) and not name.startswith('~$'))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def _row_writer(headers, fmt, out=None):
+    """
+    结果行输出: table (制表符分隔) / csv / json (每行一个对象)；表头立即输出
+    :return: write(rows) 函数，可以分批多次调用
+    """
+    out = out or sys.stdout
+    if fmt == 'json':
+        import json
+
+        def write(rows):
+            for row in rows:
+                out.write(json.dumps(dict(zip(headers, row)), ensure_ascii=False, default=str) + '\n')
+        return write
+
+    import csv
+
+    writer = csv.writer(out, delimiter='\t' if fmt == 'table' else ',', lineterminator='\n')
+    writer.writerow(headers)
+
+    def write(rows):
+        writer.writerows(['' if v is None else v for v in row] for row in rows)
+    return write
+
+
+def _print_rows(headers, rows, fmt, out=None):
+    _row_writer(headers, fmt, out)(rows)
+
+
+def cmd_ingest(args):
+    if args.bills:
+        return _ingest_bills(args)
+    if not args.paths:
+        print("错误: 请指定 Excel 文件或目录，或使用 --bills 按月结卡号导入", file=sys.stderr)
+        return 2
+
+    from concurrent.futures import ThreadPoolExecutor
+    from excel_to_duckdb_processor import (save_excel_to_duckdb_streaming, save_excel_sheets_to_duckdb,
+                                           safe_table_name)
+    from excel_to_duckdb_metrics import StageMetrics, new_run_id, emit as emit_metrics
+
+    files = _excel_files(args.paths)
+    run_id = new_run_id()
+    sinks = tuple(args.sinks)
+
+    def ingest(excel_path):
+        base_name = os.path.splitext(os.path.basename(excel_path))[0]
+        db_dir = args.db_dir or os.path.join(os.path.dirname(excel_path), "duckdb_output")
+        db_path = os.path.join(db_dir, f"{base_name}.duckdb")
+        table_name = args.table or safe_table_name(base_name)
+        parquet_dir = args.parquet_dir or os.path.join(os.path.dirname(excel_path), "parquet_output")
+        metrics = StageMetrics('cli', excel_path, run_id)
+        status, rows = 'error', None
+        try:
+            if args.sheets is not None:
+                counts = save_excel_sheets_to_duckdb(excel_path, db_path, table_name, args.sheets, args.sheet_mode,
+                                                     args.chunk_size, incremental=args.incremental, sinks=sinks,
+                                                     parquet_dir=parquet_dir, metrics=metrics)
+                rows = None if counts is None else sum(counts.values())
+            else:
+                rows = save_excel_to_duckdb_streaming(excel_path, db_path, table_name, args.chunk_size,
+                                                      incremental=args.incremental, sinks=sinks,
+                                                      parquet_dir=parquet_dir, metrics=metrics)
+            status = 'unchanged' if rows is None else 'ok'
+            if rows is None:
+                return f"跳过: {excel_path} 自上次导入后未变化"
+            return f"成功: {excel_path} -> {db_path} (表名: {table_name}，{rows} 行) [{metrics.breakdown()}]"
+        finally:
+            emit_metrics(metrics.records(status, rows, [db_path] if 'duckdb' in sinks else []))
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        futures = [(path, executor.submit(ingest, path)) for path in files]
+        for path, future in futures:
+            try:
+                print(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"失败: {path} -> {e}", file=sys.stderr)
+    print(f"共 {len(files)} 个文件，失败 {failed} 个")
+    return 1 if failed else 0
+
+
+def _ingest_bills(args):
+    """按月结卡号导入 (SF-1-账单转duckdb.py 的逻辑)，JSON 文件、账单目录和输出目录由参数指定"""
+    import importlib.util
+    import json
+    import multiprocessing
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SF-1-账单转duckdb.py')
+    spec = importlib.util.spec_from_file_location('sf1_bills', script)
+    sf1 = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = sf1
+    spec.loader.exec_module(sf1)
+
+    sf1.json_file = args.bills
+    sf1.system_bill_dir = args.bill_dir
+    sf1.db_dir = args.db_dir or sf1.db_dir
+    sf1.INCREMENTAL = args.incremental
+    sf1.OUTPUT_SINKS = tuple(args.sinks)
+    with open(args.bills, 'r', encoding='utf-8') as f:
+        month_id_dict = json.load(f)
+    os.makedirs(sf1.db_dir, exist_ok=True)
+
+    # 该脚本按文件路径加载，spawn/forkserver 启动的子进程无法按模块名导入它，只有 fork 时才能使用进程池
+    workers = args.workers if multiprocessing.get_start_method() == 'fork' else 1
+    summaries = sf1.process_all(month_id_dict, max_workers=workers)
+    sf1.print_summary(summaries)
+    sf1.emit_metrics([record for s in summaries for record in s.get('metrics', [])])
+    if args.consolidate and 'duckdb' in sf1.OUTPUT_SINKS:
+        changed = [s['month_id'] for s in summaries if s['status'] == 'ok']
+        total = sf1.refresh_catalog(sf1.month_databases(sf1.db_dir), sf1.CATALOG_PATH, sf1.tablie_name,
+                                    changed=changed)
+        print(f"合并库已更新: {os.path.abspath(sf1.CATALOG_PATH)} (共 {total} 行)")
+    if sf1.WAYBILL_INDEX and 'duckdb' in sf1.OUTPUT_SINKS:
+        changed = [s['month_id'] for s in summaries if s['status'] == 'ok']
+        total = sf1.refresh_waybill_index(sf1.month_databases(sf1.db_dir), sf1.WAYBILL_INDEX_PATH, sf1.tablie_name,
+                                          changed=changed)
+        print(f"运单索引已更新: {os.path.abspath(sf1.WAYBILL_INDEX_PATH)} (共 {total} 条)")
+    return 1 if any(s['status'] == 'error' for s in summaries) else 0
+
+
+def cmd_preview(args):
+    from excel_to_duckdb_preview import preview_workbook
+
+    sheet = int(args.sheet) if args.sheet is not None and args.sheet.isdigit() else args.sheet
+    info = preview_workbook(args.path, args.rows, sheet)
+    rows_text = "未知" if info['estimated_rows'] is None else (
+        f"{info['estimated_rows']}" if info['exact'] else f"约 {info['estimated_rows']}")
+    print(f"# 工作表: {', '.join(info['sheet_names'])} (当前: {info['sheet']})，数据行数: {rows_text}，"
+          f"耗时 {info['seconds'] * 1000:.0f} ms ({info['method']})", file=sys.stderr)
+    _print_rows(info['headers'], info['rows'], args.format)
+    return 0
+
+
+def cmd_query(args):
+    if bool(args.db) == bool(args.db_dir):
+        print("错误: 请指定 --db 或 --db-dir 其中之一", file=sys.stderr)
+        return 2
+    from excel_to_duckdb_resources import connect
+
+    if args.db:
+        con = connect(args.db, read_only=True)
+    else:
+        from excel_to_duckdb_catalog import open_union
+
+        # 各月结卡号数据库 ATTACH 后建立合并视图 all_months (附加 month_id 列)
+        con = open_union(args.db_dir, args.table)
+    try:
+        cursor = con.execute(args.sql)
+        write = _row_writer([d[0] for d in cursor.description or []], args.format)
+        # 分批取回并输出，结果集大小不影响内存占用
+        remaining = args.limit
+        while remaining is None or remaining > 0:
+            rows = cursor.fetchmany(QUERY_BATCH_SIZE if remaining is None else min(QUERY_BATCH_SIZE, remaining))
+            if not rows:
+                break
+            write(rows)
+            if remaining is not None:
+                remaining -= len(rows)
+    finally:
+        con.close()
+    return 0
+
+
+def cmd_pivot(args):
+    from excel_to_duckdb_catalog import month_databases
+    from excel_to_duckdb_summary import SUMMARY_CONFIG, summary_headers, summarize_months
+    from excel_to_duckdb_metrics import StageMetrics, emit as emit_metrics
+
+    config = dict(SUMMARY_CONFIG)
+    if args.table:
+        config['table'] = args.table
+    if args.group_by:
+        config['group_by'] = args.group_by
+    headers = ['月结卡号'] + summary_headers(config)
+    metrics = StageMetrics('cli', args.db_dir)
+    log = (lambda message: print(message, file=sys.stderr)) if args.verbose else (lambda message: None)
+    report = [[month_id, *row] for month_id, row in
+              summarize_months(month_databases(args.db_dir), config, not args.per_db, not args.scan, metrics, log)]
+
+    if args.output and args.output.lower().endswith('.xlsx'):
+        import openpyxl
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(headers)
+        for row in report:
+            ws.append(row)
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with metrics.stage('save', rows=len(report)):
+            wb.save(args.output)
+        print(f"已保存: {os.path.abspath(args.output)} ({len(report)} 行)", file=sys.stderr)
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8-sig', newline='') as f:
+            _print_rows(headers, report, 'csv', f)
+    else:
+        _print_rows(headers, report, args.format)
+    emit_metrics(metrics.records('ok', len(report), [args.output] if args.output else []))
+    return 0
+
+
+def cmd_export(args):
+    if bool(args.db) == bool(args.db_dir):
+        print("错误: 请指定 --db 或 --db-dir 其中之一", file=sys.stderr)
+        return 2
+    from excel_to_duckdb_export import export_query, export_months
+    from excel_to_duckdb_metrics import StageMetrics, emit as emit_metrics
+
+    metrics = StageMetrics('cli', args.db or args.db_dir)
+    log = lambda message: print(message, file=sys.stderr)
+    if args.db_dir and not args.sql:
+        # 每个月结卡号一个文件，可由多个进程并行导出
+        from excel_to_duckdb_catalog import month_databases
+
+        with metrics.stage('export'):
+            results = export_months(month_databases(args.db_dir), args.output, args.table, args.format,
+                                    where=args.where, split=args.split, max_rows=args.max_rows,
+                                    workers=args.workers, log=log)
+        metrics.set_rows('export', sum(rows for _, rows in results.values()))
+        files = [path for paths, _ in results.values() for path in paths]
+    else:
+        from excel_to_duckdb_reader import build_select_sql
+
+        if args.db:
+            con = args.db
+        else:
+            from excel_to_duckdb_catalog import open_union
+
+            # --sql 在合并视图 all_months 上执行 (附加 month_id 列)
+            con = open_union(args.db_dir, args.table)
+        sql = args.sql or build_select_sql(args.table, where=args.where)
+        on_rows = (lambda n: log(f"  已导出 {n} 行...")) if args.verbose else None
+        try:
+            with metrics.stage('export'):
+                files, rows = export_query(con, sql, args.output, split=args.split, max_rows=args.max_rows,
+                                           on_rows=on_rows)
+        finally:
+            if not isinstance(con, str):
+                con.close()
+        metrics.set_rows('export', rows)
+    for path in files:
+        print(os.path.abspath(path))
+    emit_metrics(metrics.records('ok', metrics.rows['export'], files))
+    return 0
+
+
+def cmd_search(args):
+    from excel_to_duckdb_lookup import normalize_waybills, locate_waybills, fetch_waybill_rows
+
+    waybills = list(args.waybills)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8-sig') as f:
+            waybills.extend(f)
+    waybills = normalize_waybills(waybills)
+    if not waybills:
+        print("错误: 请给出运单号或 --file", file=sys.stderr)
+        return 2
+
+    # 全局运单表不存在时逐个查找各月结卡号数据库 (使用各库的运单索引)
+    located = locate_waybills(waybills, args.index, args.db_dir, args.table)
+    if args.details:
+        for month_id, headers, rows in fetch_waybill_rows(waybills, args.db_dir, args.table, located=located):
+            _print_rows(['月结卡号'] + headers, [[month_id, *row] for row in rows], args.format)
+    else:
+        _print_rows(['运单号码', '月结卡号', '账单文件'], located, args.format)
+    missing = [w for w in waybills if w not in {r[0] for r in located}]
+    if missing:
+        print(f"未找到 {len(missing)} 个运单: {', '.join(missing[:20])}{' ...' if len(missing) > 20 else ''}",
+              file=sys.stderr)
+    return 1 if missing else 0
+
+
+def cmd_index(args):
+    from excel_to_duckdb_catalog import month_databases
+    from excel_to_duckdb_lookup import create_waybill_index, refresh_waybill_index
+    from excel_to_duckdb_resources import connect
+
+    # 为已有的 (建索引功能之前导入的) 月结卡号数据库补建运单索引，并整体重建全局运单表
+    month_dbs = month_databases(args.db_dir)
+    for month_id, db_path in month_dbs.items():
+        con = connect(db_path)
+        try:
+            if not create_waybill_index(con, args.table):
+                print(f"警告: {db_path} 中没有表 '{args.table}' 或运单号码列，跳过", file=sys.stderr)
+        finally:
+            con.close()
+    total = refresh_waybill_index(month_dbs, args.index, args.table,
+                                  log=lambda message: print(message, file=sys.stderr))
+    print(f"运单索引已重建: {os.path.abspath(args.index)} ({len(month_dbs)} 个月结卡号，共 {total} 条)")
+    return 0
+
+
+def cmd_bench(args):
+    from excel_to_duckdb_bench import main as bench_main
+
+    bench_main(args.bench_args)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='excel2duckdb', description="Excel 账单导入 DuckDB 工具")
+    # DuckDB 资源配置 (excel_to_duckdb_resources)，作用于本次运行打开的所有连接
+    parser.add_argument('--profile', choices=('default', 'shared', 'low_memory', 'dedicated'),
+                        help="资源预设 (默认 default，或环境变量 EXCEL2DUCKDB_PROFILE)")
+    parser.add_argument('--memory-limit', help="DuckDB 内存上限，如 4GB，或物理内存比例如 0.5")
+    parser.add_argument('--threads', help="DuckDB 线程数，或 CPU 核数比例如 0.5")
+    parser.add_argument('--temp-dir', help="内存不足时的溢出目录")
+    sub = parser.add_subparsers(dest='command', metavar='<command>')
+    sub.required = True
+
+    p = sub.add_parser('ingest', help="导入 Excel 文件 (或按月结卡号导入账单)")
+    p.add_argument('paths', nargs='*', help="Excel 文件或目录")
+    p.add_argument('--db-dir', help="数据库输出目录 (默认在各文件所在目录下的 duckdb_output)")
+    p.add_argument('--table', help="表名 (默认由文件名生成)")
+    p.add_argument('--sheets', help="工作表选择: '*' 全部，其它按正则匹配表名 (默认只导入第一个工作表)")
+    p.add_argument('--sheet-mode', choices=('union', 'per_sheet'), default='union', help="多工作表写入方式")
+    p.add_argument('--chunk-size', type=int, default=50000, help="每块行数")
+    p.add_argument('--sinks', nargs='+', choices=('duckdb', 'parquet'), default=['duckdb'], help="输出目标")
+    p.add_argument('--parquet-dir', help="Parquet 输出目录")
+    p.add_argument('--no-incremental', dest='incremental', action='store_false', help="不跳过未变化的文件")
+    p.add_argument('--workers', type=int, default=1, help="并行数 (文件数或月结卡号进程数)")
+    p.add_argument('--bills', help="月结卡号 JSON ({月结卡号: [文件名]})，按月结卡号导入到各自的数据库")
+    p.add_argument('--bill-dir', default='./系统账单/', help="账单文件目录 (配合 --bills)")
+    p.add_argument('--consolidate', action='store_true', help="按月结卡号导入后更新合并库")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser('preview', help="快速预览工作簿的前几行 (不解码整张表)")
+    p.add_argument('path', help="Excel 文件")
+    p.add_argument('--rows', type=int, default=10, help="预览行数")
+    p.add_argument('--sheet', help="工作表名或下标 (默认第一个)")
+    p.add_argument('--format', choices=('table', 'csv', 'json'), default='table', help="输出格式")
+    p.set_defaults(func=cmd_preview)
+
+    p = sub.add_parser('query', help="对数据库执行只读 SQL")
+    p.add_argument('sql', help="SQL 语句")
+    p.add_argument('--db', help="数据库文件")
+    p.add_argument('--db-dir', help="月结卡号数据库目录 (建立合并视图 all_months)")
+    p.add_argument('--table', default='sftable', help="--db-dir 时合并的表名")
+    p.add_argument('--limit', type=int, help="最多输出行数")
+    p.add_argument('--format', choices=('table', 'csv', 'json'), default='table', help="输出格式")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser('pivot', help="按月结卡号透视汇总 (SF-2-读取.py)")
+    p.add_argument('--db-dir', default='duckdb_output', help="月结卡号数据库目录")
+    p.add_argument('--table', help="明细表名 (默认 sftable)")
+    p.add_argument('--group-by', nargs='+', help="额外的分组列")
+    p.add_argument('--output', help="输出文件 (.xlsx 或 .csv)，默认输出到标准输出")
+    p.add_argument('--format', choices=('table', 'csv', 'json'), default='table', help="标准输出的格式")
+    p.add_argument('--per-db', action='store_true', help="各数据库并行分别汇总 (默认 ATTACH 后一次查询)")
+    p.add_argument('--scan', action='store_true', help="扫描明细表 (默认优先读取汇总表)")
+    p.add_argument('-v', '--verbose', action='store_true', help="输出过程信息")
+    p.set_defaults(func=cmd_pivot)
+
+    p = sub.add_parser('export', help="流式导出明细或查询结果到 xlsx/CSV (超过 Excel 行数上限时自动拆分)")
+    p.add_argument('--db', help="数据库文件")
+    p.add_argument('--db-dir', help="月结卡号数据库目录 (未给 --sql 时每个月结卡号导出一个文件)")
+    p.add_argument('--table', default='sftable', help="导出的表名")
+    p.add_argument('--where', help="过滤条件，如 \"产品类型 = '特快'\"")
+    p.add_argument('--sql', help="自定义查询 (--db-dir 时在合并视图 all_months 上执行)")
+    p.add_argument('--output', required=True, help="输出文件 (.xlsx / .csv)；按月结卡号导出时为输出目录")
+    p.add_argument('--format', choices=('xlsx', 'csv'), default='xlsx', help="按月结卡号导出时的文件格式")
+    p.add_argument('--split', choices=('sheet', 'file'), default='sheet', help="超过行数上限时拆分为新工作表或新文件")
+    p.add_argument('--max-rows', type=int, default=1048576, help="每个工作表的最大行数 (含表头)")
+    p.add_argument('--workers', type=int, default=1, help="按月结卡号并行导出的进程数")
+    p.add_argument('-v', '--verbose', action='store_true', help="输出导出进度")
+    p.set_defaults(func=cmd_export)
+
+    # 默认路径与 excel_to_duckdb_lookup.WAYBILL_INDEX_PATH 相同 (此处不导入该模块，保持 --help 的启动速度)
+    index_path = os.path.join('duckdb_catalog', 'waybill_index.duckdb')
+    p = sub.add_parser('search', help="按运单号查找所在的月结卡号和账单文件")
+    p.add_argument('waybills', nargs='*', help="运单号")
+    p.add_argument('--file', help="运单号列表文件 (每行一个)")
+    p.add_argument('--db-dir', default='duckdb_output', help="月结卡号数据库目录")
+    p.add_argument('--index', default=index_path, help="全局运单表")
+    p.add_argument('--table', default='sftable', help="明细表名")
+    p.add_argument('--details', action='store_true', help="输出运单的明细行")
+    p.add_argument('--format', choices=('table', 'csv', 'json'), default='table', help="输出格式")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser('index', help="为已有的月结卡号数据库建运单索引并重建全局运单表")
+    p.add_argument('--db-dir', default='duckdb_output', help="月结卡号数据库目录")
+    p.add_argument('--index', default=index_path, help="全局运单表")
+    p.add_argument('--table', default='sftable', help="明细表名")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser('bench', help="导入引擎基准测试 (参数同 excel_to_duckdb_bench.py)", add_help=False)
+    p.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    # bench 的参数原样交给 excel_to_duckdb_bench 解析
+    args, extra = parser.parse_known_args(argv)
+    if args.func is cmd_bench:
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"无法识别的参数: {' '.join(extra)}")
+    if args.profile or args.memory_limit or args.threads or args.temp_dir:
+        from excel_to_duckdb_resources import set_profile
+
+        set_profile(args.profile, memory_limit=args.memory_limit, threads=args.threads, temp_directory=args.temp_dir)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+导入引擎基准测试
+
+生成可复现的合成工作簿 (行数、列数、类型组合、空单元格比例可配置)，
+在独立子进程中依次运行仓库中的各种导入方式，记录耗时、行/秒、峰值内存和输出数据库大小，
+结果写入 JSON 文件，便于对比和发现性能回退。
+
+用法示例:
+    python excel_to_duckdb_bench.py --rows 100000 --cols 12 --empty-ratio 0.1
+    python excel_to_duckdb_bench.py --engines streaming pandas_bridge --repeat 3 --output bench.json
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import random
+import tempfile
+import time
+
+from excel_to_duckdb_metrics import peak_rss_mb
+
+# 合成数据的列类型，按顺序循环分配给各列
+COLUMN_TYPES = ('int', 'float', 'text', 'date', 'mixed')
+# 等待子进程结果时检查其是否仍在运行的间隔 (秒)；子进程被 OOM 杀掉或崩溃时不会回传结果
+POLL_SECONDS = 0.5
+
+
+def generate_workbook(path, rows, cols, types=COLUMN_TYPES, empty_ratio=0.0, seed=42):
+    """
+    生成合成工作簿 (openpyxl write_only 模式，内存占用与行数无关)
+    :param path: 输出 .xlsx 路径
+    :param rows: 数据行数 (不含表头)
+    :param cols: 列数
+    :param types: 列类型组合，按顺序循环分配: int / float / text / date / mixed
+    :param empty_ratio: 空单元格比例 (0~1)
+    :param seed: 随机种子，相同参数生成相同文件内容
+    """
+    import openpyxl
+
+    rng = random.Random(seed)
+    col_types = [types[i % len(types)] for i in range(cols)]
+    base_date = datetime.datetime(2024, 1, 1)
+
+    def cell(col_type, r):
+        if empty_ratio and rng.random() < empty_ratio:
+            return None
+        if col_type == 'int':
+            return rng.randint(0, 10 ** 9)
+        if col_type == 'float':
+            return round(rng.random() * 10000, 2)
+        if col_type == 'date':
+            return base_date + datetime.timedelta(minutes=rng.randint(0, 525600))
+        if col_type == 'mixed':
+            return rng.choice((rng.randint(0, 1000), f"N{r}", round(rng.random(), 3)))
+        return f"text_{rng.randint(0, 10 ** 6)}"
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    ws.append([f"{t}_{i}" for i, t in enumerate(col_types)])
+    for r in range(rows):
+        ws.append([cell(t, r) for t in col_types])
+    wb.save(path)
+    return path
+
+
+def _read_first_sheet(excel_path):
+    import python_calamine
+
+    with open(excel_path, 'rb') as f_r:
+        xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
+        return xls.get_sheet_by_index(0).to_python()
+
+
+def engine_calamine_to_python(excel_path, db_path):
+    """1-calamine_read.py: 只解析，不写库"""
+    return len(_read_first_sheet(excel_path)) - 1
+
+
+def engine_pandas_bridge(excel_path, db_path):
+    """3-save_to_duckdb.py / processor: to_python + DataFrame + replace + CTAS"""
+    from excel_to_duckdb_resources import connect
+    import numpy as np
+    import pandas as pd
+
+    sheet_data = _read_first_sheet(excel_path)
+    headers = [str(h) for h in sheet_data[0]]
+    df = pd.DataFrame(sheet_data[1:], columns=headers)
+    df = df.replace('', np.nan).infer_objects()
+    con = connect(db_path)
+    try:
+        con.execute("CREATE OR REPLACE TABLE bench AS SELECT * FROM df")
+    finally:
+        con.close()
+    return len(df)
+
+
+def engine_executemany(excel_path, db_path):
+    """无 pandas 时的回退: 全部转为 VARCHAR 后 executemany 逐行插入"""
+    from excel_to_duckdb_resources import connect
+
+    sheet_data = _read_first_sheet(excel_path)
+    headers = [str(h) for h in sheet_data[0]]
+    rows = sheet_data[1:]
+    con = connect(db_path)
+    try:
+        cols_def = ", ".join([f'"{h}" VARCHAR' for h in headers])
+        con.execute(f"CREATE OR REPLACE TABLE bench ({cols_def})")
+        placeholders = ', '.join(['?'] * len(headers))
+        safe_rows = [[str(cell) if cell is not None else None for cell in row] for row in rows]
+        con.executemany(f"INSERT INTO bench VALUES ({placeholders})", safe_rows)
+    finally:
+        con.close()
+    return len(rows)
+
+
+def engine_columnar(excel_path, db_path):
+    """无 pandas 时的列式批量写入 (excel_to_duckdb_columnar.bulk_insert)"""
+    from excel_to_duckdb_resources import connect
+    from excel_to_duckdb_columnar import bulk_insert
+
+    sheet_data = _read_first_sheet(excel_path)
+    headers = [str(h) for h in sheet_data[0]]
+    con = connect(db_path)
+    try:
+        return bulk_insert(con, 'bench', headers, sheet_data[1:])
+    finally:
+        con.close()
+
+
+def engine_streaming(excel_path, db_path):
+    """excel_to_duckdb_processor.save_excel_to_duckdb_streaming: 按块流式写入"""
+    from excel_to_duckdb_processor import save_excel_to_duckdb_streaming
+
+    return save_excel_to_duckdb_streaming(excel_path, db_path, 'bench')
+
+
+def engine_typed(excel_path, db_path):
+    """SF-1 的类型推断写入 (excel_to_duckdb_schema)"""
+    from excel_to_duckdb_resources import connect
+    from excel_to_duckdb_schema import sample_rows, infer_schema, write_typed_table
+
+    sheet_data = _read_first_sheet(excel_path)
+    headers = [str(h) for h in sheet_data[0]]
+    rows = sheet_data[1:]
+    types = infer_schema(headers, sample_rows(rows))
+    con = connect(db_path)
+    try:
+        row_count, _ = write_typed_table(con, 'bench', headers, rows, types)
+    finally:
+        con.close()
+    return row_count
+
+
+def engine_spatial_st_read(excel_path, db_path):
+    """2-duckdb_read.py: spatial 扩展 st_read 直接读取 (需要能安装扩展)"""
+    from excel_to_duckdb_resources import connect
+
+    con = connect(db_path)
+    try:
+        con.install_extension("spatial")
+        con.load_extension("spatial")
+        con.execute(f"CREATE OR REPLACE TABLE bench AS SELECT * FROM st_read('{excel_path}')")
+        return con.execute("SELECT COUNT(*) FROM bench").fetchone()[0]
+    finally:
+        con.close()
+
+
+ENGINES = {
+    'calamine_to_python': engine_calamine_to_python,
+    'pandas_bridge': engine_pandas_bridge,
+    'executemany': engine_executemany,
+    'columnar': engine_columnar,
+    'streaming': engine_streaming,
+    'typed': engine_typed,
+    'spatial_st_read': engine_spatial_st_read,
+}
+
+
+def _warm_imports():
+    """预先导入重量级模块，使计时不包含模块导入时间"""
+    for module in ('duckdb', 'python_calamine', 'numpy', 'pandas'):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+def _run_engine(name, excel_path, db_path, queue):
+    """子进程入口: 运行一个引擎并回传测量结果"""
+    result = {'engine': name, 'status': 'ok', 'error': None}
+    _warm_imports()
+    # 导入完成后的内存基线，peak_rss_mb - baseline_rss_mb 约为引擎本身的内存开销
+    result['baseline_rss_mb'] = peak_rss_mb()
+    try:
+        t_start = time.perf_counter()
+        rows = ENGINES[name](excel_path, db_path)
+        seconds = time.perf_counter() - t_start
+        result.update(rows=rows, seconds=round(seconds, 4),
+                      rows_per_sec=round(rows / seconds, 1) if seconds > 0 else None)
+    except Exception as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['db_size_mb'] = round(os.path.getsize(db_path) / (1024 * 1024), 3) if os.path.exists(db_path) else None
+    queue.put(result)
+
+
+def run_engine(name, excel_path, work_dir, timeout=None):
+    """在独立子进程中运行引擎，使峰值内存互不影响"""
+    db_path = os.path.join(work_dir, f"{name}.duckdb")
+    for path in (db_path, db_path + '.wal', os.path.splitext(db_path)[0] + '.manifest.json'):
+        if os.path.exists(path):
+            os.remove(path)
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_engine, args=(name, excel_path, db_path, queue))
+    process.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result = None
+    while result is None:
+        alive = process.is_alive()
+        try:
+            # 子进程退出前已回传的结果仍在队列中，退出后再取一次
+            result = queue.get(timeout=POLL_SECONDS)
+        except queue_module.Empty:
+            if not alive:
+                process.join()
+                # 负数为终止信号 (如 -9: 被 OOM killer 杀掉)
+                result = {'engine': name, 'status': 'crashed', 'error': f"子进程退出，退出码 {process.exitcode}",
+                          'exitcode': process.exitcode}
+            elif deadline is not None and time.monotonic() > deadline:
+                process.terminate()
+                result = {'engine': name, 'status': 'timeout', 'error': f"超过 {timeout} 秒"}
+    process.join()
+    return result
+
+
+def run_benchmark(rows, cols, types=COLUMN_TYPES, empty_ratio=0.0, engines=None, repeat=1,
+                  seed=42, work_dir=None, timeout=None, log=print):
+    """
+    生成合成工作簿并依次运行各引擎
+    :return: 结果 dict (参数、环境信息、每个引擎每次运行的测量值)
+    """
+    engines = list(engines or ENGINES)
+    work_dir = work_dir or tempfile.mkdtemp(prefix='excel_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    # 文件名包含全部生成参数，复用 --work-dir 时不会误用其它参数生成的工作簿
+    params = json.dumps([rows, cols, list(types), empty_ratio, seed])
+    digest = hashlib.sha1(params.encode('utf-8')).hexdigest()[:8]
+    excel_path = os.path.join(work_dir, f"bench_{rows}x{cols}_{seed}_{digest}.xlsx")
+
+    if not os.path.exists(excel_path):
+        log(f"正在生成合成工作簿 {excel_path} ({rows} 行 x {cols} 列)...")
+        generate_workbook(excel_path, rows, cols, types, empty_ratio, seed)
+
+    import duckdb
+    from excel_to_duckdb_resources import resolve_settings
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'params': {'rows': rows, 'cols': cols, 'types': list(types), 'empty_ratio': empty_ratio,
+                   'seed': seed, 'repeat': repeat},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'duckdb': duckdb.__version__,
+                        'duckdb_config': resolve_settings()},
+        'excel_size_mb': round(os.path.getsize(excel_path) / (1024 * 1024), 3),
+        'results': [],
+    }
+    for name in engines:
+        for run in range(repeat):
+            result = run_engine(name, excel_path, work_dir, timeout)
+            result['run'] = run
+            report['results'].append(result)
+            if result['status'] == 'ok':
+                log(f"  {name:<20} 第 {run + 1} 次: {result['seconds']:.2f} 秒，"
+                    f"{result['rows_per_sec']} 行/秒，峰值内存 {result['peak_rss_mb']} MB，"
+                    f"数据库 {result['db_size_mb']} MB")
+            else:
+                log(f"  {name:<20} 第 {run + 1} 次: {result['status']} {result['error']}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Excel 导入引擎基准测试")
+    parser.add_argument('--rows', type=int, default=100000, help="数据行数")
+    parser.add_argument('--cols', type=int, default=10, help="列数")
+    parser.add_argument('--types', nargs='+', default=list(COLUMN_TYPES), choices=COLUMN_TYPES,
+                        help="列类型组合，按顺序循环分配给各列")
+    parser.add_argument('--empty-ratio', type=float, default=0.0, help="空单元格比例 (0~1)")
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), help="要测试的引擎 (默认全部)")
+    parser.add_argument('--repeat', type=int, default=1, help="每个引擎运行次数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--work-dir', default=None, help="工作簿和数据库的存放目录 (默认临时目录)")
+    parser.add_argument('--timeout', type=float, default=None, help="单次运行超时 (秒)")
+    parser.add_argument('--output', default='bench_results.json', help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.rows, args.cols, args.types, args.empty_ratio, args.engines,
+                           args.repeat, args.seed, args.work_dir, args.timeout)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {os.path.abspath(args.output)}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
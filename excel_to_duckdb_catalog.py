@@ -0,0 +1,137 @@
+import os
+
+import duckdb
+
+from excel_to_duckdb_resources import connect
+
+# 合并库: 所有月结卡号的数据写入同一个数据库的同一张表，附加 month_id 列并按其排序，
+# 按 month_id 过滤时 DuckDB 可依据行组的最小/最大值 (zone map) 跳过无关的行组。
+# 放在 duckdb_output 之外，避免被按文件遍历各月结卡号数据库的脚本当作一个月结卡号
+CATALOG_PATH = os.path.join("duckdb_catalog", "catalog.duckdb")
+MONTH_COLUMN = 'month_id'
+UNION_VIEW = 'all_months'
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def month_databases(db_dir):
+    """目录下的各月结卡号数据库 {month_id: 路径}，按 month_id 排序"""
+    return {name[:-len('.duckdb')]: os.path.join(db_dir, name)
+            for name in sorted(os.listdir(db_dir)) if name.endswith('.duckdb')}
+
+
+def _attach(con, month_dbs):
+    """以只读方式 ATTACH 各数据库，返回 {month_id: 别名}"""
+    aliases = {}
+    for i, (month_id, db_path) in enumerate(month_dbs.items()):
+        alias = f"m{i}"
+        con.execute(f"ATTACH {_literal(db_path)} AS {alias} (READ_ONLY)")
+        aliases[month_id] = alias
+    return aliases
+
+
+def _detach(con, aliases):
+    for alias in aliases.values():
+        con.execute(f"DETACH {alias}")
+
+
+def _has_table(con, alias, table_name):
+    return con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = ? AND table_name = ?",
+                       [alias, table_name]).fetchone()[0] > 0
+
+
+def union_sql(con, aliases, table_name):
+    """各 ATTACH 数据库中同名表的 UNION ALL BY NAME (列按名称对齐，缺失的列补 NULL)，附加 month_id 列"""
+    parts = [f"SELECT *, {_literal(month_id)} AS {_quote(MONTH_COLUMN)} FROM {alias}.{_quote(table_name)}"
+             for month_id, alias in aliases.items() if _has_table(con, alias, table_name)]
+    if not parts:
+        raise ValueError(f"没有找到任何包含表 '{table_name}' 的数据库")
+    return "\nUNION ALL BY NAME\n".join(parts)
+
+
+def open_union(month_dbs, table_name='sftable', view_name=UNION_VIEW, con=None):
+    """
+    以只读方式 ATTACH 已有的各月结卡号数据库，并创建一个合并视图，跨月查询只需一次 (并行) 扫描
+    :param month_dbs: {month_id: 数据库路径}，或存放各数据库的目录
+    :param table_name: 各数据库中的表名
+    :param view_name: 合并视图名 (临时视图，只在该连接中可见)
+    :param con: 已有连接；None 时新建内存连接
+    :return: DuckDB 连接
+    """
+    if isinstance(month_dbs, str):
+        month_dbs = month_databases(month_dbs)
+    con = con or connect()
+    aliases = _attach(con, month_dbs)
+    con.execute(f"CREATE OR REPLACE TEMP VIEW {_quote(view_name)} AS {union_sql(con, aliases, table_name)}")
+    return con
+
+
+def _rebuild(con, month_dbs, table_name):
+    aliases = _attach(con, month_dbs)
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE {_quote(table_name)} AS "
+                    f"SELECT * FROM ({union_sql(con, aliases, table_name)}) ORDER BY {_quote(MONTH_COLUMN)}")
+    finally:
+        _detach(con, aliases)
+
+
+def refresh_catalog(month_dbs, catalog_path=CATALOG_PATH, table_name='sftable', changed=None, log=print):
+    """
+    把各月结卡号数据库合并写入合并库
+    :param month_dbs: 当前所有的 {month_id: 数据库路径}
+    :param catalog_path: 合并库路径
+    :param table_name: 表名 (各月结卡号数据库与合并库相同)
+    :param changed: 本次有变化需要重新载入的 month_id；None 时整体重建
+    :return: 合并库中的总行数
+    """
+    os.makedirs(os.path.dirname(catalog_path) or '.', exist_ok=True)
+    con = connect(catalog_path)
+    try:
+        existing = set()
+        if _has_table(con, con.execute("SELECT current_database()").fetchone()[0], table_name):
+            existing = {r[0] for r in con.execute(
+                f"SELECT DISTINCT {_quote(MONTH_COLUMN)} FROM {_quote(table_name)}").fetchall()}
+        else:
+            changed = None
+
+        if changed is None:
+            log(f"正在重建合并库 {catalog_path} ({len(month_dbs)} 个月结卡号)...")
+            _rebuild(con, month_dbs, table_name)
+        else:
+            # 增量: 删除已移除和有变化的月结卡号，再逐个按 month_id 顺序追加，
+            # 每个月结卡号的数据写在连续的行组中，zone map 过滤仍然有效
+            to_load = {m: p for m, p in month_dbs.items() if m in set(changed) or m not in existing}
+            to_delete = [m for m in existing if m not in month_dbs or m in to_load]
+            if to_load or to_delete:
+                log(f"正在更新合并库 {catalog_path}: 载入 {len(to_load)} 个，删除 {len(to_delete)} 个月结卡号")
+                aliases = _attach(con, dict(sorted(to_load.items())))
+                try:
+                    con.begin()
+                    if to_delete:
+                        placeholders = ', '.join(['?'] * len(to_delete))
+                        con.execute(f"DELETE FROM {_quote(table_name)} "
+                                    f"WHERE {_quote(MONTH_COLUMN)} IN ({placeholders})", to_delete)
+                    for month_id, alias in aliases.items():
+                        if _has_table(con, alias, table_name):
+                            con.execute(f"INSERT INTO {_quote(table_name)} BY NAME "
+                                        f"SELECT *, {_literal(month_id)} AS {_quote(MONTH_COLUMN)} "
+                                        f"FROM {alias}.{_quote(table_name)}")
+                    con.commit()
+                except (duckdb.BinderException, duckdb.ConversionException) as e:
+                    # 新数据出现了合并表中没有的列或不兼容的类型: 整体重建
+                    con.rollback()
+                    log(f"  合并表结构不兼容 ({e})，改为整体重建")
+                    _detach(con, aliases)
+                    aliases = {}
+                    _rebuild(con, month_dbs, table_name)
+                finally:
+                    _detach(con, aliases)
+        return con.execute(f"SELECT COUNT(*) FROM {_quote(table_name)}").fetchone()[0]
+    finally:
+        con.close()
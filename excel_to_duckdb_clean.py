@@ -0,0 +1,108 @@
+import itertools
+import operator
+
+# 导入时的数据清理: 表头行自动识别、合计行/空行过滤，只做一次，入库的表只包含数据行，
+# 查询时不再需要逐行排除 "合 计" 等汇总行
+
+# 表头识别: 在前 HEADER_SCAN_ROWS 行中查找包含任一关键字的行作为表头；
+# 找不到时只跳过开头的标题行 (至多一个非空单元格，如 "XX 公司 1 月账单"、空行)，取其后第一个有多个非空单元格的行；
+# 第一行本身有多个非空单元格时就是表头 (表头中可以有数字或空单元格，如 ['name', 2023, 2024])。
+# AUTO_HEADER 为 False 时固定使用第一行
+AUTO_HEADER = True
+HEADER_KEYWORDS = ('运单号码',)
+HEADER_SCAN_ROWS = 20
+# 任一单元格与这些值完全相等的行视为合计行，导入时丢弃
+FOOTER_MARKERS = ('合 计', '合计', '总计')
+# 丢弃所有单元格都为空的行
+DROP_EMPTY_ROWS = True
+
+
+_EMPTY_VALUES = frozenset(('', None))
+
+
+def _is_empty(value):
+    return value is None or value == ''
+
+
+def detect_header(rows, keywords=HEADER_KEYWORDS, scan_rows=HEADER_SCAN_ROWS):
+    """
+    识别表头所在行
+    :param rows: 工作表开头的若干行
+    :return: 表头行下标 (识别不出时为 0)
+    """
+    if not AUTO_HEADER:
+        return 0
+    candidates = rows[:scan_rows]
+    keywords = set(keywords)
+    for i, row in enumerate(candidates):
+        if any(isinstance(v, str) and v.strip() in keywords for v in row):
+            return i
+
+    for i, row in enumerate(candidates):
+        if sum(1 for v in row if not _is_empty(v)) >= 2:
+            return i
+    return 0
+
+
+def split_header(rows_iter, keywords=HEADER_KEYWORDS, scan_rows=HEADER_SCAN_ROWS):
+    """
+    从行迭代器中识别并取出表头 (只缓存前 scan_rows 行)
+    :return: (表头行, 表头之后的数据行迭代器)；工作表为空时表头为 None
+    """
+    head = list(itertools.islice(rows_iter, scan_rows))
+    if not head:
+        return None, rows_iter
+    index = detect_header(head, keywords, scan_rows)
+    return head[index], itertools.chain(head[index + 1:], rows_iter)
+
+
+def clean_rows(rows, markers=FOOTER_MARKERS, drop_empty=DROP_EMPTY_ROWS):
+    """
+    过滤一块行数据中的合计行和空行
+    先对整块做两次 C 层面的检查: 所有单元格 (chain.from_iterable) 是否含合计标记、第一列 (map itemgetter)
+    是否有空值 (空行的第一个单元格必然为空)；绝大多数块两者都不命中，直接返回原列表，
+    命中时才逐行判断
+    :param rows: 行数据 (list of list)
+    :return: 过滤后的行列表 (无需过滤时返回原列表)
+    """
+    if not rows:
+        return rows
+    marker_set = frozenset(markers)
+    has_marker = not marker_set.isdisjoint(itertools.chain.from_iterable(rows))
+    try:
+        has_empty = drop_empty and not _EMPTY_VALUES.isdisjoint(map(operator.itemgetter(0), rows))
+    except IndexError:
+        # 块中有长度为 0 的行
+        has_empty = drop_empty
+    if not (has_marker or has_empty):
+        return rows
+
+    def keep(row):
+        if not row:
+            return not drop_empty
+        if drop_empty and row[0] in _EMPTY_VALUES and row.count('') + row.count(None) == len(row):
+            return False
+        return marker_set.isdisjoint(row)
+
+    kept = [row for row in rows if keep(row)]
+    return rows if len(kept) == len(rows) else kept
+
+
+def iter_clean_chunks(chunks, markers=FOOTER_MARKERS, drop_empty=DROP_EMPTY_ROWS):
+    """逐块过滤合计行和空行，跳过过滤后为空的块"""
+    for chunk in chunks:
+        chunk = clean_rows(chunk, markers, drop_empty)
+        if chunk:
+            yield chunk
+
+
+def split_sheet(sheet_data, keywords=HEADER_KEYWORDS):
+    """
+    对已物化的工作表数据 (to_python() 的结果) 识别表头并过滤数据行
+    :param keywords: 表头关键字，见 detect_header
+    :return: (表头行, 数据行列表)；工作表为空时表头为 None
+    """
+    if not sheet_data:
+        return None, []
+    index = detect_header(sheet_data, keywords)
+    return sheet_data[index], clean_rows(sheet_data[index + 1:])
@@ -0,0 +1,171 @@
+import datetime
+
+# 不依赖 pandas 的列式批量写入:
+# 将 calamine 的行数据转置为列数组，安装了 pyarrow 时构建 Arrow 表交给 DuckDB 直接扫描，
+# 否则把每列作为一个 LIST 参数传入，用 unnest 一次性展开为整批行，替代逐行 executemany
+
+# 每批写入的行数 (控制参数转换的内存峰值)
+BATCH_SIZE = 100000
+
+
+def rows_to_columns(rows, width):
+    """
+    将一块行数据转置为列数组，同时把空字符串替换为 None
+    :param rows: 行数据 (list of list)
+    :param width: 列数
+    :return: (列数组列表, 全为空的列下标集合)
+    """
+    columns = []
+    null_columns = set()
+    for i, col in enumerate(zip(*rows)):
+        values = [None if v == '' else v for v in col]
+        if all(v is None for v in values):
+            null_columns.add(i)
+        columns.append(values)
+    # 行数据宽度不足时补齐空列
+    for i in range(len(columns), width):
+        columns.append([None] * len(rows))
+        null_columns.add(i)
+    return columns, null_columns
+
+
+def column_type(values):
+    """
+    根据列中的 Python 值确定 DuckDB 类型；类型混杂的列返回 VARCHAR
+    :return: BOOLEAN / BIGINT / DOUBLE / TIMESTAMP / DATE / VARCHAR
+    """
+    kinds = set()
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            kinds.add('BOOLEAN')
+        elif isinstance(v, int):
+            kinds.add('BIGINT' if -2 ** 63 <= v < 2 ** 63 else 'VARCHAR')
+        elif isinstance(v, float):
+            kinds.add('DOUBLE')
+        elif isinstance(v, datetime.datetime):
+            kinds.add('TIMESTAMP')
+        elif isinstance(v, datetime.date):
+            kinds.add('DATE')
+        else:
+            kinds.add('VARCHAR')
+        if 'VARCHAR' in kinds:
+            return 'VARCHAR'
+    if not kinds:
+        return 'VARCHAR'
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == {'BIGINT', 'DOUBLE'}:
+        return 'DOUBLE'
+    if kinds == {'DATE', 'TIMESTAMP'}:
+        return 'TIMESTAMP'
+    return 'VARCHAR'
+
+
+def _merge_type(table_type, batch_type):
+    """表已有列类型与新批次列类型合并后的类型"""
+    if table_type == batch_type:
+        return table_type
+    if {table_type, batch_type} == {'BIGINT', 'DOUBLE'}:
+        return 'DOUBLE'
+    if {table_type, batch_type} == {'DATE', 'TIMESTAMP'}:
+        return 'TIMESTAMP'
+    return 'VARCHAR'
+
+
+def _normalize(values, col_type):
+    """把列中的值统一为目标类型对应的 Python 类型 (只在类型混杂时才需要逐个转换)"""
+    if col_type == 'VARCHAR':
+        return [None if v is None else str(v) for v in values]
+    if col_type == 'DOUBLE':
+        return [None if v is None else float(v) for v in values]
+    if col_type == 'TIMESTAMP':
+        return [datetime.datetime(v.year, v.month, v.day)
+                if isinstance(v, datetime.date) and not isinstance(v, datetime.datetime) else v
+                for v in values]
+    return values
+
+
+def _to_arrow(headers, columns, types):
+    import pyarrow as pa
+
+    arrow_types = {'BOOLEAN': pa.bool_(), 'BIGINT': pa.int64(), 'DOUBLE': pa.float64(),
+                   'TIMESTAMP': pa.timestamp('us'), 'DATE': pa.date32(), 'VARCHAR': pa.string()}
+    arrays = []
+    for values, col_type in zip(columns, types):
+        arrays.append(pa.array(_normalize(values, col_type), type=arrow_types[col_type]))
+    return pa.Table.from_arrays(arrays, names=[f"c{i}" for i in range(len(headers))])
+
+
+def _has_arrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def bulk_insert(con, table_name, headers, rows, create=True, all_varchar=False, extra_columns=None,
+                batch_size=BATCH_SIZE):
+    """
+    列式批量写入 (不需要 pandas)
+    :param con: DuckDB 连接
+    :param table_name: 目标表名
+    :param headers: 列名列表
+    :param rows: 行数据
+    :param create: True 时按首批数据的类型重建表 (CREATE OR REPLACE)，否则追加
+    :param all_varchar: True 时所有列存为 VARCHAR
+    :param extra_columns: 附加的常量 VARCHAR 列 {列名: 值}，如 {'_source_file': 'a.xlsx'}
+    :param batch_size: 每批行数
+    :return: 写入行数
+    """
+    extra_columns = extra_columns or {}
+    extra_sql = "".join(
+        f""", CAST('{str(v).replace("'", "''")}' AS VARCHAR) AS "{k}\"""" for k, v in extra_columns.items())
+    use_arrow = _has_arrow()
+    types = None
+    untyped = set()
+    total = 0
+    for start in range(0, max(len(rows), 1), batch_size):
+        batch = rows[start:start + batch_size]
+        columns, null_columns = rows_to_columns(batch, len(headers))
+        if all_varchar:
+            types = ['VARCHAR'] * len(headers)
+        elif types is None:
+            types = [column_type(c) for c in columns]
+            untyped = set(null_columns)
+        else:
+            # 后续批次类型不一致时放宽表的列类型；首批全为空的列直接采用新批次的类型
+            for i, values in enumerate(columns):
+                if i in null_columns:
+                    continue
+                batch_type = column_type(values)
+                new_type = batch_type if i in untyped else _merge_type(types[i], batch_type)
+                untyped.discard(i)
+                if new_type != types[i]:
+                    con.execute(f'ALTER TABLE {table_name} ALTER "{headers[i]}" TYPE {new_type}')
+                    types[i] = new_type
+        select_sql = ", ".join(f'CAST(c{i} AS {t}) AS "{h}"' for i, (h, t) in enumerate(zip(headers, types)))
+
+        if use_arrow:
+            batch_table = _to_arrow(headers, columns, types)
+            con.register('batch_view', batch_table)
+            source_sql, params = "batch_view", None
+        else:
+            unnest_sql = ", ".join(f"unnest(${i + 1}::{t}[]) AS c{i}" for i, t in enumerate(types))
+            source_sql = f"(SELECT {unnest_sql})"
+            params = [_normalize(c, t) for c, t in zip(columns, types)]
+        try:
+            if create and start == 0:
+                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS "
+                            f"SELECT {select_sql}{extra_sql} FROM {source_sql}", params)
+            else:
+                con.execute(f"INSERT INTO {table_name} BY NAME "
+                            f"SELECT {select_sql}{extra_sql} FROM {source_sql}", params)
+        finally:
+            if use_arrow:
+                con.unregister('batch_view')
+        total += len(batch)
+        del columns, batch
+    return total
@@ -0,0 +1,149 @@
+from excel_to_duckdb_manifest import SOURCE_COLUMN
+
+# 跨文件去重: 同一月结卡号的多个账单文件 (重开/更正的账单) 中键列相同的行只保留一行，
+# 整表在 DuckDB 中用窗口函数一次完成，不在 Python 中逐行比较
+# - 'first': 保留文件顺序 (JSON 中的顺序) 最靠前的一行
+# - 'last': 保留文件顺序最靠后的一行
+# - 'latest_file': 保留修改时间最新的文件中的一行
+DEDUP_POLICIES = ('first', 'last', 'latest_file')
+# 被去掉的重复行移入 {表名}_duplicates，便于核对；增量导入时其中来自未变化文件的行在所属键需要重新比较时放回明细表
+DUPLICATES_SUFFIX = '_duplicates'
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def file_priority(fingerprints, files, policy):
+    """
+    去重时各来源文件的先后顺序
+    :param fingerprints: {文件键: 指纹} (含 mtime)，policy 为 'latest_file' 时使用
+    :param files: 按处理顺序排列的文件键
+    :return: 按先后排列的文件键 ('latest_file' 按修改时间，其余按处理顺序)；
+             dedup_table 按策略保留最先或最后的文件中的行
+    """
+    if policy == 'latest_file':
+        position = {key: i for i, key in enumerate(files)}
+        return sorted(files, key=lambda key: (fingerprints[key]['mtime'], position[key]))
+    return list(files)
+
+
+def _valid_keys_sql(keys):
+    return " AND ".join(f"NULLIF(TRIM(CAST({_quote(k)} AS VARCHAR)), '') IS NOT NULL" for k in keys)
+
+
+def _key_in_sql(keys, key_table):
+    """行的键在 key_table (只有键列的临时表) 中"""
+    key_sql = ", ".join(_quote(k) for k in keys)
+    return f"({key_sql}) IN (SELECT {key_sql} FROM {key_table})"
+
+
+def _table_exists(con, table_name):
+    return bool(con.execute("SELECT 1 FROM duckdb_tables() WHERE table_name = ? AND NOT temporary",
+                            [table_name]).fetchall())
+
+
+def dedup_table(con, table_name, keys, policy='last', file_order=None, source_column=SOURCE_COLUMN,
+                keep_duplicates=True, key_table=None, append_duplicates=False):
+    """
+    删除表中键列重复的行，每组只保留一行；任一键列为 NULL 或空字符串的行不参与去重
+    :param keys: 键列名，如 ('运单号码',)
+    :param policy: 'first' / 'last' / 'latest_file'
+    :param file_order: 来源文件键的先后顺序 (见 file_priority)；None 时只按写入顺序 (rowid)
+    :param keep_duplicates: True 时把删除的行写入 {表名}_duplicates
+    :param key_table: 只比较键在该临时表中的行 (增量去重)；None 时比较整张表
+    :param append_duplicates: True 时追加到已有的 {表名}_duplicates，否则重建
+    :return: 删除的行数
+    """
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"未知的去重策略: {policy}，可选 {DEDUP_POLICIES}")
+    table = _quote(table_name)
+    valid = _valid_keys_sql(keys)
+    if key_table:
+        valid += f" AND {_key_in_sql(keys, key_table)}"
+    direction = 'ASC' if policy == 'first' else 'DESC'
+
+    params = []
+    source = "t"
+    if file_order:
+        # 文件优先级通过列表参数展开为 (文件键, 序号) 再关联，不为每个文件拼接 SQL
+        source = (f"t LEFT JOIN (SELECT unnest($1::VARCHAR[]) AS src, generate_subscripts($1::VARCHAR[], 1) AS pos) f "
+                  f"ON t.{_quote(source_column)} = f.src")
+        order = f"f.pos {direction} NULLS LAST, t.rowid {direction}"
+        params.append(list(file_order))
+    else:
+        order = f"t.rowid {direction}"
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _dedup_rowids AS "
+                f"SELECT t.rowid AS rid FROM (SELECT rowid, * FROM {table} WHERE {valid}) {source} "
+                f"QUALIFY row_number() OVER (PARTITION BY {', '.join('t.' + _quote(k) for k in keys)} "
+                f"ORDER BY {order}) > 1", params)
+    try:
+        removed = con.execute("SELECT COUNT(*) FROM _dedup_rowids").fetchone()[0]
+        if keep_duplicates:
+            duplicates = _quote(table_name + DUPLICATES_SUFFIX)
+            select = f"SELECT * FROM {table} WHERE rowid IN (SELECT rid FROM _dedup_rowids)"
+            if append_duplicates and _table_exists(con, table_name + DUPLICATES_SUFFIX):
+                # 明细表的列可能已新增或放宽，按列名合并
+                select = f"SELECT * FROM {duplicates} UNION ALL BY NAME {select}"
+            con.execute(f"CREATE OR REPLACE TABLE {duplicates} AS {select}")
+        if removed:
+            con.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rid FROM _dedup_rowids)")
+    finally:
+        con.execute("DROP TABLE IF EXISTS _dedup_rowids")
+    return removed
+
+
+def dedup_incremental(con, table_name, keys, policy='last', file_order=None, loaded=(), stale=(),
+                      source_column=SOURCE_COLUMN):
+    """
+    增量导入后的去重: 只重新比较本次涉及的键，不需要重新导入整月的文件
+    涉及的键为本次写入的行的键，以及 {表名}_duplicates 中在明细表已没有对应行的键 (保留的行所在文件已变化或移除)；
+    这些键在未变化文件中的行 (明细表中保留的行和之前去掉的重复行) 按原来的先后重新写入后，与新写入的行一起比较
+    调用前新文件已写入、变化/移除文件的旧行已删除；还没有 {表名}_duplicates (之前未去重) 时整表去重
+    :param file_order: 当前所有来源文件键的先后顺序 (见 file_priority)
+    :param loaded: 本次写入的来源文件键
+    :param stale: 已删除旧行的来源文件键 (变化或移除的文件)
+    :return: (删除的行数, 明细行有变化的未变化文件键列表，需要更新其汇总)
+    """
+    table = _quote(table_name)
+    duplicates = _quote(table_name + DUPLICATES_SUFFIX)
+    source = _quote(source_column)
+    key_sql = ", ".join(_quote(k) for k in keys)
+    loaded = list(loaded)
+    if not _table_exists(con, table_name + DUPLICATES_SUFFIX):
+        removed = dedup_table(con, table_name, keys, policy, file_order, source_column)
+        affected = con.execute(f"SELECT DISTINCT {source} FROM {duplicates} "
+                               f"WHERE {source} NOT IN (SELECT unnest($1::VARCHAR[])) ORDER BY 1", [loaded])
+        return removed, [r[0] for r in affected.fetchall()]
+
+    con.execute(f"DELETE FROM {duplicates} WHERE {source} IN (SELECT unnest($1::VARCHAR[]))",
+                [list(stale) + loaded])
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _dedup_keys AS "
+                f"SELECT DISTINCT {key_sql} FROM {table} "
+                f"WHERE {_valid_keys_sql(keys)} AND {source} IN (SELECT unnest($1::VARCHAR[])) "
+                f"UNION (SELECT DISTINCT {key_sql} FROM {duplicates} EXCEPT SELECT DISTINCT {key_sql} FROM {table})",
+                [loaded])
+    try:
+        # 涉及的键在未变化文件中的行: 明细表中保留的行 + 之前去掉的重复行
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _dedup_kept AS SELECT rowid AS rid, * FROM {table} "
+                    f"WHERE {_key_in_sql(keys, '_dedup_keys')} "
+                    f"AND {source} NOT IN (SELECT unnest($1::VARCHAR[]))", [loaded])
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _dedup_restored AS "
+                    f"SELECT * FROM {duplicates} WHERE {_key_in_sql(keys, '_dedup_keys')}")
+        affected = [r[0] for r in con.execute(
+            f"SELECT {source} FROM _dedup_kept UNION SELECT {source} FROM _dedup_restored ORDER BY 1").fetchall()]
+        if affected:
+            # 同一文件内的先后由 rowid 决定: 保留 'first' 时保留的行在前，'last' / 'latest_file' 时在后
+            con.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rid FROM _dedup_kept)")
+            con.execute(f"DELETE FROM {duplicates} WHERE {_key_in_sql(keys, '_dedup_keys')}")
+            parts = ["SELECT * EXCLUDE (rid) FROM _dedup_kept ORDER BY rid", "SELECT * FROM _dedup_restored"]
+            if policy != 'first':
+                parts.reverse()
+            for part in parts:
+                con.execute(f"INSERT INTO {table} BY NAME {part}")
+        removed = dedup_table(con, table_name, keys, policy, file_order, source_column,
+                              key_table='_dedup_keys', append_duplicates=True)
+    finally:
+        for name in ('_dedup_keys', '_dedup_kept', '_dedup_restored'):
+            con.execute(f"DROP TABLE IF EXISTS {name}")
+    return removed, affected
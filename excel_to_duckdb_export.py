@@ -0,0 +1,201 @@
+import csv
+import datetime
+import decimal
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from excel_to_duckdb_reader import READ_BATCH_SIZE, build_select_sql
+from excel_to_duckdb_resources import connect
+
+# 导出到 Excel / CSV: 查询结果按批 (fetchmany) 取回，逐行写入 write_only 模式的工作簿 (行数据随写随落盘)，
+# 内存占用与结果行数无关。单个工作表最多 EXCEL_MAX_ROWS 行 (含表头)，超出时按 SPLIT_MODE 拆分:
+# - 'sheet': 同一文件中继续写入新的工作表 (Sheet1, Sheet1_2, ...)
+# - 'file': 写入新的文件 (明细.xlsx, 明细_2.xlsx, ...)
+# CSV 没有工作表，超出时总是拆分为多个文件，保证每个文件都能在 Excel 中完整打开
+EXCEL_MAX_ROWS = 1048576
+SPLIT_MODE = 'sheet'
+EXPORT_FORMATS = ('xlsx', 'csv')
+# 按月结卡号并行导出的进程数 (openpyxl 写入持有 GIL，线程无法并行)
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+# xlsx 中不允许的控制字符 (与 openpyxl.cell.cell.ILLEGAL_CHARACTERS_RE 相同，openpyxl 遇到时抛出异常)
+_ILLEGAL_CHARACTERS = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+
+def _open(con_or_path):
+    """传入数据库路径时以只读方式打开 (返回 连接, 是否需要关闭)"""
+    if isinstance(con_or_path, str):
+        return connect(con_or_path, read_only=True), True
+    return con_or_path, False
+
+
+def export_format(output):
+    """由输出文件扩展名确定格式 ('xlsx' 或 'csv')"""
+    ext = os.path.splitext(output)[1].lower().lstrip('.')
+    if ext not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {output}，可选 {list(EXPORT_FORMATS)}")
+    return ext
+
+
+def part_path(output, index):
+    """第 index 个输出文件的路径 (第一个为 output 本身，之后为 名称_2.扩展名 ...)"""
+    if index <= 1:
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}_{index}{ext}"
+
+
+def _iter_rows(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _xlsx_cell(value):
+    """DuckDB 返回值转换为 openpyxl 可写入的值: 去掉字符串中的非法控制字符和时间的时区，其它未知类型转为字符串"""
+    if value is None or isinstance(value, (int, float, decimal.Decimal)):
+        return value
+    if isinstance(value, str):
+        return _ILLEGAL_CHARACTERS.sub('', value) if _ILLEGAL_CHARACTERS.search(value) else value
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        return value
+    return str(value)
+
+
+def _write_xlsx(rows, headers, output, split, max_rows, sheet_name, on_rows):
+    import openpyxl
+
+    per_part = max_rows - 1
+    files = []
+    total = 0
+    wb = ws = None
+    sheet_index = part_rows = 0
+
+    def save():
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        path = part_path(output, len(files) + 1)
+        wb.save(path)
+        files.append(path)
+
+    for row in rows:
+        if ws is None or part_rows >= per_part:
+            if wb is not None and split == 'file':
+                save()
+                wb = None
+            if wb is None:
+                wb = openpyxl.Workbook(write_only=True)
+                sheet_index = 0
+            sheet_index += 1
+            ws = wb.create_sheet(sheet_name if sheet_index == 1 else f"{sheet_name}_{sheet_index}")
+            ws.append(headers)
+            part_rows = 0
+        ws.append([_xlsx_cell(v) for v in row])
+        part_rows += 1
+        total += 1
+        if on_rows and total % READ_BATCH_SIZE == 0:
+            on_rows(total)
+    if wb is None:
+        # 结果为空时也输出只有表头的文件
+        wb = openpyxl.Workbook(write_only=True)
+        wb.create_sheet(sheet_name).append(headers)
+    save()
+    return files, total
+
+
+def _write_csv(rows, headers, output, max_rows, on_rows):
+    per_part = max_rows - 1 if max_rows else None
+    files = []
+    total = 0
+    f = writer = None
+    part_rows = 0
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    try:
+        for row in rows:
+            if writer is None or (per_part and part_rows >= per_part):
+                if f is not None:
+                    f.close()
+                path = part_path(output, len(files) + 1)
+                # utf-8-sig: Excel 打开时能正确识别中文
+                f = open(path, 'w', encoding='utf-8-sig', newline='')
+                files.append(path)
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                part_rows = 0
+            writer.writerow(row)
+            part_rows += 1
+            total += 1
+            if on_rows and total % READ_BATCH_SIZE == 0:
+                on_rows(total)
+        if writer is None:
+            with open(output, 'w', encoding='utf-8-sig', newline='') as empty:
+                csv.writer(empty).writerow(headers)
+            files.append(output)
+    finally:
+        if f is not None:
+            f.close()
+    return files, total
+
+
+def export_query(con_or_path, sql, output, params=None, split=SPLIT_MODE, max_rows=EXCEL_MAX_ROWS,
+                 batch_size=READ_BATCH_SIZE, sheet_name='Sheet1', on_rows=None):
+    """
+    将查询结果流式导出到 xlsx 或 CSV (由 output 的扩展名决定)
+    :param con_or_path: DuckDB 连接或数据库文件路径 (以只读方式打开)
+    :param split: 'sheet' 或 'file'，单个工作表超过 max_rows 行 (含表头) 时的拆分方式；CSV 总是拆分为多个文件
+    :param max_rows: 每个工作表 / CSV 文件的最大行数 (含表头)
+    :param on_rows: 进度回调 on_rows(已导出行数)，每 READ_BATCH_SIZE 行调用一次
+    :return: (输出文件列表, 导出的行数)
+    """
+    fmt = export_format(output)
+    if split not in ('sheet', 'file'):
+        raise ValueError(f"未知的拆分方式: {split}，可选 ['sheet', 'file']")
+    con, owned = _open(con_or_path)
+    try:
+        cursor = con.execute(sql, params or [])
+        headers = [d[0] for d in cursor.description]
+        rows = _iter_rows(cursor, batch_size)
+        if fmt == 'csv':
+            return _write_csv(rows, headers, output, max_rows, on_rows)
+        return _write_xlsx(rows, headers, output, split, max_rows, sheet_name, on_rows)
+    finally:
+        if owned:
+            con.close()
+
+
+def export_table(db_path, table_name, output, columns=None, where=None, params=None, split=SPLIT_MODE,
+                 max_rows=EXCEL_MAX_ROWS, batch_size=READ_BATCH_SIZE):
+    """导出数据库文件中的一张表 (可选投影和过滤)，返回 (输出文件列表, 导出的行数)"""
+    return export_query(db_path, build_select_sql(table_name, columns, where), output, params, split, max_rows,
+                        batch_size, sheet_name=table_name[:31])
+
+
+def export_months(month_dbs, output_dir, table_name='sftable', fmt='xlsx', columns=None, where=None, params=None,
+                  split=SPLIT_MODE, max_rows=EXCEL_MAX_ROWS, workers=EXPORT_WORKERS, log=print):
+    """
+    每个月结卡号的明细表导出为 output_dir/{month_id}.{fmt}，workers > 1 时由进程池并行导出
+    调用方在 spawn 方式 (Windows) 下需要有 __main__ 保护
+    :param month_dbs: {month_id: 数据库路径}
+    :return: {month_id: (输出文件列表, 导出的行数)}，按 month_dbs 的顺序
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选 {list(EXPORT_FORMATS)}")
+    tasks = {month_id: (db_path, table_name, os.path.join(output_dir, f"{month_id}.{fmt}"), columns, where, params,
+                        split, max_rows)
+             for month_id, db_path in month_dbs.items()}
+    results = {}
+    if workers <= 1 or len(tasks) <= 1:
+        for month_id, task in tasks.items():
+            results[month_id] = export_table(*task)
+            log(f"已导出月结卡号 {month_id}: {results[month_id][1]} 行 -> {', '.join(results[month_id][0])}")
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {month_id: executor.submit(export_table, *task) for month_id, task in tasks.items()}
+        for month_id, future in futures.items():
+            results[month_id] = future.result()
+            log(f"已导出月结卡号 {month_id}: {results[month_id][1]} 行 -> {', '.join(results[month_id][0])}")
+    return results
@@ -1,25 +1,101 @@
 import sys
 import os
 import time
-import duckdb
-import pandas as pd
-import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import python_calamine
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QListWidget, QLabel, 
-                             QProgressBar, QTextEdit, QFileDialog, QMessageBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject
+                             QProgressBar, QTextEdit, QFileDialog, QMessageBox, QCheckBox,
+                             QDialog, QTableWidget, QTableWidgetItem)
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QObject
+from excel_to_duckdb_processor import (save_excel_to_duckdb_streaming, save_excel_sheets_to_duckdb,
+                                       save_sheet_sharded, safe_table_name, ProcessingCancelled, CHUNK_SIZE,
+                                       SHEET_MODE)
+from excel_to_duckdb_sink import SINKS
+from excel_to_duckdb_preview import preview_workbook
+from excel_to_duckdb_metrics import STAGE_LABELS, StageMetrics, new_run_id, emit as emit_metrics
+
+# 同时转换的文件数
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
 
 # 核心处理逻辑类
 class ExcelProcessor(QObject):
     progress_signal = pyqtSignal(int)
+    # 单个文件的行级进度: (文件路径, 已写入行数, 总行数，未知时为 0)
+    file_progress_signal = pyqtSignal(str, int, int)
+    # 单个文件结束: (文件路径, 状态 done / error / cancelled)
+    file_finished_signal = pyqtSignal(str, str)
+    # 单个文件的阶段耗时更新: (文件路径, 阶段名, 该阶段累计秒数)
+    stage_signal = pyqtSignal(str, str, float)
     log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
-    def __init__(self, file_paths):
+    def __init__(self, file_paths, streaming=True, chunk_size=CHUNK_SIZE, incremental=True, sinks=SINKS,
+                 sheets=None, sheet_mode=SHEET_MODE, max_workers=MAX_WORKERS):
         super().__init__()
         self.file_paths = file_paths
         self.is_running = True
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._done_files = 0
+        # 进行中的文件: {文件路径: 完成比例}
+        self._in_flight = {}
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.sinks = sinks
+        # 工作表选择: None 只读取第一个工作表，'*' 全部，字符串按正则匹配，列表按名称
+        self.sheets = sheets
+        self.sheet_mode = sheet_mode
+        self.run_id = new_run_id()
+
+    def stop(self):
+        """请求取消: 未开始的文件不再处理，进行中的文件在下一个数据块边界中止并回滚"""
+        self.is_running = False
+
+    def _check_cancelled(self, *_):
+        if not self.is_running:
+            raise ProcessingCancelled()
+
+    def _emit_progress(self):
+        with self._lock:
+            done = self._done_files + sum(self._in_flight.values())
+        self.progress_signal.emit(int(done / len(self.file_paths) * 100))
+
+    def _run_one(self, file_path):
+        self._check_cancelled()
+        with self._lock:
+            self._in_flight[file_path] = 0.0
+        self.file_progress_signal.emit(file_path, 0, 0)
+        total = [0]
+
+        def on_total(n):
+            total[0] = n
+            self.file_progress_signal.emit(file_path, 0, n)
+
+        def on_chunk(n):
+            self._check_cancelled()
+            if total[0]:
+                with self._lock:
+                    self._in_flight[file_path] = min(n / total[0], 1.0)
+            self.file_progress_signal.emit(file_path, n, total[0])
+            self._emit_progress()
+
+        metrics = StageMetrics('gui', file_path, self.run_id,
+                               on_stage=lambda name, seconds: self.stage_signal.emit(file_path, name, seconds))
+        status = 'error'
+        try:
+            self.process_file(file_path, on_chunk=on_chunk, on_total=on_total, metrics=metrics)
+            status = 'ok'
+        except ProcessingCancelled:
+            status = 'cancelled'
+            raise
+        finally:
+            emit_metrics(metrics.records(status, metrics.rows.get('write')))
+        if metrics.seconds:
+            self.log_signal.emit(f"  {os.path.basename(file_path)} 分阶段耗时: {metrics.breakdown()}")
 
     def run(self):
         total_files = len(self.file_paths)
@@ -28,23 +104,34 @@ class ExcelProcessor(QObject):
             self.finished_signal.emit()
             return
 
-        for index, file_path in enumerate(self.file_paths):
-            if not self.is_running:
-                break
-            
-            try:
-                self.process_file(file_path)
-            except Exception as e:
-                self.log_signal.emit(f"处理文件 {file_path} 时发生错误: {str(e)}")
-            
-            # 更新进度
-            progress = int((index + 1) / total_files * 100)
-            self.progress_signal.emit(progress)
-        
-        self.log_signal.emit("所有任务处理完成！")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._run_one, file_path): file_path for file_path in self.file_paths}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    future.result()
+                    status = 'done'
+                except ProcessingCancelled:
+                    status = 'cancelled'
+                except Exception as e:
+                    status = 'error'
+                    self.log_signal.emit(f"处理文件 {file_path} 时发生错误: {str(e)}")
+
+                # 更新进度 (取消的文件不计入已完成)
+                with self._lock:
+                    self._in_flight.pop(file_path, None)
+                    if status != 'cancelled':
+                        self._done_files += 1
+                self.file_finished_signal.emit(file_path, status)
+                self._emit_progress()
+
+        if self.is_running:
+            self.log_signal.emit("所有任务处理完成！")
+        else:
+            self.log_signal.emit("任务已取消，未完成的文件已回滚。")
         self.finished_signal.emit()
 
-    def process_file(self, excel_path):
+    def process_file(self, excel_path, on_chunk=None, on_total=None, metrics=None):
         filename = os.path.basename(excel_path)
         base_name = os.path.splitext(filename)[0]
         
@@ -54,49 +141,72 @@ class ExcelProcessor(QObject):
             os.makedirs(output_dir)
             
         db_path = os.path.join(output_dir, f"{base_name}.duckdb")
-        table_name = "excel_data" # 或者使用文件名 base_name
 
         self.log_signal.emit(f"正在读取: {filename}")
         t_start = time.time()
 
+        # 创建表，表名使用文件名（清理非法字符）
+        table_name = safe_table_name(base_name)
+        parquet_dir = os.path.join(os.path.dirname(excel_path), "parquet_output")
+
+        if self.sheets is not None:
+            # 多工作表: 并发解析，写入同一张表 (附加 sheet_name 列) 或每个工作表一张表
+            sheet_counts = save_excel_sheets_to_duckdb(excel_path, db_path, table_name, self.sheets,
+                                                       self.sheet_mode, self.chunk_size, on_chunk=on_chunk,
+                                                       incremental=self.incremental, sinks=self.sinks,
+                                                       parquet_dir=parquet_dir, metrics=metrics)
+            if sheet_counts is None:
+                self.log_signal.emit(f"跳过: {filename} 自上次导入后未变化")
+                return
+            t_end = time.time()
+            self.log_signal.emit(f"成功: {filename} 已保存 {len(sheet_counts)} 个工作表 {sheet_counts}，"
+                                 f"耗时 {t_end - t_start:.2f} 秒")
+            return
+
+        if self.streaming:
+            # 流式模式: 按块读取并追加写入，不物化整表的 Python 行列表 (calamine 仍解码整张工作表)
+            row_count = save_excel_to_duckdb_streaming(excel_path, db_path, table_name, self.chunk_size,
+                                                       on_chunk=on_chunk, incremental=self.incremental,
+                                                       sinks=self.sinks, parquet_dir=parquet_dir,
+                                                       on_total=on_total, metrics=metrics)
+            if row_count is None:
+                self.log_signal.emit(f"跳过: {filename} 自上次导入后未变化")
+                return
+            if row_count == 0:
+                self.log_signal.emit(f"警告: {filename} 内容为空")
+                return
+            t_end = time.time()
+            targets = [db_path] if 'duckdb' in self.sinks else []
+            if 'parquet' in self.sinks:
+                targets.append(os.path.join(parquet_dir, f"{table_name}.parquet"))
+            self.log_signal.emit(f"成功: 已保存至 {', '.join(targets)} (表名: {table_name}，{row_count} 行)，耗时 {t_end - t_start:.2f} 秒")
+            return
+
+        metrics = metrics or StageMetrics('gui', excel_path)
         try:
             # 使用 calamine 读取 Excel
-            with open(excel_path, 'rb') as f_r:
-                xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
-                if xls.sheet_names:
-                    # 默认读取第一个 sheet
-                    sheet_data = xls.get_sheet_by_index(0).to_python()
-                else:
-                    self.log_signal.emit(f"警告: {filename} 没有工作表")
-                    return
+            with metrics.stage('read'):
+                with open(excel_path, 'rb') as f_r:
+                    xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
+                    if xls.sheet_names:
+                        # 默认读取第一个 sheet
+                        sheet_data = xls.get_sheet_by_index(0).to_python()
+                    else:
+                        self.log_signal.emit(f"警告: {filename} 没有工作表")
+                        return
 
             if not sheet_data:
                 self.log_signal.emit(f"警告: {filename} 内容为空")
                 return
 
-            # 数据处理
-            headers = [str(h) for h in sheet_data[0]] 
-            rows = sheet_data[1:]
-
-            pd.set_option('future.no_silent_downcasting', True)
-            df = pd.DataFrame(rows, columns=headers)
-            # 将空字符串替换为 NaN
-            df = df.replace('', np.nan).infer_objects(copy=False)
+            # 识别表头行、过滤合计行和空行、转换并写入 (大表按行范围分段，多进程并行转换)；
+            # 同时处理 max_workers 个文件，各文件分得的转换进程数相应减少，避免超出 CPU 核数
+            save_sheet_sharded(sheet_data, db_path, table_name,
+                               workers=max(1, (os.cpu_count() or 1) // self.max_workers),
+                               metrics=metrics, on_chunk=on_chunk)
 
-            # 写入 DuckDB
-            con = duckdb.connect(db_path)
-            con.register('df_view', df)
-            
-            # 创建表，表名使用文件名（清理非法字符）
-            safe_table_name = "".join([c if c.isalnum() else "_" for c in base_name])
-            if safe_table_name[0].isdigit():
-                safe_table_name = "t_" + safe_table_name
-                
-            con.execute(f"CREATE OR REPLACE TABLE {safe_table_name} AS SELECT * FROM df_view")
-            con.close()
-            
             t_end = time.time()
-            self.log_signal.emit(f"成功: 已保存至 {db_path} (表名: {safe_table_name})，耗时 {t_end - t_start:.2f} 秒")
+            self.log_signal.emit(f"成功: 已保存至 {db_path} (表名: {table_name})，耗时 {t_end - t_start:.2f} 秒")
 
         except Exception as e:
             raise e
@@ -136,11 +246,37 @@ class DragDropListWidget(QListWidget):
         self.add_files(files)
 
     def add_files(self, files):
-        existing_items = [self.item(i).text() for i in range(self.count())]
+        existing_items = {self.item(i).text() for i in range(self.count())}
         for file_path in files:
             if file_path not in existing_items:
+                existing_items.add(file_path)
                 self.addItem(file_path)
 
+# 预览对话框
+class PreviewDialog(QDialog):
+    def __init__(self, file_path, info, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"预览 - {os.path.basename(file_path)}")
+        self.resize(900, 400)
+        layout = QVBoxLayout(self)
+
+        rows_text = "未知" if info['estimated_rows'] is None else (
+            f"{info['estimated_rows']}" if info['exact'] else f"约 {info['estimated_rows']}")
+        layout.addWidget(QLabel(f"工作表: {', '.join(info['sheet_names'])}\n"
+                                f"当前工作表: {info['sheet']}，数据行数: {rows_text}，"
+                                f"读取耗时 {info['seconds'] * 1000:.0f} 毫秒"))
+
+        table = QTableWidget(len(info['rows']), len(info['headers']))
+        table.setHorizontalHeaderLabels(info['headers'])
+        for r, row in enumerate(info['rows']):
+            for c, value in enumerate(row[:len(info['headers'])]):
+                table.setItem(r, c, QTableWidgetItem("" if value is None else str(value)))
+        layout.addWidget(table)
+
+        btn_close = QPushButton("关闭")
+        btn_close.clicked.connect(self.accept)
+        layout.addWidget(btn_close)
+
 # 主窗口
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -175,9 +311,21 @@ class MainWindow(QMainWindow):
         self.btn_clear.clicked.connect(self.file_list.clear)
         btn_layout.addWidget(self.btn_clear)
 
+        self.btn_preview = QPushButton("预览")
+        self.btn_preview.clicked.connect(self.preview_selected)
+        btn_layout.addWidget(self.btn_preview)
+
+        self.chk_parquet = QCheckBox("同时输出 Parquet")
+        btn_layout.addWidget(self.chk_parquet)
+
         self.btn_start = QPushButton("开始转换")
         self.btn_start.clicked.connect(self.start_processing)
         btn_layout.addWidget(self.btn_start)
+
+        self.btn_cancel = QPushButton("取消")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancel_processing)
+        btn_layout.addWidget(self.btn_cancel)
         
         layout.addLayout(btn_layout)
 
@@ -185,6 +333,15 @@ class MainWindow(QMainWindow):
         self.progress_bar = QProgressBar()
         layout.addWidget(self.progress_bar)
 
+        # 进行中文件的行级进度 (定时刷新，避免大量文件时频繁重绘)
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+        self.file_status = {}
+        self.file_stages = {}
+        self.status_timer = QTimer(self)
+        self.status_timer.setInterval(200)
+        self.status_timer.timeout.connect(self.refresh_status)
+
         # 日志输出
         layout.addWidget(QLabel("执行日志："))
         self.log_text = QTextEdit()
@@ -211,6 +368,20 @@ class MainWindow(QMainWindow):
                         files.append(os.path.join(root, filename))
             self.file_list.add_files(files)
 
+    def preview_selected(self):
+        """预览选中的文件 (未选中时预览第一个): 只读取开头几行，不解码整张表"""
+        item = self.file_list.currentItem() or self.file_list.item(0)
+        if item is None:
+            QMessageBox.warning(self, "提示", "请先添加文件！")
+            return
+        file_path = item.text()
+        try:
+            info = preview_workbook(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "预览失败", f"{os.path.basename(file_path)}: {e}")
+            return
+        PreviewDialog(file_path, info, self).exec_()
+
     def start_processing(self):
         count = self.file_list.count()
         if count == 0:
@@ -223,20 +394,29 @@ class MainWindow(QMainWindow):
         self.btn_clear.setEnabled(False)
         self.btn_add_files.setEnabled(False)
         self.btn_add_dir.setEnabled(False)
+        self.chk_parquet.setEnabled(False)
         self.file_list.setEnabled(False)
+        self.btn_cancel.setEnabled(True)
         self.progress_bar.setValue(0)
+        self.file_status = {}
+        self.file_stages = {}
+        self.status_timer.start()
         self.log_text.clear()
         self.log("开始处理...")
 
         # 创建线程和工作对象
         self.thread = QThread()
-        self.worker = ExcelProcessor(file_paths)
+        sinks = ('duckdb', 'parquet') if self.chk_parquet.isChecked() else ('duckdb',)
+        self.worker = ExcelProcessor(file_paths, sinks=sinks)
         self.worker.moveToThread(self.thread)
 
         # 连接信号
         self.thread.started.connect(self.worker.run)
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.log_signal.connect(self.log)
+        self.worker.file_progress_signal.connect(self.update_file_progress)
+        self.worker.file_finished_signal.connect(self.file_finished)
+        self.worker.stage_signal.connect(self.update_file_stage)
         self.worker.finished_signal.connect(self.thread.quit)
         self.worker.finished_signal.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.thread.deleteLater)
@@ -244,19 +424,57 @@ class MainWindow(QMainWindow):
 
         self.thread.start()
 
+    def cancel_processing(self):
+        # 直接设置取消标志 (工作线程正忙，排队的槽函数不会及时执行)
+        if self.worker is not None:
+            self.worker.stop()
+        self.btn_cancel.setEnabled(False)
+        self.log("正在取消...")
+
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
+    def update_file_progress(self, file_path, rows, total):
+        self.file_status[file_path] = (rows, total)
+
+    def update_file_stage(self, file_path, stage, seconds):
+        self.file_stages.setdefault(file_path, {})[stage] = seconds
+
+    def file_finished(self, file_path, status):
+        self.file_status.pop(file_path, None)
+        self.file_stages.pop(file_path, None)
+
+    def refresh_status(self):
+        parts = []
+        for file_path, (rows, total) in list(self.file_status.items()):
+            name = os.path.basename(file_path)
+            if total:
+                text = f"{name}: {rows}/{total} 行 ({rows * 100 // total}%)"
+            else:
+                text = f"{name}: {rows} 行"
+            # 实时的分阶段耗时，便于看出瓶颈在读取还是写入
+            stages = self.file_stages.get(file_path)
+            if stages:
+                text += " [" + " ".join(f"{STAGE_LABELS.get(stage, stage)} {seconds:.1f}s"
+                                        for stage, seconds in stages.items()) + "]"
+            parts.append(text)
+        self.status_label.setText("处理中 — " + "；".join(parts) if parts else "")
+
     def log(self, message):
         self.log_text.append(message)
         # 滚动到底部
         self.log_text.verticalScrollBar().setValue(self.log_text.verticalScrollBar().maximum())
 
     def processing_finished(self):
+        self.status_timer.stop()
+        self.status_label.setText("")
+        self.btn_cancel.setEnabled(False)
+        self.worker = None
         self.btn_start.setEnabled(True)
         self.btn_clear.setEnabled(True)
         self.btn_add_files.setEnabled(True)
         self.btn_add_dir.setEnabled(True)
+        self.chk_parquet.setEnabled(True)
         self.file_list.setEnabled(True)
         QMessageBox.information(self, "完成", "处理完成！")
 
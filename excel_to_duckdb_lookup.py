@@ -0,0 +1,214 @@
+import os
+
+from excel_to_duckdb_manifest import SOURCE_COLUMN
+from excel_to_duckdb_catalog import MONTH_COLUMN, month_databases
+from excel_to_duckdb_resources import connect
+from excel_to_duckdb_pool import fan_out
+
+# 运单查找: "运单 X 在哪个月结卡号的哪个账单里"
+# - 各月结卡号数据库的明细表在运单号码列上建 ART 索引 (增量导入时随插入/删除维护，只有放宽列类型或整表重建时
+#   才删除后在写入事务中重建)，按运单号取明细只读索引命中的行
+# - 全局运单表 WAYBILL_INDEX_PATH 只保存 (运单号, month_id, 来源文件) 并建 ART 索引，
+#   查找时只打开这一个小库，不需要 ATTACH 或扫描所有月结卡号数据库
+# DuckDB 只对 "列 = 常量" / "列 IN (常量列表)" 使用 ART 索引 (预编译参数 ? 不走索引)，
+# 因此查询中的运单号以转义后的字面量拼接，每批最多 LOOKUP_BATCH_SIZE 个
+WAYBILL_COLUMN = '运单号码'
+WAYBILL_INDEX_PATH = os.path.join("duckdb_catalog", "waybill_index.duckdb")
+WAYBILL_TABLE = 'waybills'
+INDEX_SUFFIX = '_waybill_idx'
+LOOKUP_BATCH_SIZE = 1000
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _column_types(con, table_name, database=None):
+    """表的 {列名: 类型}；表不存在时为空 dict"""
+    sql = "SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = ?"
+    params = [table_name]
+    if database:
+        sql += " AND database_name = ?"
+        params.append(database)
+    return dict(con.execute(sql, params).fetchall())
+
+
+def _batches(values, size=LOOKUP_BATCH_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def normalize_waybills(waybills):
+    """去掉首尾空白和空值，按输入顺序去重"""
+    return list(dict.fromkeys(str(w).strip() for w in waybills if w is not None and str(w).strip()))
+
+
+def index_name(table_name):
+    return f"{table_name}{INDEX_SUFFIX}"
+
+
+def drop_waybill_index(con, table_name='sftable'):
+    """删除明细表的运单索引 (有索引的表不能修改列类型，修改前先删除，之后由 create_waybill_index 重建)"""
+    con.execute(f"DROP INDEX IF EXISTS {_quote(index_name(table_name))}")
+
+
+def create_waybill_index(con, table_name='sftable', column=WAYBILL_COLUMN):
+    """
+    在明细表的运单号码列上建 ART 索引 (已存在时不重复建)
+    :return: 表中有该列并已建索引时为 True
+    """
+    if column not in _column_types(con, table_name):
+        return False
+    con.execute(f"CREATE INDEX IF NOT EXISTS {_quote(index_name(table_name))} "
+                f"ON {_quote(table_name)} ({_quote(column)})")
+    return True
+
+
+def _waybill_sql(alias, table_name, column, month_id, has_source):
+    source = f"CAST({_quote(SOURCE_COLUMN)} AS VARCHAR)" if has_source else "NULL::VARCHAR"
+    waybill = f"TRIM(CAST({_quote(column)} AS VARCHAR))"
+    return (f"SELECT DISTINCT {waybill} AS waybill, {_literal(month_id)} AS {_quote(MONTH_COLUMN)}, "
+            f"{source} AS source_file FROM {alias}.{_quote(table_name)} WHERE NULLIF({waybill}, '') IS NOT NULL")
+
+
+def refresh_waybill_index(month_dbs, index_path=WAYBILL_INDEX_PATH, table_name='sftable', column=WAYBILL_COLUMN,
+                          changed=None, log=print):
+    """
+    更新全局运单表 (运单号, month_id, 来源文件)
+    :param month_dbs: 当前所有的 {month_id: 数据库路径}
+    :param changed: 本次有变化需要重新载入的 month_id；None 时整体重建。已不存在的月结卡号总是删除
+    :return: 全局运单表的行数
+    """
+    if isinstance(month_dbs, str):
+        month_dbs = month_databases(month_dbs)
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    con = connect(index_path)
+    try:
+        exists = bool(_column_types(con, WAYBILL_TABLE))
+        if not exists:
+            changed = None
+        if changed is None:
+            to_load = dict(month_dbs)
+            to_delete = []
+        else:
+            existing = {r[0] for r in con.execute(
+                f"SELECT DISTINCT {_quote(MONTH_COLUMN)} FROM {WAYBILL_TABLE}").fetchall()}
+            to_load = {m: p for m, p in month_dbs.items() if m in set(changed) or m not in existing}
+            to_delete = [m for m in existing if m not in month_dbs or m in to_load]
+            if not (to_load or to_delete):
+                return con.execute(f"SELECT COUNT(*) FROM {WAYBILL_TABLE}").fetchone()[0]
+        log(f"正在{'重建' if changed is None else '更新'}运单索引 {index_path}: "
+            f"载入 {len(to_load)} 个，删除 {len(to_delete)} 个月结卡号")
+
+        # 事务中不能 DETACH，各库在事务开始前 ATTACH、提交后 DETACH
+        aliases = {}
+        for i, (month_id, db_path) in enumerate(sorted(to_load.items())):
+            con.execute(f"ATTACH {_literal(db_path)} AS m{i} (READ_ONLY)")
+            aliases[month_id] = f"m{i}"
+        try:
+            con.begin()
+            try:
+                # 索引在批量写入后整体重建，比逐行维护快
+                con.execute(f"DROP INDEX IF EXISTS {WAYBILL_TABLE}_idx")
+                if changed is None:
+                    con.execute(f"CREATE OR REPLACE TABLE {WAYBILL_TABLE} (waybill VARCHAR, "
+                                f"{_quote(MONTH_COLUMN)} VARCHAR, source_file VARCHAR)")
+                elif to_delete:
+                    placeholders = ', '.join(['?'] * len(to_delete))
+                    con.execute(f"DELETE FROM {WAYBILL_TABLE} WHERE {_quote(MONTH_COLUMN)} IN ({placeholders})",
+                                to_delete)
+                for month_id, alias in aliases.items():
+                    columns = _column_types(con, table_name, alias)
+                    if column in columns:
+                        con.execute(f"INSERT INTO {WAYBILL_TABLE} "
+                                    f"{_waybill_sql(alias, table_name, column, month_id, SOURCE_COLUMN in columns)}")
+                con.execute(f"CREATE INDEX {WAYBILL_TABLE}_idx ON {WAYBILL_TABLE} (waybill)")
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+        finally:
+            for alias in aliases.values():
+                con.execute(f"DETACH {alias}")
+        return con.execute(f"SELECT COUNT(*) FROM {WAYBILL_TABLE}").fetchone()[0]
+    finally:
+        con.close()
+
+
+def _in_list(values, column_type):
+    """运单号字面量列表；列不是文本类型时转换为列的类型 (无法转换的为 NULL，不会匹配)"""
+    if column_type == 'VARCHAR':
+        return ", ".join(_literal(v) for v in values)
+    return ", ".join(f"TRY_CAST({_literal(v)} AS {column_type})" for v in values)
+
+
+def _scan_month(con, table_name, column, waybills, select):
+    """在一个月结卡号数据库中按索引查找，返回 (列名, 行列表)"""
+    column_type = _column_types(con, table_name).get(column)
+    if column_type is None:
+        return [], []
+    headers, rows = [], []
+    for batch in _batches(waybills):
+        cursor = con.execute(f"SELECT {select} FROM {_quote(table_name)} "
+                             f"WHERE {_quote(column)} IN ({_in_list(batch, column_type)})")
+        headers = [d[0] for d in cursor.description]
+        rows.extend(cursor.fetchall())
+    return headers, rows
+
+
+def locate_waybills(waybills, index_path=WAYBILL_INDEX_PATH, db_dir=None, table_name='sftable',
+                    column=WAYBILL_COLUMN, pool=None):
+    """
+    查找运单所在的月结卡号和账单文件
+    :param waybills: 运单号列表
+    :param db_dir: 全局运单表不存在时，改为并行查找该目录下的各月结卡号数据库 (使用各库的 ART 索引)
+    :param pool: 查找各月结卡号数据库时使用的只读连接池 (excel_to_duckdb_pool.ConnectionPool)
+    :return: [(运单号, month_id, 来源文件)]，按输入的运单顺序；未找到的运单不出现，同一运单可能出现在多个月
+    """
+    waybills = normalize_waybills(waybills)
+    found = []
+    if os.path.exists(index_path):
+        con = connect(index_path, read_only=True)
+        try:
+            for batch in _batches(waybills):
+                found.extend(con.execute(
+                    f"SELECT waybill, {_quote(MONTH_COLUMN)}, source_file FROM {WAYBILL_TABLE} "
+                    f"WHERE waybill IN ({_in_list(batch, 'VARCHAR')})").fetchall())
+        finally:
+            con.close()
+    elif db_dir:
+        source = f"CAST({_quote(SOURCE_COLUMN)} AS VARCHAR)"
+
+        def scan(cur, month_id):
+            has_source = SOURCE_COLUMN in _column_types(cur, table_name)
+            select = (f"DISTINCT TRIM(CAST({_quote(column)} AS VARCHAR)), {_literal(month_id)}, "
+                      f"{source if has_source else 'NULL'}")
+            return _scan_month(cur, table_name, column, waybills, select)[1]
+
+        for _, rows in fan_out(month_databases(db_dir), scan, pool=pool):
+            found.extend(rows)
+    else:
+        raise FileNotFoundError(f"运单索引不存在: {index_path}")
+    order = {w: i for i, w in enumerate(waybills)}
+    return sorted(found, key=lambda r: (order.get(r[0], len(order)), r[1]))
+
+
+def fetch_waybill_rows(waybills, db_dir, table_name='sftable', column=WAYBILL_COLUMN, located=None, pool=None):
+    """
+    读取运单的明细行 (各月结卡号数据库并行查询)
+    :param located: locate_waybills 的结果；给出时只打开包含这些运单的月结卡号数据库
+    :param pool: 只读连接池 (excel_to_duckdb_pool.ConnectionPool)；None 时使用临时连接池
+    :return: [(month_id, 列名, 行列表)]，各月结卡号的列可能不同
+    """
+    waybills = normalize_waybills(waybills)
+    month_dbs = month_databases(db_dir)
+    if located is not None:
+        months = {r[1] for r in located}
+        month_dbs = {m: p for m, p in month_dbs.items() if m in months}
+    results = fan_out(month_dbs, lambda cur, month_id: _scan_month(cur, table_name, column, waybills, '*'),
+                      pool=pool)
+    return [(month_id, headers, rows) for month_id, (headers, rows) in results if rows]
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+
+# 记录每行来源文件的列，增量更新时按该列删除已移除或已变化文件的数据
+SOURCE_COLUMN = '_source_file'
+# 版本变化时旧清单失效，所有文件重新导入 (2: 导入时识别表头并过滤合计行，旧数据需要重新清理)
+MANIFEST_VERSION = 2
+
+
+def manifest_path(db_path):
+    """清单文件与数据库文件放在一起: xxx.duckdb -> xxx.manifest.json"""
+    return os.path.splitext(db_path)[0] + '.manifest.json'
+
+
+def load_manifest(db_path):
+    """读取清单，返回 {文件键: 指纹}；清单不存在、损坏或数据库文件不存在时返回空 dict"""
+    path = manifest_path(db_path)
+    if not os.path.exists(path) or not os.path.exists(db_path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    return data.get('files', {})
+
+
+def save_manifest(db_path, files):
+    """写入清单 (先写临时文件再替换，避免中途中断留下半个文件)"""
+    path = manifest_path(db_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """计算文件内容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, previous=None):
+    """
+    计算文件指纹 (路径、大小、修改时间、内容哈希)
+    :param previous: 清单中已有的指纹；大小和修改时间都未变时直接沿用其哈希，不再读取文件
+    """
+    stat = os.stat(path)
+    fingerprint = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+        fingerprint['sha256'] = previous.get('sha256')
+    else:
+        fingerprint['sha256'] = file_hash(path)
+    return fingerprint
+
+
+def plan_changes(manifest, files):
+    """
+    对比清单与当前文件列表
+    :param manifest: load_manifest 返回的 {文件键: 指纹}
+    :param files: {文件键: 文件路径}
+    :return: (unchanged, changed, added, removed, fingerprints)
+             前四项为文件键列表，fingerprints 为当前文件的 {文件键: 指纹}
+    """
+    unchanged, changed, added = [], [], []
+    fingerprints = {}
+    for key, path in files.items():
+        previous = manifest.get(key)
+        fingerprint = file_fingerprint(path, previous)
+        fingerprints[key] = fingerprint
+        if previous is None:
+            added.append(key)
+        elif previous.get('sha256') == fingerprint['sha256']:
+            unchanged.append(key)
+        else:
+            changed.append(key)
+    removed = [key for key in manifest if key not in files]
+    return unchanged, changed, added, removed, fingerprints
+
+
+def delete_source_rows(con, table_name, keys, max_rowid=None):
+    """
+    按来源文件键删除表中的行
+    :param max_rowid: 只删除 rowid 不大于该值的行 (即写入新数据之前已存在的行)
+    """
+    if not keys:
+        return
+    placeholders = ', '.join(['?'] * len(keys))
+    sql = f'DELETE FROM {table_name} WHERE "{SOURCE_COLUMN}" IN ({placeholders})'
+    params = list(keys)
+    if max_rowid is not None:
+        sql += ' AND rowid <= ?'
+        params.append(max_rowid)
+    con.execute(sql, params)
+
+
+def is_unchanged(db_path, excel_path, table_name):
+    """单文件单表的场景 (processor / GUI): 判断该文件自上次导入后是否未变化"""
+    previous = load_manifest(db_path).get(os.path.basename(excel_path))
+    if not previous or previous.get('table') != table_name:
+        return False
+    return file_fingerprint(excel_path, previous)['sha256'] == previous.get('sha256')
+
+
+def record_file(db_path, excel_path, table_name, rows):
+    """单文件单表的场景: 导入成功后记录文件指纹"""
+    files = load_manifest(db_path) if os.path.exists(db_path) else {}
+    key = os.path.basename(excel_path)
+    fingerprint = file_fingerprint(excel_path, files.get(key))
+    fingerprint.update(table=table_name, rows=rows)
+    files[key] = fingerprint
+    save_manifest(db_path, files)
@@ -0,0 +1,209 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 分阶段性能记录: 每个文件 (或月结卡号) 的各阶段耗时、行数、行/秒、进程峰值内存和输出大小，
+# 每个阶段一条记录，写入 JSON lines 文件或 DuckDB 指标表，便于汇总分析耗时分布
+# METRICS_SINK: 'jsonl' 追加到 metrics/metrics.jsonl；'duckdb' 写入 metrics/metrics.duckdb 的 metrics 表；None 不输出
+METRICS_SINK = 'jsonl'
+METRICS_DIR = "metrics"
+METRICS_TABLE = 'metrics'
+
+# 阶段的中文名称 (GUI 显示用)
+STAGE_LABELS = {
+    'plan': '比对清单',
+    'open': '打开',
+    'read': '读取',
+    'clean': '清理',
+    'schema': '结构',
+    'convert': '转换',
+    'write': '写入',
+    'wait': '等待解析',
+    'delete': '删除',
+    'dedup': '去重',
+    'commit': '提交',
+    'export': '导出',
+    'manifest': '清单',
+    'attach': '挂载',
+    'summarize': '汇总',
+    'index': '索引',
+    'save': '保存',
+}
+
+_emit_lock = threading.Lock()
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存 (MB)；无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def output_bytes(paths):
+    """输出文件 (含 .wal) 或目录 (如 Parquet 分区目录) 的总字节数"""
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        else:
+            for p in (path, path + '.wal'):
+                if os.path.exists(p):
+                    total += os.path.getsize(p)
+    return total
+
+
+def new_run_id():
+    """一次运行的标识 (时间戳 + 进程号)，同一次运行的记录可以按它汇总"""
+    return f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+
+
+class StageMetrics:
+    """
+    记录一个处理单元 (文件 / 月结卡号) 的分阶段耗时
+    阶段可以嵌套或交替: 每个阶段记录的是 "独占" 时间，嵌套在其中的其它阶段的耗时会被扣除。
+    可以在多个线程中同时记录 (如解析线程与写入线程)，嵌套扣除只计算同一线程内的阶段，
+    因此流水线中重叠执行的各阶段耗时之和可能大于总耗时
+    """
+
+    def __init__(self, component, source, run_id=None, on_stage=None):
+        """
+        :param component: 组件名 (processor / sf1 / sf2 / gui)
+        :param source: 处理对象 (文件路径或月结卡号)
+        :param on_stage: 每次阶段耗时更新后的回调 on_stage(阶段名, 该阶段累计秒数)，用于实时显示
+        """
+        self.component = component
+        self.source = source
+        self.run_id = run_id or new_run_id()
+        self.on_stage = on_stage
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self.rows = {}
+        self._lock = threading.Lock()
+        # 每个线程已记录的阶段耗时之和，用于计算嵌套阶段的独占时间
+        self._local = threading.local()
+
+    def _recorded(self):
+        return getattr(self._local, 'recorded', 0.0)
+
+    def add(self, name, seconds, rows=None):
+        """累加一个阶段的耗时 (和处理行数)"""
+        self._local.recorded = self._recorded() + seconds
+        with self._lock:
+            self.seconds[name] = total = self.seconds.get(name, 0.0) + seconds
+            if rows is not None:
+                self.rows[name] = self.rows.get(name, 0) + rows
+        if self.on_stage:
+            self.on_stage(name, total)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """计时上下文: with metrics.stage('write'): ..."""
+        recorded_before = self._recorded()
+        t_start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - t_start
+            nested = self._recorded() - recorded_before
+            self.add(name, max(elapsed - nested, 0.0), rows)
+
+    def set_rows(self, name, rows):
+        self.rows[name] = rows
+
+    def records(self, status='ok', rows=None, outputs=()):
+        """
+        生成指标记录: 每个阶段一条，另加一条 stage='total' 的汇总 (含输出大小和状态)
+        :param rows: 总行数 (用于计算 total 的行/秒)
+        :param outputs: 输出文件/目录路径
+        """
+        ts = datetime.datetime.now().isoformat(timespec='seconds')
+        peak = peak_rss_mb()
+        base = {'run_id': self.run_id, 'ts': ts, 'component': self.component, 'source': str(self.source)}
+        result = []
+        for name, seconds in self.seconds.items():
+            stage_rows = self.rows.get(name)
+            result.append(dict(base, stage=name, seconds=round(seconds, 4), rows=stage_rows,
+                               rows_per_sec=round(stage_rows / seconds, 1) if stage_rows and seconds > 0 else None,
+                               peak_rss_mb=peak, output_bytes=None, status=status))
+        total = time.perf_counter() - self.started
+        result.append(dict(base, stage='total', seconds=round(total, 4), rows=rows,
+                           rows_per_sec=round(rows / total, 1) if rows and total > 0 else None,
+                           peak_rss_mb=peak, output_bytes=output_bytes(outputs) if outputs else None,
+                           status=status))
+        return result
+
+    def breakdown(self):
+        """各阶段耗时的简短文本，如 "读取 1.20s 写入 0.80s" """
+        return " ".join(f"{STAGE_LABELS.get(name, name)} {seconds:.2f}s" for name, seconds in self.seconds.items())
+
+
+def timed_chunks(chunks, metrics, stage='read', count=True):
+    """
+    包装块迭代器，把取下一块的耗时计入 stage，块中的行数计入该阶段行数
+    可以多层包装 (如 读取 -> 清理)，内层已记录的耗时会从外层扣除
+    :param count: 为 False 时只计时，不把块的长度计入行数 (如产出的是 (文件, 数据) 元组)
+    """
+    it = iter(chunks)
+    while True:
+        recorded_before = metrics._recorded()
+        t_start = time.perf_counter()
+        chunk = next(it, None)
+        nested = metrics._recorded() - recorded_before
+        metrics.add(stage, max(time.perf_counter() - t_start - nested, 0.0),
+                    len(chunk) if chunk and count else (0 if count else None))
+        if chunk is None:
+            return
+        yield chunk
+
+
+_COLUMNS = [('run_id', 'VARCHAR'), ('ts', 'TIMESTAMP'), ('component', 'VARCHAR'), ('source', 'VARCHAR'),
+            ('stage', 'VARCHAR'), ('seconds', 'DOUBLE'), ('rows', 'BIGINT'), ('rows_per_sec', 'DOUBLE'),
+            ('peak_rss_mb', 'DOUBLE'), ('output_bytes', 'BIGINT'), ('status', 'VARCHAR')]
+
+
+def emit(records, sink=METRICS_SINK, metrics_dir=METRICS_DIR):
+    """
+    输出指标记录 (线程安全；多进程场景应由主进程统一输出)
+    :param records: StageMetrics.records() 的结果 (可以是多个单元的记录合并后的列表)
+    :param sink: 'jsonl' / 'duckdb' / None
+    :return: 输出文件路径；不输出时为 None
+    """
+    if not sink or not records:
+        return None
+    os.makedirs(metrics_dir, exist_ok=True)
+    with _emit_lock:
+        if sink == 'jsonl':
+            path = os.path.join(metrics_dir, 'metrics.jsonl')
+            with open(path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            return path
+
+        from excel_to_duckdb_resources import connect
+
+        path = os.path.join(metrics_dir, 'metrics.duckdb')
+        con = connect(path)
+        try:
+            cols_def = ", ".join(f'{name} {col_type}' for name, col_type in _COLUMNS)
+            con.execute(f"CREATE TABLE IF NOT EXISTS {METRICS_TABLE} ({cols_def})")
+            placeholders = ", ".join(['?'] * len(_COLUMNS))
+            con.executemany(f"INSERT INTO {METRICS_TABLE} VALUES ({placeholders})",
+                            [[r.get(name) for name, _ in _COLUMNS] for r in records])
+        finally:
+            con.close()
+        return path
@@ -0,0 +1,80 @@
+import collections
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 解析/写入流水线: 解析 (calamine 解码、行数据清理) 在后台线程中进行，写入由调用线程 (唯一持有 DuckDB 连接的写入者)
+# 按顺序完成，两者重叠执行；队列有界，写入跟不上时解析线程阻塞等待，内存中最多缓存 PIPELINE_DEPTH 份解析结果
+PIPELINE_DEPTH = 2
+# 同时解析的文件数 (SF-1 中每个月结卡号进程内的解析线程数)
+PARSE_WORKERS = 2
+
+_END = object()
+
+
+def prefetch(iterable, depth=PIPELINE_DEPTH):
+    """
+    在后台线程中迭代 iterable (如逐块读取并清理行数据)，通过有界队列交给调用线程
+    :param depth: 队列容量，即最多预先准备好的块数
+    :return: 生成器，按原顺序产出各项；后台线程的异常在调用线程中重新抛出。
+             调用方提前结束 (异常、取消) 时后台线程在下一次放入队列时退出
+    """
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+
+    thread = threading.Thread(target=produce, name='excel-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def parse_ahead(parse, items, max_workers=PARSE_WORKERS, depth=PIPELINE_DEPTH):
+    """
+    由解析线程池提前解析后续各项 (如逐个文件 calamine 解码)，按 items 的顺序产出 (项, 解析结果)
+    调用方在处理 (写入) 当前项时，后续最多 depth 项已在解析或已解析完成
+    :param parse: 解析函数 parse(项)，在解析线程中执行，不能使用调用方的 DuckDB 连接
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='excel-parse') as executor:
+        pending = collections.deque((item, executor.submit(parse, item)) for item in itertools.islice(items, depth))
+        try:
+            while pending:
+                item, future = pending.popleft()
+                # 结果放在临时列表中交出，本帧不再保留引用，调用方写入后释放数据即可回收内存
+                result = [future.result()]
+                del future
+                # 先提交下一项再交出当前结果，写入当前项时解析线程不空闲
+                for next_item in itertools.islice(items, 1):
+                    pending.append((next_item, executor.submit(parse, next_item)))
+                yield item, result.pop()
+        finally:
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,129 @@
+import collections
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from excel_to_duckdb_resources import connect
+
+# 只读连接池: 按数据库文件缓存只读连接，超过 POOL_SIZE 个时关闭最久未使用的连接；
+# 同一批文件反复查询 (如多次透视、逐个运单查明细) 时不再重复打开/关闭数据库
+# 注意: 只读连接持有文件的共享锁，其它进程 (如 SF-1 导入) 在连接关闭前不能写入该文件，
+# 因此缓存期间数据不会变化；连接池应在一批查询结束后关闭
+POOL_SIZE = 32
+# 并行查询多个数据库文件的线程数；DuckDB 执行查询时释放 GIL，各文件的查询可以同时进行
+FAN_OUT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class ConnectionPool:
+    """
+    只读 DuckDB 连接的 LRU 缓存，可在多个线程中使用
+    每个线程通过 cursor() 取得各自的游标，连接对象本身不跨线程共享
+    """
+
+    def __init__(self, max_size=POOL_SIZE):
+        self.max_size = max_size
+        self._connections = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _acquire(self, db_path):
+        """取得数据库文件的只读连接并增加使用计数"""
+        key = os.path.abspath(db_path)
+        evicted = []
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                # [连接, 使用中的游标数, 是否已移出池]
+                entry = [connect(key, read_only=True), 0, False]
+                self._connections[key] = entry
+            self._connections.move_to_end(key)
+            entry[1] += 1
+            while len(self._connections) > self.max_size:
+                evicted.append(self._connections.popitem(last=False)[1])
+            closable = self._retire(evicted)
+        for con in closable:
+            con.close()
+        return entry
+
+    @staticmethod
+    def _retire(entries):
+        """标记移出池的连接，返回可以立即关闭的 (没有游标在使用的) 连接；其余在最后一个游标释放时关闭"""
+        for entry in entries:
+            entry[2] = True
+        return [entry[0] for entry in entries if entry[1] == 0]
+
+    def _release(self, entry):
+        with self._lock:
+            entry[1] -= 1
+            close = entry[2] and entry[1] == 0
+        if close:
+            entry[0].close()
+
+    @contextmanager
+    def cursor(self, db_path):
+        """
+        在当前线程中使用的游标 (同一数据库实例上的独立连接)，用完即关闭，连接仍保留在池中；
+        游标使用期间该连接即使被移出池也不会关闭
+        """
+        entry = self._acquire(db_path)
+        try:
+            cur = entry[0].cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+        finally:
+            self._release(entry)
+
+    def close(self):
+        """关闭池中的所有连接 (正在使用的在游标释放后关闭)"""
+        with self._lock:
+            closable = self._retire(list(self._connections.values()))
+            self._connections.clear()
+        for con in closable:
+            con.close()
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fan_out(db_paths, query, params=None, max_workers=FAN_OUT_WORKERS, pool=None):
+    """
+    对多个数据库文件执行同一查询，由线程池并行执行，按 db_paths 的顺序合并结果
+    :param db_paths: {键 (如 month_id): 数据库路径} 或路径列表 (键为路径本身)
+    :param query: SQL 语句 (返回 fetchall() 的结果)，或函数 query(游标, 键) 返回任意结果
+    :param params: SQL 语句的参数
+    :param pool: ConnectionPool；None 时使用临时连接池，查询结束后关闭
+    :return: [(键, 结果)]；任一文件查询失败时抛出该异常
+    """
+    if not isinstance(db_paths, dict):
+        db_paths = {path: path for path in db_paths}
+    if isinstance(query, str):
+        sql = query
+
+        def query(cur, key):
+            return cur.execute(sql, params or []).fetchall()
+
+    owned = pool is None
+    if owned:
+        pool = ConnectionPool(max(len(db_paths), 1))
+
+    def run(item):
+        key, db_path = item
+        with pool.cursor(db_path) as cur:
+            return key, query(cur, key)
+
+    try:
+        if max_workers <= 1 or len(db_paths) <= 1:
+            return [run(item) for item in db_paths.items()]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='duckdb-fan-out') as executor:
+            return list(executor.map(run, db_paths.items()))
+    finally:
+        if owned:
+            pool.close()
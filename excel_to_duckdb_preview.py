@@ -0,0 +1,258 @@
+import datetime
+import os
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+from excel_to_duckdb_clean import HEADER_SCAN_ROWS, detect_header, clean_rows
+
+# 快速预览: calamine 打开工作表时会解码整张表，预览大文件和完整转换一样慢。
+# .xlsx/.xlsm 直接流式解析压缩包中的工作表 XML，读到所需行数即停止；
+# 行数从工作表的 <dimension> 读取 (没有时按已读字节数估算)。其它格式回退到 calamine。
+PREVIEW_ROWS = 10
+# 工作表没有 <dimension> 时，继续扫描 (只计数不解码) 到该字节数，按已扫描部分的行密度估算总行数
+ESTIMATE_BYTES = 1024 * 1024
+
+_CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+# 内置的日期/时间数字格式编号 (含中文区域的日期格式)
+_DATE_FORMAT_IDS = set(range(14, 23)) | set(range(27, 37)) | {45, 46, 47} | set(range(50, 59))
+
+
+def _local(tag):
+    """去掉命名空间的标签名 (兼容 transitional 与 strict 两种命名空间)"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _attr(elem, name):
+    """按本地名读取属性 (r:id 等带命名空间的属性)"""
+    for key, value in elem.attrib.items():
+        if _local(key) == name:
+            return value
+    return None
+
+
+def _column_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def _is_date_format(code):
+    # 去掉引号内的文本、[颜色]/[$-区域] 段和转义字符后，包含日期时间占位符即视为日期格式
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', '', code).lower()
+    return bool(re.search(r'[ydhsm]', code))
+
+
+class _CountingReader:
+    """记录已读取字节数的文件包装，用于在没有 <dimension> 时估算总行数"""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def _workbook_sheets(zf):
+    """返回 ([(工作表名, 压缩包内路径)], 是否 1904 日期系统)"""
+    root = ET.fromstring(zf.read('xl/workbook.xml'))
+    rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    targets = {}
+    for rel in rels:
+        target = rel.get('Target', '')
+        targets[rel.get('Id')] = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    sheets = []
+    date1904 = False
+    for elem in root.iter():
+        tag = _local(elem.tag)
+        if tag == 'sheet':
+            sheets.append((elem.get('name'), targets.get(_attr(elem, 'id'))))
+        elif tag == 'workbookPr':
+            date1904 = elem.get('date1904') in ('1', 'true')
+    return sheets, date1904
+
+
+def _date_styles(zf):
+    """样式表中使用日期格式的单元格样式下标集合"""
+    if 'xl/styles.xml' not in zf.namelist():
+        return set()
+    root = ET.fromstring(zf.read('xl/styles.xml'))
+    custom = {}
+    date_styles = set()
+    for elem in root:
+        if _local(elem.tag) == 'numFmts':
+            for fmt in elem:
+                custom[int(fmt.get('numFmtId'))] = fmt.get('formatCode', '')
+        elif _local(elem.tag) == 'cellXfs':
+            for i, xf in enumerate(elem):
+                fmt_id = int(xf.get('numFmtId', 0))
+                if fmt_id in _DATE_FORMAT_IDS or (fmt_id in custom and _is_date_format(custom[fmt_id])):
+                    date_styles.add(i)
+    return date_styles
+
+
+def _shared_strings(zf):
+    """
+    按需读取共享字符串: 只解析到被引用的最大下标为止，不加载整个共享字符串表
+    :return: get(index) 函数
+    """
+    cache = []
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return lambda index: ''
+    events = ET.iterparse(zf.open('xl/sharedStrings.xml'), events=('end',))
+
+    def get(index):
+        while len(cache) <= index:
+            try:
+                _, elem = next(events)
+            except StopIteration:
+                break
+            if _local(elem.tag) == 'si':
+                # 富文本由多个 <r><t> 组成；<rPh> 为注音，不属于文本内容
+                cache.append(''.join(t.text or '' for r in elem if _local(r.tag) != 'rPh'
+                                     for t in r.iter() if _local(t.tag) == 't'))
+                elem.clear()
+        return cache[index] if index < len(cache) else ''
+
+    return get
+
+
+def _cell_value(cell, get_string, date_styles, epoch):
+    cell_type = cell.get('t', 'n')
+    value = None
+    for child in cell:
+        tag = _local(child.tag)
+        if tag == 'v':
+            value = child.text
+        elif tag == 'is':
+            value = ''.join(t.text or '' for t in child.iter() if _local(t.tag) == 't')
+    if value is None:
+        return ''
+    if cell_type == 's':
+        return get_string(int(value))
+    if cell_type in ('str', 'inlineStr', 'e'):
+        return value
+    if cell_type == 'b':
+        return value == '1'
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if int(cell.get('s', 0)) in date_styles:
+        if number.is_integer():
+            return (epoch + datetime.timedelta(days=number)).date()
+        # 与 calamine 一致，精确到毫秒 (消除浮点误差)
+        return epoch + datetime.timedelta(milliseconds=round(number * 86400000))
+    # 与 calamine 一致，数值统一为 float
+    return number
+
+
+def _preview_xlsx(path, sheet, max_rows):
+    """流式解析工作表 XML 的前 max_rows 行，返回 (工作表名列表, 工作表名, 行列表, 表中首行行号, 估计总行数)"""
+    with zipfile.ZipFile(path) as zf:
+        sheets, date1904 = _workbook_sheets(zf)
+        names = [name for name, _ in sheets]
+        if isinstance(sheet, int):
+            name, sheet_path = sheets[sheet]
+        elif sheet is None:
+            name, sheet_path = sheets[0]
+        else:
+            name, sheet_path = sheets[names.index(sheet)]
+        epoch = datetime.datetime(1904, 1, 1) if date1904 else datetime.datetime(1899, 12, 30)
+        date_styles = _date_styles(zf)
+        get_string = _shared_strings(zf)
+
+        reader = _CountingReader(zf.open(sheet_path))
+        total_bytes = zf.getinfo(sheet_path).file_size
+        last_row = None
+        row_number = 0
+        rows = {}
+        complete = True
+        for _, elem in ET.iterparse(reader, events=('end',)):
+            tag = _local(elem.tag)
+            if tag == 'dimension':
+                refs = _CELL_REF_RE.findall(elem.get('ref', ''))
+                if refs:
+                    last_row = int(refs[-1][1])
+            elif tag == 'row':
+                row_number = int(elem.get('r', row_number + 1))
+                if len(rows) < max_rows:
+                    cells = {}
+                    for i, cell in enumerate(c for c in elem if _local(c.tag) == 'c'):
+                        ref = _CELL_REF_RE.match(cell.get('r', ''))
+                        col = _column_index(ref.group(1)) if ref else i
+                        cells[col] = _cell_value(cell, get_string, date_styles, epoch)
+                    if any(v != '' for v in cells.values()):
+                        rows[row_number] = cells
+                elem.clear()
+                if len(rows) >= max_rows and (last_row is not None or reader.bytes_read >= ESTIMATE_BYTES):
+                    complete = False
+                    break
+        if last_row is None:
+            # 读完整个工作表时行号即为总行数，否则按已扫描部分的每行字节数估算
+            last_row = row_number if complete else round(row_number * total_bytes / reader.bytes_read)
+
+    if not rows:
+        return names, name, [], 1, 0
+    first_row = min(rows)
+    first_col = min(min(cells) for cells in rows.values() if cells)
+    width = max(max(cells) for cells in rows.values() if cells) - first_col + 1
+    table = []
+    for row_number in range(first_row, max(rows) + 1):
+        cells = rows.get(row_number, {})
+        table.append([cells.get(first_col + i, '') for i in range(width)])
+    return names, name, table, first_row, last_row
+
+
+def _preview_calamine(path, sheet, max_rows):
+    """其它格式 (.xls/.xlsb/.ods) 由 calamine 读取，仍需解码整张表，但只转换前 max_rows 行"""
+    import python_calamine
+
+    xls = python_calamine.CalamineWorkbook.from_path(path)
+    names = list(xls.sheet_names)
+    if isinstance(sheet, int):
+        ws = xls.get_sheet_by_index(sheet)
+    elif sheet is None:
+        ws = xls.get_sheet_by_index(0)
+    else:
+        ws = xls.get_sheet_by_name(sheet)
+    return names, ws.name, ws.to_python(nrows=max_rows), 1, ws.height
+
+
+def preview_workbook(path, nrows=PREVIEW_ROWS, sheet=None):
+    """
+    快速预览工作簿: 只读取开头的若干行，识别表头，返回样例数据和估计行数
+    :param path: Excel 文件路径
+    :param nrows: 样例数据行数
+    :param sheet: 工作表名或下标，None 为第一个工作表
+    :return: dict(sheet_names, sheet, headers, rows, estimated_rows, exact, method, seconds)
+             estimated_rows 为表头之后的行数 (可能包含合计行)；exact 表示该行数是否精确
+    """
+    t_start = time.time()
+    scan_rows = HEADER_SCAN_ROWS + nrows
+    if os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm'):
+        names, name, table, first_row, last_row = _preview_xlsx(path, sheet, scan_rows)
+        method = 'xml'
+    else:
+        names, name, table, first_row, last_row = _preview_calamine(path, sheet, scan_rows)
+        method = 'calamine'
+
+    header_index = detect_header(table) if table else 0
+    headers = [str(h) for h in table[header_index]] if table else []
+    rows = clean_rows(table[header_index + 1:])[:nrows]
+    estimated_rows = max(last_row - (first_row + header_index), 0) if last_row is not None else None
+    return {
+        'sheet_names': names,
+        'sheet': name,
+        'headers': headers,
+        'rows': rows,
+        'estimated_rows': estimated_rows,
+        'exact': method == 'calamine',
+        'method': method,
+        'seconds': time.time() - t_start,
+    }
@@ -1,15 +1,46 @@
 import python_calamine
-import duckdb
+import io
+import multiprocessing
 import os
+import re
+import shutil
+import tempfile
+import threading
 import time
-import pandas as pd
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from excel_to_duckdb_clean import split_header, iter_clean_chunks, detect_header, clean_rows
+from excel_to_duckdb_columnar import rows_to_columns
+from excel_to_duckdb_manifest import is_unchanged, record_file
+from excel_to_duckdb_reader import iter_batches
+from excel_to_duckdb_metrics import StageMetrics, timed_chunks, emit as emit_metrics
+from excel_to_duckdb_pipeline import PIPELINE_DEPTH, prefetch
+from excel_to_duckdb_sink import SINKS, PARQUET_DIR, open_staging, export_parquet
+from excel_to_duckdb_resources import connect
 
 # 配置
 EXCEL_FILE = "sample_data.xlsx"
 DB_DIR = "duckdb_output"
 DB_PATH = os.path.join(DB_DIR, f"{EXCEL_FILE.split('.')[0]}.duckdb")
 TABLE_NAME = EXCEL_FILE.split('.')[0]
+# 流式模式: 按块读取行并追加写入 DuckDB，不把整张表转换为 Python 列表 (每行一个 list，比原始数据大数倍)；
+# 但 calamine 打开工作表时仍会解码整张表，峰值内存随解码后的工作表大小增长，并非只与块大小有关
+STREAMING = True
+CHUNK_SIZE = 50000
+# 多工作表: SHEETS 为 None 时只读取第一个工作表；'*' 读取全部，字符串按正则匹配表名，列表按名称选择
+# SHEET_MODE 为 'union' 时写入同一张表并附加 sheet_name 列，'per_sheet' 时每个工作表一张表
+SHEETS = None
+SHEET_MODE = 'union'
+SHEET_WORKERS = min(4, os.cpu_count() or 1)
+# 增量模式: 文件自上次导入后未变化 (大小/修改时间/内容哈希) 时跳过
+INCREMENTAL = True
+# 流水线: 逐块读取、清理和列式转换在后台线程中进行，与写入 DuckDB 重叠，最多预读 PIPELINE_DEPTH 块；
+# 单核机器上没有并行收益，默认串行
+PIPELINE = (os.cpu_count() or 1) > 1
+# 整表 (非流式) 转换的分段并行: 数据行按行范围分为至多 SHARD_WORKERS 段，每段不少于 SHARD_MIN_ROWS 行，
+# 各段在独立进程中清理和转换 (pandas 转换持有 GIL，线程无法并行)；
+# 在主线程中调用时以 fork 启动 (共享行数据)，在其它线程中 (如 GUI 的工作线程) 以 spawn 启动，避免 fork 多线程进程
+SHARD_WORKERS = os.cpu_count() or 1
+SHARD_MIN_ROWS = 100000
 
 def save_excel_to_duckdb(excel_path, db_path, table_name):
     """读取 Excel 并保存到 DuckDB"""
@@ -37,33 +68,506 @@ def save_excel_to_duckdb(excel_path, db_path, table_name):
             print("错误: Excel 文件为空！")
             return False
 
-        # 3. 数据处理
-        headers = [str(h) for h in sheet_data[0]] 
-        rows = sheet_data[1:]
+        # 3. 识别表头行，过滤合计行和空行，借助 Pandas 处理数据 (空值、类型推断) 并写入 DuckDB；
+        # 数据行较多且有多个 CPU 核时按行范围分段并行转换
+        row_count = save_sheet_sharded(sheet_data, db_path, table_name)
 
-        # 4. 借助 Pandas 处理数据（处理空值等）
-        pd.set_option('future.no_silent_downcasting', True)
-        df = pd.DataFrame(rows, columns=headers)
-        # 将空字符串替换为 NaN，以便 DuckDB 正确识别为 NULL
-        df = df.replace('', np.nan).infer_objects(copy=False)
-
-        # 5. 写入 DuckDB
-        con = duckdb.connect(db_path)
-        # 注册 dataframe 到 duckdb
-        con.register('df_view', df)
-        
-        # 创建表
-        con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df_view")
-        con.close()
-        
         t_end = time.time()
-        print(f"成功: 表 '{table_name}' 已创建。耗时 {t_end - t_start:.2f} 秒。")
+        print(f"成功: 表 '{table_name}' 已创建 ({row_count} 行)。耗时 {t_end - t_start:.2f} 秒。")
         return True
 
     except Exception as e:
         print(f"错误: {e}")
         return False
 
+class ProcessingCancelled(Exception):
+    """处理被用户取消 (由进度回调抛出，用于中止正在进行的写入)"""
+
+
+def iter_row_chunks(rows_iter, chunk_size=CHUNK_SIZE):
+    """将行迭代器切分为固定大小的块 (list of rows)"""
+    chunk = []
+    for row in rows_iter:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def columns_to_frame(headers, columns):
+    """由列数组构建 DataFrame（逐列构建，避免行式二维对象数组的中间拷贝）"""
+    import pandas as pd
+
+    df = pd.DataFrame(dict(enumerate(columns)), copy=False)
+    df.columns = headers
+    return df.infer_objects()
+
+
+def _column_types(con, relation):
+    """返回 relation 各列的 DuckDB 类型列表"""
+    return [r[1] for r in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()]
+
+
+def _widen_table(con, table_name, headers, chunk_types, null_columns, untyped):
+    """
+    当新块的列类型与表不一致时放宽表的列类型，避免后续块插入失败或被静默截断；
+    新块中出现表里没有的列时补充该列 (已有行为 NULL)
+    :param untyped: 首块中全为空 (类型未知) 的列名集合，遇到非空数据时直接改为该块的类型
+    """
+    table_types = dict(zip(_column_names(con, table_name), _column_types(con, table_name)))
+    for i, (name, c_type) in enumerate(zip(headers, chunk_types)):
+        t_type = table_types.get(name)
+        if t_type is None:
+            new_type = 'VARCHAR' if i in null_columns else c_type
+            con.execute(f'ALTER TABLE {table_name} ADD COLUMN "{name}" {new_type}')
+            continue
+        if i in null_columns or t_type == c_type:
+            continue
+        if name in untyped:
+            # 首块中全为空的列建表时多为 VARCHAR，需先于下面的 VARCHAR 判断改为实际类型
+            new_type = c_type
+            untyped.discard(name)
+        elif t_type == 'VARCHAR':
+            continue
+        elif t_type in ('INTEGER', 'BIGINT') and c_type in ('INTEGER', 'BIGINT', 'DOUBLE'):
+            new_type = 'BIGINT' if c_type == 'INTEGER' else c_type
+        elif t_type == 'DOUBLE' and c_type in ('INTEGER', 'BIGINT'):
+            continue
+        else:
+            new_type = 'VARCHAR'
+        if new_type != t_type:
+            con.execute(f'ALTER TABLE {table_name} ALTER "{name}" TYPE {new_type}')
+
+
+def _column_names(con, relation):
+    """返回 relation 的列名列表"""
+    return [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()]
+
+
+def chunk_frame(headers, rows, extra_columns=None):
+    """
+    将一个行块转换为列式 DataFrame
+    :return: (DataFrame, 全为空的列下标集合, 行数)
+    """
+    columns, null_columns = rows_to_columns(rows, len(headers))
+    chunk_df = columns_to_frame(headers, columns)
+    for name, value in (extra_columns or {}).items():
+        chunk_df[name] = value
+    return chunk_df, null_columns, len(rows)
+
+
+def append_rows_streaming(con, table_name, headers, row_chunks, replace=True, on_chunk=None,
+                          extra_columns=None):
+    """
+    将行块逐块以列式批次追加到 DuckDB 表 (按列名插入，表中缺少的列会自动补充)
+    :param con: DuckDB 连接
+    :param table_name: 目标表名
+    :param headers: 列名列表
+    :param row_chunks: 行块迭代器 (见 iter_row_chunks)；也可以是已由 chunk_frame 转换好的块，
+                       流水线模式下转换在解析线程中完成
+    :param replace: 为 True 时由首块重建表 (CREATE OR REPLACE)，否则追加到已有表；
+                    没有数据块 (只有表头) 时按表头建空表，列类型均为 VARCHAR
+    :param on_chunk: 每写入一块后的回调 on_chunk(累计行数)
+    :param extra_columns: 附加的常量列 {列名: 值}，如 {'sheet_name': 'Sheet1'}
+    :return: 写入的总行数
+    """
+    total = 0
+    untyped = set()
+    created = not replace
+    extra_columns = extra_columns or {}
+    all_headers = list(headers) + list(extra_columns)
+    for chunk in row_chunks:
+        chunk_df, null_columns, n = chunk if isinstance(chunk, tuple) else chunk_frame(headers, chunk, extra_columns)
+        con.register('chunk_view', chunk_df)
+        try:
+            if not created:
+                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM chunk_view")
+                untyped = {headers[i] for i in null_columns}
+                created = True
+            else:
+                _widen_table(con, table_name, all_headers, _column_types(con, 'chunk_view'), null_columns, untyped)
+                con.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM chunk_view")
+        finally:
+            con.unregister('chunk_view')
+        total += n
+        # 释放当前块，同一时间只有一块行数据以 Python 对象的形式存在
+        del chunk, chunk_df
+        if on_chunk:
+            on_chunk(total)
+    if not created:
+        chunk_df = chunk_frame(headers, [], extra_columns)[0]
+        con.register('chunk_view', chunk_df)
+        try:
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT COLUMNS(*)::VARCHAR FROM chunk_view")
+        finally:
+            con.unregister('chunk_view')
+    return total
+
+
+def _rows_frame(headers, rows):
+    """整表转换: DataFrame + 空字符串替换为 NaN (DuckDB 识别为 NULL) + 类型推断"""
+    import pandas as pd
+    import numpy as np
+
+    pd.set_option('future.no_silent_downcasting', True)
+    df = pd.DataFrame(rows, columns=headers)
+    return df.replace('', np.nan).infer_objects(copy=False)
+
+
+# fork 启动的转换进程直接继承的工作表数据，不经过 pickle
+_SHARD_SOURCE = None
+
+
+def _convert_shard(headers, start, end, shard_path, rows=None):
+    """
+    转换进程: 清理并转换 [start, end) 范围的行，写入独立的临时数据库 shard_path 的 shard 表
+    :param rows: 该范围的行数据；None 时从继承的 _SHARD_SOURCE 中切片
+    :return: (行数, 全为空的列下标集合)
+    """
+    import numpy as np
+
+    rows = clean_rows(_SHARD_SOURCE[start:end] if rows is None else rows)
+    df = _rows_frame(headers, rows)
+    null_columns = set(np.flatnonzero(df.isna().all().to_numpy()).tolist())
+    con = connect(shard_path)
+    try:
+        con.register('df_view', df)
+        con.execute("CREATE TABLE shard AS SELECT * FROM df_view")
+    finally:
+        con.close()
+    return len(df), null_columns
+
+
+def shard_ranges(start, end, workers=SHARD_WORKERS, min_rows=SHARD_MIN_ROWS):
+    """按行范围把 [start, end) 切分为至多 workers 段，每段不少于 min_rows 行"""
+    shards = max(1, min(workers, (end - start) // max(min_rows, 1)))
+    bounds = [start + (end - start) * i // shards for i in range(shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def save_sheet_sharded(sheet_data, db_path, table_name, workers=SHARD_WORKERS, metrics=None, on_chunk=None):
+    """
+    将已物化的工作表 (to_python() 的结果) 写入 DuckDB 表；数据行较多时按行范围分段，
+    由多个进程并行清理 (合计行/空行) 和转换 (DataFrame、空值替换、类型推断)，各段写入临时数据库后
+    在一个事务中按顺序合并到同一张表，列类型不一致时按 _widen_table 的规则放宽
+    :param workers: 转换进程数；为 1 或行数不足 2 * SHARD_MIN_ROWS 时在当前进程中整表转换
+    :param on_chunk: 每转换完一段后的回调 on_chunk(已转换的行数)；回调抛出异常 (如 ProcessingCancelled)
+                     时不再启动剩余的段，不写入目标表
+    :return: 写入的行数
+    """
+    metrics = metrics or StageMetrics('processor', db_path)
+    with metrics.stage('clean'):
+        index = detect_header(sheet_data)
+        headers = [str(h) for h in sheet_data[index]]
+    ranges = shard_ranges(index + 1, len(sheet_data), workers)
+
+    if len(ranges) == 1:
+        with metrics.stage('clean'):
+            rows = clean_rows(sheet_data[index + 1:])
+        with metrics.stage('convert', rows=len(rows)):
+            df = _rows_frame(headers, rows)
+        if on_chunk:
+            on_chunk(len(df))
+        with metrics.stage('write', rows=len(df)):
+            con = connect(db_path)
+            try:
+                con.register('df_view', df)
+                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df_view")
+            finally:
+                con.close()
+        return len(df)
+
+    global _SHARD_SOURCE
+    # fork 时子进程共享父进程的行数据 (写时复制)，其它启动方式需要把每段行数据 pickle 给子进程；
+    # fork 只在主线程中使用: 在有其它线程 (Qt、DuckDB、线程池) 运行时 fork，子进程可能因继承被占用的锁而死锁
+    inherit = ('fork' in multiprocessing.get_all_start_methods()
+               and threading.current_thread() is threading.main_thread())
+    context = multiprocessing.get_context('fork' if inherit else 'spawn')
+    shard_dir = tempfile.mkdtemp(prefix='.shards_', dir=os.path.dirname(db_path) or '.')
+    try:
+        with metrics.stage('convert', rows=len(sheet_data) - index - 1):
+            _SHARD_SOURCE = sheet_data if inherit else None
+            try:
+                with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as executor:
+                    futures = {executor.submit(_convert_shard, headers, start, end,
+                                               os.path.join(shard_dir, f"shard_{i}.duckdb"),
+                                               None if inherit else sheet_data[start:end]): i
+                               for i, (start, end) in enumerate(ranges)}
+                    results = {}
+                    try:
+                        for future in as_completed(futures):
+                            results[futures[future]] = future.result()
+                            if on_chunk:
+                                on_chunk(sum(n for n, _ in results.values()))
+                    except BaseException:
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise
+            finally:
+                _SHARD_SOURCE = None
+
+        total = sum(n for n, _ in results.values())
+        with metrics.stage('write', rows=total):
+            con = connect(db_path)
+            try:
+                # 事务中不能 DETACH，各段在事务开始前 ATTACH、结束后 DETACH
+                attached = []
+                try:
+                    for i in range(len(ranges)):
+                        shard_path = os.path.join(shard_dir, f"shard_{i}.duckdb").replace("'", "''")
+                        con.execute(f"ATTACH '{shard_path}' AS s{i} (READ_ONLY)")
+                        attached.append(f"s{i}")
+                    con.begin()
+                    try:
+                        untyped = set()
+                        for i in range(len(ranges)):
+                            null_columns = results[i][1]
+                            if i == 0:
+                                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM s0.shard")
+                                untyped = {headers[c] for c in null_columns}
+                            else:
+                                _widen_table(con, table_name, headers, _column_types(con, f"s{i}.shard"),
+                                             null_columns, untyped)
+                                con.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM s{i}.shard")
+                        con.commit()
+                    except BaseException:
+                        con.rollback()
+                        raise
+                finally:
+                    for alias in attached:
+                        con.execute(f"DETACH {alias}")
+            finally:
+                con.close()
+        return total
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+def safe_table_name(name):
+    """由文件名/工作表名生成合法的表名 (清理非法字符)"""
+    safe_name = "".join([c if c.isalnum() else "_" for c in name])
+    if not safe_name or safe_name[0].isdigit():
+        safe_name = "t_" + safe_name
+    return safe_name
+
+
+def select_sheets(sheet_names, selection=None):
+    """
+    选择需要导入的工作表
+    :param sheet_names: 工作簿中的全部工作表名
+    :param selection: None 只取第一个工作表；'*' 取全部；字符串按正则完整匹配表名；列表/元组按名称选择
+    :return: 选中的工作表名列表 (保持工作簿中的顺序)
+    """
+    if not sheet_names:
+        return []
+    if selection is None:
+        return [sheet_names[0]]
+    if selection == '*':
+        return list(sheet_names)
+    if isinstance(selection, str):
+        pattern = re.compile(selection)
+        return [name for name in sheet_names if pattern.fullmatch(name)]
+    wanted = set(selection)
+    return [name for name in sheet_names if name in wanted]
+
+
+def _parse_sheets(data, sheet_names, max_workers):
+    """
+    并发解析多个工作表，按 sheet_names 的顺序依次产出 (表名, CalamineSheet)
+    CalamineWorkbook 对象不能被多个线程同时访问 ("Already borrowed")，
+    因此文件只读取一次，每个线程在同一份内存数据上打开自己的工作簿句柄
+    """
+    local = threading.local()
+
+    def parse(name):
+        if not hasattr(local, 'xls'):
+            local.xls = python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(data))
+        return name, local.xls.get_sheet_by_name(name)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(parse, sheet_names)
+
+
+def save_excel_sheets_to_duckdb(excel_path, db_path, table_name, sheets='*', sheet_mode=SHEET_MODE,
+                                chunk_size=CHUNK_SIZE, max_workers=SHEET_WORKERS, on_chunk=None,
+                                incremental=False, sinks=SINKS, parquet_dir=PARQUET_DIR, metrics=None):
+    """
+    将工作簿中的多个工作表导入 DuckDB，工作表并发解析，由单个连接按顺序流式写入
+    :param sheets: 工作表选择，见 select_sheets
+    :param sheet_mode: 'union' 全部写入 table_name 并附加 sheet_name 列；
+                       'per_sheet' 每个工作表写入单独的表 {table_name}_{工作表名}
+    :param incremental: 为 True 时对比清单，文件未变化则跳过 (仅在输出 duckdb 时生效)
+    :param metrics: StageMetrics，记录各阶段耗时 (由调用方输出)
+    :return: {工作表名: 写入行数}；增量模式下文件未变化时返回 None
+    """
+    metrics = metrics or StageMetrics('processor', excel_path)
+    to_duckdb = 'duckdb' in sinks
+    db_dir = os.path.dirname(db_path)
+    if to_duckdb and db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+
+    if incremental and to_duckdb:
+        with metrics.stage('plan'):
+            unchanged = is_unchanged(db_path, excel_path, table_name)
+        if unchanged:
+            return None
+
+    with metrics.stage('open'):
+        with open(excel_path, 'rb') as f_r:
+            data = f_r.read()
+        xls = python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(data))
+        names = select_sheets(xls.sheet_names, sheets)
+
+    counts = {}
+    tables = []
+    con = open_staging(db_path, sinks)
+    try:
+        union_created = False
+        chunks = None
+        con.begin()
+        try:
+            # 工作表解析 (等待解析线程) 计入 open，逐块读取计入 read，合计行过滤计入 clean
+            for name, sheet in timed_chunks(_parse_sheets(data, names, max_workers), metrics, 'open'):
+                first_row, rows_iter = split_header(sheet.iter_rows())
+                if first_row is None:
+                    counts[name] = 0
+                    continue
+                headers = [str(h) for h in first_row]
+                extra_columns = None if sheet_mode == 'per_sheet' else {'sheet_name': name}
+                chunks = _read_chunks(rows_iter, chunk_size, metrics, headers, extra_columns)
+                # 回调中的行数在所有工作表间累计
+                done = sum(counts.values())
+                sheet_on_chunk = (lambda n, done=done: on_chunk(done + n)) if on_chunk else None
+                with metrics.stage('write'):
+                    if sheet_mode == 'per_sheet':
+                        target = safe_table_name(f"{table_name}_{name}")
+                        counts[name] = append_rows_streaming(con, target, headers, chunks, on_chunk=sheet_on_chunk)
+                        tables.append(target)
+                    else:
+                        # 只有表头的工作表建的是空表 (全部为 VARCHAR)，由之后首个有数据的工作表重建
+                        counts[name] = append_rows_streaming(con, table_name, headers, chunks,
+                                                             replace=not union_created, on_chunk=sheet_on_chunk,
+                                                             extra_columns=extra_columns)
+                        if table_name not in tables:
+                            tables.append(table_name)
+                        union_created = union_created or counts[name] > 0
+                del sheet, rows_iter
+            with metrics.stage('commit'):
+                con.commit()
+        except BaseException:
+            if chunks is not None:
+                # 停止预读线程 (流水线模式)，不等到异常对象被释放
+                chunks.close()
+            con.rollback()
+            raise
+        metrics.set_rows('write', sum(counts.values()))
+
+        if 'parquet' in sinks:
+            with metrics.stage('export'):
+                # tables 中只有已建的表；只有表头的工作表也建了空表，导出为 0 行的 Parquet
+                for target in tables:
+                    export_parquet(con, target, os.path.join(parquet_dir, f"{target}.parquet"))
+    finally:
+        con.close()
+
+    if to_duckdb and tables:
+        with metrics.stage('manifest'):
+            record_file(db_path, excel_path, table_name, sum(counts.values()))
+    return counts
+
+
+def _read_chunks(rows_iter, chunk_size, metrics, headers, extra_columns=None):
+    """
+    逐块读取并过滤合计行/空行 (计入 read、clean)
+    启用流水线时读取、清理和列式转换 (计入 convert) 都在后台线程中进行，写入线程只执行 DuckDB 插入
+    (期间释放 GIL)，等待数据块的时间计入 wait
+    """
+    chunks = timed_chunks(iter_clean_chunks(timed_chunks(iter_row_chunks(rows_iter, chunk_size), metrics)),
+                          metrics, 'clean')
+    if not PIPELINE:
+        return chunks
+    frames = (chunk_frame(headers, rows, extra_columns) for rows in chunks)
+    frames = timed_chunks(frames, metrics, 'convert', count=False)
+    return timed_chunks(prefetch(frames, PIPELINE_DEPTH), metrics, 'wait', count=False)
+
+
+def save_excel_to_duckdb_streaming(excel_path, db_path, table_name, chunk_size=CHUNK_SIZE, on_chunk=None,
+                                   incremental=False, sinks=SINKS, parquet_dir=PARQUET_DIR, on_total=None,
+                                   metrics=None):
+    """
+    流式读取 Excel 并保存到 DuckDB：使用 calamine 行迭代器按块读取，逐块追加写入，
+    不再将整个工作表物化为 Python 列表
+    :param excel_path: Excel 文件路径
+    :param db_path: DuckDB 数据库文件路径
+    :param table_name: 表名
+    :param chunk_size: 每块行数
+    :param on_chunk: 每写入一块后的回调 on_chunk(累计行数)；回调抛出异常 (如 ProcessingCancelled)
+                     会中止写入并回滚，表保持写入前的状态
+    :param incremental: 为 True 时对比清单，文件未变化则跳过 (仅在输出 duckdb 时生效)
+    :param sinks: 输出目标，见 excel_to_duckdb_sink.SINKS
+    :param parquet_dir: 输出 Parquet 时的目录，文件名为 {table_name}.parquet
+    :param on_total: 打开工作表后的回调 on_total(数据行数)，用于计算行级进度
+    :param metrics: StageMetrics，记录各阶段耗时 (由调用方输出)
+    :return: 写入行数；文件为空时返回 0；增量模式下文件未变化时返回 None
+    """
+    metrics = metrics or StageMetrics('processor', excel_path)
+    to_duckdb = 'duckdb' in sinks
+    db_dir = os.path.dirname(db_path)
+    if to_duckdb and db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+
+    if incremental and to_duckdb:
+        with metrics.stage('plan'):
+            unchanged = is_unchanged(db_path, excel_path, table_name)
+        if unchanged:
+            return None
+
+    with open(excel_path, 'rb') as f_r:
+        # calamine 打开工作表时解码整张表，这部分内存随工作表大小增长；逐行解析工作表 XML (见 excel_to_duckdb_preview)
+        # 可以不解码整表，但纯 Python 解析比 calamine 慢数倍，只用于预览
+        with metrics.stage('open'):
+            xls = python_calamine.CalamineWorkbook.from_filelike(f_r)
+            sheet = xls.get_sheet_by_index(0) if xls.sheet_names else None
+        if sheet is None:
+            return 0
+        if on_total:
+            on_total(max(sheet.height - 1, 0))
+        # 识别表头行 (跳过表头上方的标题行)，数据块中的合计行和空行在写入前过滤
+        first_row, rows_iter = split_header(sheet.iter_rows())
+        if first_row is None:
+            return 0
+        headers = [str(h) for h in first_row]
+        con = open_staging(db_path, sinks)
+        try:
+            # 逐块读取计入 read，合计行过滤计入 clean，其余 (转换、写入) 计入 write
+            chunks = _read_chunks(rows_iter, chunk_size, metrics, headers)
+            # 在同一事务中写入，中途失败或被取消时回滚，不留下半张表
+            con.begin()
+            try:
+                with metrics.stage('write'):
+                    row_count = append_rows_streaming(con, table_name, headers, chunks, on_chunk=on_chunk)
+                metrics.set_rows('write', row_count)
+                with metrics.stage('commit'):
+                    con.commit()
+            except BaseException:
+                # 停止预读线程 (流水线模式)，不等到异常对象被释放
+                chunks.close()
+                con.rollback()
+                raise
+            # 只有表头 (或只有合计行) 时 append_rows_streaming 建的是空表，同样导出
+            if 'parquet' in sinks:
+                with metrics.stage('export'):
+                    export_parquet(con, table_name, os.path.join(parquet_dir, f"{table_name}.parquet"))
+        finally:
+            con.close()
+
+    if to_duckdb:
+        with metrics.stage('manifest'):
+            record_file(db_path, excel_path, table_name, row_count)
+    return row_count
+
+
 def read_from_duckdb(db_path, table_name):
     """从 DuckDB 读取数据并展示"""
     print(f"\n[2/2] 正在从 DuckDB 读取数据...")
@@ -73,18 +577,18 @@ def read_from_duckdb(db_path, table_name):
         return
 
     try:
-        con = duckdb.connect(db_path)
+        con = connect(db_path)
         
         # 1. 简单展示前5行
         print(f"--- 表 '{table_name}' 前 5 行预览 ---")
         con.sql(f"SELECT * FROM {table_name} LIMIT 5").show()
         
-        # 2. 遍历数据的示例 (前 10 行)
+        # 2. 遍历数据的示例 (前 10 行): 只取第一批，取到后即停止，不扫描整张表
         print(f"--- 遍历前 10 行数据 ---")
-        rows = con.sql(f"SELECT * FROM {table_name} LIMIT 10").fetchall()
+        rows = next(iter_batches(con, table_name, batch_size=10), [])
         for num, row in enumerate(rows):
             print(f"行 {num}: {row}")
-            
+
         con.close()
         print("\n读取完成。")
 
@@ -93,6 +597,34 @@ def read_from_duckdb(db_path, table_name):
 
 if __name__ == "__main__":
     # 执行保存
-    if save_excel_to_duckdb(EXCEL_FILE, DB_PATH, TABLE_NAME):
+    if STREAMING:
+        print(f"\n[1/2] 正在流式读取 {EXCEL_FILE} 并保存到 {DB_PATH} (每块 {CHUNK_SIZE} 行)...")
+        t_start = time.time()
+        metrics = StageMetrics('processor', EXCEL_FILE)
+        status = 'ok'
+        try:
+            if SHEETS is None:
+                row_count = save_excel_to_duckdb_streaming(EXCEL_FILE, DB_PATH, TABLE_NAME, incremental=INCREMENTAL,
+                                                           metrics=metrics)
+            else:
+                sheet_counts = save_excel_sheets_to_duckdb(EXCEL_FILE, DB_PATH, TABLE_NAME, SHEETS,
+                                                           incremental=INCREMENTAL, metrics=metrics)
+                row_count = None if sheet_counts is None else sum(sheet_counts.values())
+                if sheet_counts:
+                    print(f"各工作表行数: {sheet_counts}")
+            if row_count is None:
+                print(f"文件自上次导入后未变化，跳过。")
+            else:
+                print(f"成功: 表 '{TABLE_NAME}' 已写入 {row_count} 行。耗时 {time.time() - t_start:.2f} 秒。")
+                print(f"各阶段耗时: {metrics.breakdown()}")
+        except Exception as e:
+            print(f"错误: {e}")
+            row_count = 0
+            status = 'error'
+        emit_metrics(metrics.records('unchanged' if row_count is None else status, row_count, [DB_PATH]))
+        saved = row_count is None or row_count > 0
+    else:
+        saved = save_excel_to_duckdb(EXCEL_FILE, DB_PATH, TABLE_NAME)
+    if saved:
         # 执行读取
         read_from_duckdb(DB_PATH, TABLE_NAME)
@@ -0,0 +1,130 @@
+import duckdb
+
+from excel_to_duckdb_resources import connect
+
+# 分批读取: 每批行数固定，内存占用与表大小无关，Python 调用次数为 行数 / 批大小
+READ_BATCH_SIZE = 10000
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def build_select_sql(table_name, columns=None, where=None, order_by=None):
+    """
+    拼接查询语句
+    :param columns: 要读取的列 (投影)，None 表示全部
+    :param where: WHERE 条件 (可含 ? 占位符)，由 DuckDB 下推到扫描
+    :param order_by: 排序列列表
+    """
+    select_list = ", ".join(_quote(c) for c in columns) if columns else "*"
+    sql = f"SELECT {select_list} FROM {table_name}"
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += " ORDER BY " + ", ".join(_quote(c) for c in order_by)
+    return sql
+
+
+def _open(con_or_path):
+    """传入数据库路径时以只读方式打开 (返回 连接, 是否需要关闭)"""
+    if isinstance(con_or_path, str):
+        return connect(con_or_path, read_only=True), True
+    return con_or_path, False
+
+
+def _arrow_reader(result, batch_size):
+    if hasattr(result, 'to_arrow_reader'):
+        return result.to_arrow_reader(batch_size)
+    return result.fetch_record_batch(batch_size)
+
+
+def iter_batches(con_or_path, table_name, columns=None, where=None, params=None, order_by=None,
+                 batch_size=READ_BATCH_SIZE, arrow=False):
+    """
+    执行一次查询并按固定大小分批返回结果
+    :param con_or_path: DuckDB 连接或数据库文件路径
+    :param table_name: 表名
+    :param columns: 要读取的列，None 表示全部
+    :param where: WHERE 条件，如 "月结卡号 = ?"
+    :param params: WHERE 中占位符的参数
+    :param order_by: 排序列列表
+    :param batch_size: 每批行数
+    :param arrow: True 时每批为 pyarrow.RecordBatch，否则为元组列表 (fetchmany)
+    """
+    con, owned = _open(con_or_path)
+    try:
+        result = con.execute(build_select_sql(table_name, columns, where, order_by), params or [])
+        if arrow:
+            for batch in _arrow_reader(result, batch_size):
+                if batch.num_rows:
+                    yield batch
+            return
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        if owned:
+            con.close()
+
+
+def iter_pages(con_or_path, table_name, key_columns=None, columns=None, where=None, params=None,
+               page_size=READ_BATCH_SIZE, after=None):
+    """
+    键集分页: 每页是一个独立查询 (WHERE 键 > 上一页最后一行的键 ORDER BY 键 LIMIT 页大小)，
+    不持有长时间打开的结果集，可随时中断并从返回的键继续
+    :param key_columns: 分页键 (组合后必须唯一)，None 时使用 DuckDB 的 rowid；视图 (如 open_union 的合并视图)
+                        没有 rowid，必须显式指定
+    :param columns: 要读取的列，None 表示全部；分页键不在其中时会额外读取，但不出现在返回的行中
+    :param after: 从该键之后开始 (上次中断时返回的键元组)
+    :return: 生成器，每次产出 (行列表, 本页最后一行的键元组)
+    """
+    con, owned = _open(con_or_path)
+    try:
+        if key_columns is None:
+            try:
+                con.execute(f"SELECT rowid FROM {table_name} LIMIT 0")
+            except duckdb.BinderException:
+                raise ValueError(f"'{table_name}' 没有 rowid (视图或查询)，请用 key_columns 指定唯一的分页键") from None
+            key_columns = ('rowid',)
+        key_columns = list(key_columns)
+        if columns is None:
+            columns = [row[0] for row in con.execute(f"DESCRIBE {table_name}").fetchall()]
+        columns = list(columns)
+        select_columns = columns + [k for k in key_columns if k not in columns]
+        key_index = [select_columns.index(k) for k in key_columns]
+        keys_sql = "(" + ", ".join(_quote(k) for k in key_columns) + ")"
+        key_placeholders = "(" + ", ".join("?" for _ in key_columns) + ")"
+
+        while True:
+            conditions = [f"({where})"] if where else []
+            page_params = list(params or [])
+            if after is not None:
+                conditions.append(f"{keys_sql} > {key_placeholders}")
+                page_params += list(after)
+            sql = build_select_sql(table_name, select_columns, " AND ".join(conditions) or None, key_columns)
+            rows = con.execute(f"{sql} LIMIT {int(page_size)}", page_params).fetchall()
+            if not rows:
+                break
+            after = tuple(rows[-1][i] for i in key_index)
+            if len(select_columns) > len(columns):
+                rows = [row[:len(columns)] for row in rows]
+            yield rows, after
+            if len(rows) < page_size:
+                break
+    finally:
+        if owned:
+            con.close()
+
+
+def count_rows(con_or_path, table_name, where=None, params=None):
+    """统计满足条件的行数"""
+    con, owned = _open(con_or_path)
+    try:
+        sql = f"SELECT COUNT(*) FROM {table_name}" + (f" WHERE {where}" if where else "")
+        return con.execute(sql, params or []).fetchone()[0]
+    finally:
+        if owned:
+            con.close()
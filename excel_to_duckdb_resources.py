@@ -0,0 +1,118 @@
+import os
+import tempfile
+
+import duckdb
+
+# DuckDB 资源配置: 仓库中打开的所有连接都经过 connect()，使用同一套 memory_limit / threads /
+# temp_directory / preserve_insertion_order 设置。内存超过 memory_limit 时，排序、聚合、建表等算子
+# 把中间数据溢出到 temp_directory，而不是占满内存被系统杀掉 (内存库默认没有临时目录，不能溢出)
+# - memory_limit: 字节数字符串 ('4GB') 或物理内存的比例 (0.4)
+# - threads: 线程数或 CPU 核数的比例 (0.5)
+# - preserve_insertion_order: False 时大表写入/导出可并行且更省内存，但同一文件内的行顺序不再保证
+#   (跨文件去重的 first/last 以文件为单位，不受影响；文件内重复的运单号保留哪一行不确定)
+PROFILES = {
+    # DuckDB 默认设置 (内存 80%、全部核数)，只补充临时目录
+    'default': {},
+    # 共用的批处理机器: 限制内存和核数，给其它任务留出资源
+    'shared': {'memory_limit': 0.4, 'threads': 0.5},
+    # 内存很小的机器或同时运行很多进程
+    'low_memory': {'memory_limit': '1GB', 'threads': 2, 'preserve_insertion_order': False},
+    # 独占机器上的大批量导入
+    'dedicated': {'memory_limit': 0.8, 'threads': 1.0, 'preserve_insertion_order': False},
+}
+RESOURCE_PROFILE = 'default'
+# 溢出文件目录 (所有连接共用)
+TEMP_DIRECTORY = os.path.join(tempfile.gettempdir(), 'excel2duckdb_spill')
+
+# 单次运行的覆盖 (命令行参数或环境变量)；set_profile 同时写入环境变量，子进程 (进程池) 沿用同一配置
+ENV_PROFILE = 'EXCEL2DUCKDB_PROFILE'
+ENV_OVERRIDES = {
+    'memory_limit': 'EXCEL2DUCKDB_MEMORY_LIMIT',
+    'threads': 'EXCEL2DUCKDB_THREADS',
+    'temp_directory': 'EXCEL2DUCKDB_TEMP_DIR',
+    'preserve_insertion_order': 'EXCEL2DUCKDB_PRESERVE_ORDER',
+}
+
+
+def _physical_memory():
+    """物理内存字节数；无法获取时返回 None"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.virtual_memory().total
+
+
+def _parse(name, value):
+    """环境变量中的字符串转换为设置值"""
+    if name == 'preserve_insertion_order':
+        return str(value).lower() in ('1', 'true', 'yes')
+    if name in ('memory_limit', 'threads'):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return int(number) if number >= 1 and number.is_integer() else number
+    return value
+
+
+def resolve_settings(profile=None, **overrides):
+    """
+    计算连接的 DuckDB 配置
+    :param profile: 预设名 (见 PROFILES)；None 时取环境变量 EXCEL2DUCKDB_PROFILE，再否则为 RESOURCE_PROFILE
+    :param overrides: 覆盖单项设置 (值为 None 的忽略，字符串按环境变量的格式解析)；未指定的项再查环境变量
+    :return: duckdb.connect(config=...) 使用的 dict
+    """
+    name = profile or os.environ.get(ENV_PROFILE) or RESOURCE_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"未知的资源配置: {name}，可选 {list(PROFILES)}")
+    settings = dict(PROFILES[name])
+    for key, env in ENV_OVERRIDES.items():
+        if os.environ.get(env):
+            settings[key] = _parse(key, os.environ[env])
+    settings.update({k: _parse(k, v) if isinstance(v, str) else v for k, v in overrides.items() if v is not None})
+    settings.setdefault('temp_directory', TEMP_DIRECTORY)
+
+    config = {'temp_directory': settings['temp_directory']}
+    memory_limit = settings.get('memory_limit')
+    if isinstance(memory_limit, float) and memory_limit <= 1:
+        total = _physical_memory()
+        memory_limit = f"{max(int(total * memory_limit) // (1024 * 1024), 256)}MiB" if total else None
+    if memory_limit is not None:
+        config['memory_limit'] = str(memory_limit)
+    threads = settings.get('threads')
+    if isinstance(threads, float) and threads <= 1:
+        threads = round((os.cpu_count() or 1) * threads)
+    if threads is not None:
+        config['threads'] = max(int(threads), 1)
+    if 'preserve_insertion_order' in settings:
+        config['preserve_insertion_order'] = bool(settings['preserve_insertion_order'])
+    return config
+
+
+def set_profile(profile=None, **overrides):
+    """
+    设置本次运行 (含之后启动的子进程) 使用的资源配置，如命令行的 --profile / --memory-limit
+    :return: 生效的配置
+    """
+    config = resolve_settings(profile, **overrides)
+    if profile:
+        os.environ[ENV_PROFILE] = profile
+    for key, value in overrides.items():
+        if value is not None:
+            os.environ[ENV_OVERRIDES[key]] = str(value)
+    return config
+
+
+def connect(database=':memory:', read_only=False, profile=None):
+    """
+    按资源配置打开 DuckDB 连接 (替代 duckdb.connect)
+    同一进程中同一数据库文件的所有连接必须使用相同配置，因此仓库中的连接都应通过该函数打开
+    """
+    config = resolve_settings(profile)
+    os.makedirs(config['temp_directory'], exist_ok=True)
+    return duckdb.connect(database, read_only=read_only, config=config)
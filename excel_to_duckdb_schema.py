@@ -0,0 +1,424 @@
+import datetime
+import decimal
+import re
+
+from excel_to_duckdb_manifest import SOURCE_COLUMN
+
+# 每个文件参与类型推断的抽样行数
+SAMPLE_SIZE = 1000
+# 小数位数不超过该值的数值列使用 DECIMAL，否则使用 DOUBLE
+DECIMAL_MAX_SCALE = 4
+DECIMAL_PRECISION = 18
+
+_INT_RE = re.compile(r'^[+-]?\d+$')
+_BIGINT_MAX = 2 ** 63 - 1
+
+
+def sample_rows(rows, sample_size=SAMPLE_SIZE):
+    """从行数据中等间隔抽样 (包含首尾行)，用于类型推断"""
+    if len(rows) <= sample_size:
+        return list(rows)
+    step = (len(rows) - 1) / (sample_size - 1)
+    return [rows[round(i * step)] for i in range(sample_size)]
+
+
+def _classify(value):
+    """
+    判断单个单元格的值类别
+    :return: (类别, 小数位数)，类别为 None / 'int' / 'num' / 'ts' / 'text'
+    """
+    if value is None:
+        return None, 0
+    if isinstance(value, bool):
+        return 'text', 0
+    if isinstance(value, int):
+        return 'int', 0
+    if isinstance(value, float):
+        if value != value:
+            return None, 0
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return 'int', 0
+        text = repr(value)
+        if 'e' in text or 'inf' in text:
+            return 'num', DECIMAL_MAX_SCALE + 1
+        return 'num', len(text.split('.')[1])
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return 'ts', 0
+    if not isinstance(value, str):
+        return 'text', 0
+
+    text = value.strip()
+    if not text:
+        return None, 0
+    # 以 0 开头的数字串 (如单号、编码) 保持为文本
+    if len(text) > 1 and text[0] == '0' and text[1] != '.':
+        return 'text', 0
+    if _INT_RE.match(text):
+        return ('int', 0) if len(text.lstrip('+-')) <= DECIMAL_PRECISION else ('text', 0)
+    try:
+        number = float(text)
+    except ValueError:
+        pass
+    else:
+        if number != number or 'e' in text.lower() or 'inf' in text.lower():
+            return 'text', 0
+        return 'num', len(text.split('.')[1]) if '.' in text else 0
+    try:
+        datetime.datetime.fromisoformat(text)
+        return 'ts', 0
+    except ValueError:
+        return 'text', 0
+
+
+def infer_column_type(values):
+    """
+    根据抽样值推断列的 DuckDB 类型，取能容纳所有样本的最宽类型
+    :return: 'BIGINT' / 'DECIMAL(p,s)' / 'DOUBLE' / 'TIMESTAMP' / 'VARCHAR'
+    """
+    kinds = set()
+    scale = 0
+    int_digits = 0
+    for value in values:
+        kind, value_scale = _classify(value)
+        if kind is None:
+            continue
+        if kind == 'text':
+            return 'VARCHAR'
+        kinds.add(kind)
+        if kind in ('int', 'num'):
+            scale = max(scale, value_scale)
+            try:
+                int_digits = max(int_digits, len(str(abs(int(float(value))))))
+            except (TypeError, ValueError, OverflowError):
+                int_digits = DECIMAL_PRECISION
+    if not kinds:
+        return 'VARCHAR'
+    if kinds == {'ts'}:
+        return 'TIMESTAMP'
+    if 'ts' in kinds:
+        return 'VARCHAR'
+    if kinds == {'int'}:
+        return 'BIGINT'
+    if scale <= DECIMAL_MAX_SCALE and int_digits + scale <= DECIMAL_PRECISION:
+        return f'DECIMAL({DECIMAL_PRECISION},{scale})'
+    return 'DOUBLE'
+
+
+def infer_schema(headers, sample):
+    """
+    对抽样行逐列推断类型
+    :param headers: 列名列表
+    :param sample: 抽样行 (可来自同一组的多个文件)
+    :return: 与 headers 对应的 DuckDB 类型列表
+    """
+    columns = list(zip(*sample)) if sample else []
+    types = []
+    for i in range(len(headers)):
+        types.append(infer_column_type(columns[i]) if i < len(columns) else 'VARCHAR')
+    return types
+
+
+def has_values(values):
+    """抽样中是否有非空值 (全为空的列推断不出类型，不参与类型合并)"""
+    return any(_classify(v)[0] is not None for v in values)
+
+
+_NUMERIC_TYPES = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'FLOAT', 'REAL', 'DOUBLE')
+
+
+def _is_numeric(col_type):
+    return col_type in _NUMERIC_TYPES or col_type.startswith('DECIMAL')
+
+
+def _decimal_scale(col_type):
+    if col_type.startswith('DECIMAL('):
+        return int(col_type[len('DECIMAL('):-1].split(',')[1])
+    return 0
+
+
+def merge_column_type(current, new):
+    """
+    同一列在不同文件中推断出的类型合并为能容纳两者的类型
+    :return: 数值类型之间取 DECIMAL (小数位取大者) 或 DOUBLE，其余不一致的组合为 VARCHAR
+    """
+    if current == new:
+        return current
+    if _is_numeric(current) and _is_numeric(new):
+        if current in ('FLOAT', 'REAL', 'DOUBLE') or new in ('FLOAT', 'REAL', 'DOUBLE'):
+            return 'DOUBLE'
+        if current.startswith('DECIMAL') or new.startswith('DECIMAL'):
+            return f'DECIMAL({DECIMAL_PRECISION},{max(_decimal_scale(current), _decimal_scale(new))})'
+        return 'BIGINT'
+    return 'VARCHAR'
+
+
+def widen_column(con, table_name, column, current, target):
+    """
+    将表中的列放宽为 target 类型 (在事务中执行，失败会使整个事务中止，因此先检查再转换)
+    目标为 DECIMAL 而已有数值超出其整数位数时改用 DOUBLE
+    :return: 实际采用的类型
+    """
+    if target.startswith('DECIMAL') and _is_numeric(current):
+        limit = 10 ** (DECIMAL_PRECISION - _decimal_scale(target))
+        max_abs = con.execute(f'SELECT MAX(ABS("{column}")) FROM {table_name}').fetchone()[0]
+        if max_abs is not None and max_abs >= limit:
+            target = 'DOUBLE'
+    con.execute(f'ALTER TABLE {table_name} ALTER "{column}" TYPE {target}')
+    return target
+
+
+def reconcile_headers(raw_headers, aliases=None):
+    """
+    表头规范化: 按别名映射改名，空列名以列序号命名，重复列名加序号后缀
+    :param raw_headers: 文件中的原始表头
+    :param aliases: {别名: 标准列名}，如 {'运单号': '运单号码'}
+    :return: (规范化后的列名列表, {原列名: 新列名} 改名记录)
+    """
+    aliases = aliases or {}
+    headers = []
+    renamed = {}
+    seen = set()
+    for i, raw in enumerate(raw_headers):
+        name = str(raw).strip() if raw is not None else ''
+        name = aliases.get(name, name) or f'列{i + 1}'
+        base, n = name, 2
+        while name in seen:
+            name = f'{base}_{n}'
+            n += 1
+        seen.add(name)
+        if name != str(raw):
+            renamed[str(raw)] = name
+        headers.append(name)
+    return headers, renamed
+
+
+def _to_text(value):
+    """文本列的单元格转换: 整数值的浮点数去掉 .0 后缀"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def _to_int(value):
+    """BIGINT 列的单元格按整数精确解析 (不经过浮点数)，无法转换或超出 BIGINT 范围时为 None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        number = value
+    elif isinstance(value, float):
+        if value != value or not value.is_integer():
+            return None
+        number = int(value)
+    else:
+        text = str(value).strip()
+        if _INT_RE.match(text):
+            number = int(text)
+        else:
+            number = _to_decimal(text)
+            if number is None or number % 1 != 0:
+                return None
+            number = int(number)
+    return number if -_BIGINT_MAX - 1 <= number <= _BIGINT_MAX else None
+
+
+def _to_decimal(value, limit=None):
+    """
+    DECIMAL 列的单元格按十进制精确解析 (浮点数取其最短表示)
+    :param limit: 绝对值上限 (由 DECIMAL 的整数位数决定)，超出时为 None
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        number = decimal.Decimal(repr(value) if isinstance(value, float) else str(value).strip())
+    except decimal.InvalidOperation:
+        return None
+    if not number.is_finite() or (limit is not None and abs(number) >= limit):
+        return None
+    return number
+
+
+def _apply_cells(raw, mask, func):
+    """对 mask 选中的单元格逐个调用 func (向量化快速路径处理不了的少数单元格)，返回 object Series"""
+    import pandas as pd
+
+    return pd.Series([func(v) for v in raw[mask]], index=raw.index[mask], dtype=object)
+
+
+def _coerce_text(raw):
+    """
+    文本列转换 (与 _to_text 逐个单元格的结果一致)
+    全为字符串的列 (绝大多数文本列) 原样使用；浮点数列整体去掉整数值的 .0 后缀；混合类型的列只对非字符串单元格逐个转换
+    """
+    import pandas as pd
+
+    kind = pd.api.types.infer_dtype(raw, skipna=True)
+    if kind in ('string', 'empty'):
+        return raw
+    if kind == 'floating':
+        # str() 为最短表示: 整数值去掉 .0 后缀，科学计数法 (1e+16)、inf 等逐个转换
+        text = raw.astype(str).where(raw.notna())
+        integral = text.str.fullmatch(r'[+-]?\d+\.0').fillna(False).astype(bool)
+        result = text.where(~integral, text.str[:-2])
+        other = raw.notna() & ~text.str.fullmatch(r'[+-]?\d+\.\d+').fillna(False).astype(bool)
+        if other.any():
+            result[other] = _apply_cells(raw, other, _to_text)
+        return result
+    if kind == 'integer':
+        return raw.astype(str).where(raw.notna())
+    # 混合类型: 字符串原样保留，其它单元格逐个转换
+    is_str = raw.map(type, na_action='ignore') == str
+    result = raw.where(is_str)
+    other = raw.notna() & ~is_str
+    if other.any():
+        result[other] = _apply_cells(raw, other, _to_text)
+    return result
+
+
+def _coerce_bigint(raw):
+    """
+    BIGINT 列转换 (与 _to_int 逐个单元格的结果一致，不经过 float64 舍入)
+    浮点数列整体按整数值转换；其它列先转为字符串，不超过 18 位的整数串 (可带 .0 后缀) 直接解析，
+    其余 (19 位数、小数、科学计数法等) 逐个单元格转换
+    """
+    import numpy as np
+    import pandas as pd
+
+    kind = pd.api.types.infer_dtype(raw, skipna=True)
+    if kind == 'floating':
+        numbers = raw.astype('float64')
+        valid = (numbers % 1 == 0) & (numbers.abs() < 2 ** 63)
+        return numbers.where(valid).astype('Int64')
+    text = raw.astype(str).str.strip().where(raw.notna())
+    fast = text.str.fullmatch(r'[+-]?\d{1,18}(?:\.0+)?').fillna(False).to_numpy(dtype=bool)
+    # 在 int64 数组上填值再组装 (按掩码给 Int64 Series 赋值会经过 float64)
+    numbers = np.zeros(len(raw), dtype='int64')
+    valid = fast.copy()
+    if fast.any():
+        numbers[fast] = text[fast].str.replace(r'\.0+$', '', regex=True).astype('int64').to_numpy()
+    slow = raw.notna().to_numpy() & ~fast
+    if slow.any():
+        slow_values = _apply_cells(raw, slow, _to_int).to_numpy()
+        slow_valid = np.array([v is not None for v in slow_values], dtype=bool)
+        positions = np.flatnonzero(slow)
+        numbers[positions[slow_valid]] = slow_values[slow_valid].astype('int64')
+        valid[positions[slow_valid]] = True
+    return pd.Series(pd.arrays.IntegerArray(numbers, ~valid), index=raw.index)
+
+
+def _coerce_decimal(raw, col_type):
+    """
+    DECIMAL 列转换为十进制字符串 (由 DuckDB CAST AS DECIMAL，精度不受 float64 限制)
+    str() 对整数和浮点数 (最短表示) 都是精确的十进制文本，整数位数不超过上限的规范数字串 (与 str(Decimal) 相同) 直接使用，
+    其余 (科学计数法、超出范围、非数字等) 逐个单元格由 _to_decimal 转换
+    """
+    int_digits = DECIMAL_PRECISION - _decimal_scale(col_type)
+    limit = 10 ** int_digits
+    text = raw.astype(str).str.strip().where(raw.notna())
+    integer_part = r'(?:0|[1-9]\d{0,%d})' % (int_digits - 1) if int_digits > 0 else '0'
+    fast = text.str.fullmatch(r'-?%s(?:\.\d+)?' % integer_part).fillna(False).astype(bool)
+    coerced = text.where(fast)
+    slow = raw.notna() & ~fast
+    if slow.any():
+        numbers = _apply_cells(raw, slow, lambda v: _to_decimal(v, limit))
+        coerced[slow] = numbers.map(lambda n: None if n is None else str(n))
+    return coerced.astype(object).where(coerced.notna(), None)
+
+
+def coerce_columns(columns, types):
+    """
+    按推断类型批量转换各列 (pandas 向量化，只有快速路径处理不了的单元格逐个转换)，
+    无法转换的单元格置为 NULL 并记入拒绝日志
+    :param columns: 列数组列表
+    :param types: 各列 DuckDB 类型
+    :return: (pandas Series 列表, 拒绝记录 DataFrame[column_index, row_index, raw_value])
+    """
+    import pandas as pd
+
+    series_list = []
+    rejects = []
+    for i, (values, col_type) in enumerate(zip(columns, types)):
+        raw = pd.Series(values, dtype=object)
+        raw = raw.where(raw != '')
+        if col_type == 'VARCHAR':
+            series_list.append(_coerce_text(raw).astype(object))
+            continue
+        if col_type == 'TIMESTAMP':
+            # 数值不按时间戳 (纳秒) 解释，直接视为无法转换
+            numeric_mask = pd.to_numeric(raw, errors='coerce').notna()
+            coerced = pd.to_datetime(raw.where(~numeric_mask), errors='coerce', format='mixed')
+        elif col_type == 'BIGINT':
+            # pd.to_numeric 经过 float64，超过 15~16 位的整数 (运单号、编号) 会被舍入
+            coerced = _coerce_bigint(raw)
+        elif col_type.startswith('DECIMAL'):
+            coerced = _coerce_decimal(raw, col_type)
+        else:
+            coerced = pd.to_numeric(raw, errors='coerce')
+        bad = raw.notna() & coerced.isna()
+        if bad.any():
+            bad_values = raw[bad]
+            rejects.append(pd.DataFrame({'column_index': i,
+                                         'row_index': bad_values.index,
+                                         'raw_value': bad_values.astype(str).values}))
+        series_list.append(coerced)
+
+    if rejects:
+        reject_df = pd.concat(rejects, ignore_index=True)
+    else:
+        reject_df = pd.DataFrame({'column_index': pd.Series(dtype='int64'),
+                                  'row_index': pd.Series(dtype='int64'),
+                                  'raw_value': pd.Series(dtype=object)})
+    return series_list, reject_df
+
+
+def write_typed_table(con, table_name, headers, rows, types, row_offset=0, replace=True, source=None):
+    """
+    按推断的类型将行数据写入 DuckDB 表，拒绝的单元格写入 {table_name}_rejects 表
+    :param con: DuckDB 连接
+    :param table_name: 目标表名
+    :param headers: 列名列表
+    :param rows: 行数据
+    :param types: infer_schema 得到的类型列表
+    :param row_offset: 拒绝日志中的行号偏移 (分批写入时使用)
+    :param replace: True 时重建表和拒绝日志，否则按列名追加 (表中有而 headers 中没有的列为 NULL)
+    :param source: 来源文件键；不为 None 时写入 _source_file 列 (表和拒绝日志都带该列)
+    :return: (写入行数, 拒绝单元格数)
+    """
+    import pandas as pd
+
+    columns = [list(col) for col in zip(*rows)] if rows else [[] for _ in headers]
+    for _ in range(len(columns), len(headers)):
+        columns.append([None] * len(rows))
+    series_list, reject_df = coerce_columns(columns, types)
+    df = pd.DataFrame({f'c{i}': s for i, s in enumerate(series_list)})
+    del columns, series_list
+
+    select_sql = ", ".join(f'CAST(c{i} AS {t}) AS "{h}"' for i, (h, t) in enumerate(zip(headers, types)))
+    reject_df['row_index'] += row_offset
+    reject_df['column_name'] = [headers[i] for i in reject_df['column_index']]
+    reject_df = reject_df[['column_name', 'row_index', 'raw_value']]
+    source_sql = ""
+    if source is not None:
+        literal = "'" + str(source).replace("'", "''") + "'"
+        source_sql = f', CAST({literal} AS VARCHAR) AS "{SOURCE_COLUMN}"'
+
+    con.register('typed_view', df)
+    con.register('reject_view', reject_df)
+    try:
+        if replace:
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT {select_sql}{source_sql} FROM typed_view")
+            con.execute(f"CREATE OR REPLACE TABLE {table_name}_rejects AS "
+                        f"SELECT CAST(column_name AS VARCHAR) AS column_name, "
+                        f"CAST(row_index AS BIGINT) AS row_index, "
+                        f"CAST(raw_value AS VARCHAR) AS raw_value{source_sql} FROM reject_view")
+        else:
+            con.execute(f"INSERT INTO {table_name} BY NAME SELECT {select_sql}{source_sql} FROM typed_view")
+            con.execute(f"INSERT INTO {table_name}_rejects SELECT *{source_sql} FROM reject_view")
+    finally:
+        con.unregister('typed_view')
+        con.unregister('reject_view')
+    return len(df), len(reject_df)
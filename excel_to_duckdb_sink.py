@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+from excel_to_duckdb_resources import connect
+
+# 输出目标: 'duckdb' 写 .duckdb 数据库文件，'parquet' 写 zstd 压缩的 Parquet，可同时选择
+SINKS = ('duckdb',)
+PARQUET_DIR = "parquet_output"
+PARQUET_COMPRESSION = 'zstd'
+# 行组越大，扫描时的元数据开销越小、压缩率越高；写入时每个行组需要在内存中缓冲
+PARQUET_ROW_GROUP_SIZE = 500000
+
+
+def open_staging(db_path, sinks=SINKS):
+    """
+    打开写入用的连接: 选择了 duckdb 输出时直接写数据库文件，否则使用内存库中转，
+    写完后由 export_parquet 导出
+    """
+    if 'duckdb' in sinks:
+        return connect(db_path)
+    return connect(':memory:')
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def export_parquet(con, table_name, out_path, partition=None,
+                   row_group_size=PARQUET_ROW_GROUP_SIZE, compression=PARQUET_COMPRESSION):
+    """
+    将表导出为 Parquet
+    :param con: DuckDB 连接
+    :param table_name: 表名
+    :param out_path: 不分区时为 .parquet 文件路径；分区时为数据集根目录
+    :param partition: {列名: 值}，按 hive 风格写入 out_path/列名=值/part-*.parquet，
+                      该分区目录下的旧文件被替换，其他分区不受影响
+    :return: 输出路径 (文件或分区目录)
+    先写入同一目录下的临时文件/目录，成功后再替换旧的输出；COPY 失败时旧的输出保持不变
+    """
+    options = f"FORMAT PARQUET, COMPRESSION {compression}, ROW_GROUP_SIZE {int(row_group_size)}"
+
+    if not partition:
+        out_dir = os.path.dirname(out_path)
+        if out_dir and not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        tmp_path = f"{out_path}.tmp"
+        try:
+            con.execute(f"COPY {table_name} TO {_literal(tmp_path)} ({options})")
+            os.replace(tmp_path, out_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return out_path
+
+    relative = os.path.join(*(f"{column}={value}" for column, value in partition.items()))
+    partition_dir = os.path.join(out_path, relative)
+    # 临时目录与数据集根目录同级 (同一文件系统，可以 os.replace)，不会被读取数据集的 glob 匹配到
+    root = os.path.abspath(out_path)
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(root)}_", dir=os.path.dirname(root))
+    try:
+        extra_columns = ", ".join(f"{_literal(v)} AS \"{c}\"" for c, v in partition.items())
+        partition_columns = ", ".join(f'"{c}"' for c in partition)
+        con.execute(f"COPY (SELECT *, {extra_columns} FROM {table_name}) TO {_literal(tmp_dir)} "
+                    f"({options}, PARTITION_BY ({partition_columns}), OVERWRITE_OR_IGNORE, "
+                    f"FILENAME_PATTERN 'part-{{i}}')")
+        new_dir = os.path.join(tmp_dir, relative)
+        if not os.path.exists(new_dir):
+            # 表为空时 COPY 不生成分区目录
+            os.makedirs(new_dir)
+        os.makedirs(os.path.dirname(partition_dir), exist_ok=True)
+        # 非空目录不能直接被 os.replace 覆盖: 旧分区先移入临时目录，新分区就位后随临时目录一起删除
+        if os.path.exists(partition_dir):
+            os.replace(partition_dir, os.path.join(tmp_dir, '.previous'))
+        try:
+            os.replace(new_dir, partition_dir)
+        except OSError:
+            if os.path.exists(os.path.join(tmp_dir, '.previous')):
+                os.replace(os.path.join(tmp_dir, '.previous'), partition_dir)
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return partition_dir
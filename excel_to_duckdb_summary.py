@@ -0,0 +1,365 @@
+import os
+import time
+
+import duckdb
+
+from excel_to_duckdb_manifest import SOURCE_COLUMN
+from excel_to_duckdb_catalog import MONTH_COLUMN, UNION_VIEW, open_union
+from excel_to_duckdb_metrics import StageMetrics
+from excel_to_duckdb_resources import connect
+from excel_to_duckdb_pool import fan_out
+
+# 透视汇总配置: 过滤、分组和聚合全部下推到 DuckDB，只有结果行返回 Python
+# - key_column: 运单号码列，只统计该列非空的行
+# - exclude_values: 任一文本列等于这些值的行被排除；合计行已在导入时过滤 (excel_to_duckdb_clean)，
+#   默认为空，查询时没有逐行清理的开销；查询旧版导入的数据库时可设为 ['合 计']
+# - group_by: 额外的分组列 (如 ['产品类型'])，为空时每个数据库汇总为一行
+# - filters: 额外的 WHERE 条件 (SQL 片段)
+# - measures: (输出列名, 聚合函数 count/sum/avg/min/max, 源列)
+# - rollup_by: 汇总表 (见下) 的维度，列名或 (列名, 'day') 按天截取；透视的 group_by 须是其子集才能使用汇总表
+SUMMARY_CONFIG = {
+    'table': 'sftable',
+    'key_column': '运单号码',
+    'exclude_values': [],
+    'group_by': [],
+    'filters': [],
+    'measures': [
+        ('总单量', 'count', '运单号码'),
+        ('总计费重量', 'sum', '计费重量'),
+        ('总应付金额', 'sum', '应付金额'),
+    ],
+    'rollup_by': [],
+}
+
+# 汇总表: 导入时按 (来源文件, rollup_by 维度) 预先聚合，存为 {table}_summary；
+# 新增/变化/移除的文件只更新自己的行，透视报表只读取汇总表，耗时与明细行数无关
+SUMMARY_SUFFIX = '_summary'
+# 各聚合函数在汇总表中保存的部分聚合 (avg 由 sum 和 count 合成)
+_PARTIALS = {
+    'count': ('count',),
+    'sum': ('sum',),
+    'avg': ('sum', 'count'),
+    'min': ('min',),
+    'max': ('max',),
+}
+# 部分聚合再汇总时使用的函数
+_COMBINE = {'count': 'SUM', 'sum': 'SUM', 'min': 'MIN', 'max': 'MAX'}
+# 数值列按原类型聚合 (DECIMAL 求和保持精确)，只有文本列 (旧版全部为 VARCHAR 的表) 才转换为 DOUBLE
+_NUMERIC_TYPES = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'FLOAT', 'DOUBLE')
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _value_expr(column, column_types):
+    """聚合的输入: 数值列直接使用，其它类型无法转换的值按 NULL 处理"""
+    col_type = column_types.get(column, '')
+    if col_type in _NUMERIC_TYPES or col_type.startswith('DECIMAL'):
+        return _quote(column)
+    return f"TRY_CAST({_quote(column)} AS DOUBLE)"
+
+
+def _finalize(func, expr):
+    """count / sum 没有有效行时为 0；avg / min / max 保持 NULL (不能与真实的 0 混淆)"""
+    if func == 'count':
+        return f"COALESCE({expr}, 0)::BIGINT"
+    if func == 'sum':
+        return f"COALESCE({expr}, 0)"
+    return expr
+
+
+def empty_row(config=SUMMARY_CONFIG):
+    """没有有效行时的汇总行 (与汇总 SQL 的结果一致)"""
+    return [0 if func.lower() in ('count', 'sum') else None for _, func, _ in config['measures']]
+
+
+def summary_headers(config=SUMMARY_CONFIG):
+    """汇总结果的列名 (分组列 + 聚合列)"""
+    return list(config['group_by']) + [m[0] for m in config['measures']]
+
+
+def _conditions(config, column_types):
+    """
+    有效行的过滤条件列表 (运单号码非空、排除值、额外条件)
+    表中没有 key_column 时不按其过滤 (由调用方提示)，不因缺列导致整个汇总失败
+    """
+    conditions = []
+
+    key = config.get('key_column')
+    if key and key in column_types:
+        conditions.append(f"NULLIF(CAST({_quote(key)} AS VARCHAR), '') IS NOT NULL")
+
+    exclude_values = config.get('exclude_values') or []
+    text_columns = [c for c, t in column_types.items() if t == 'VARCHAR']
+    for value in exclude_values:
+        for col in text_columns:
+            conditions.append(f"{_quote(col)} IS DISTINCT FROM {_literal(value)}")
+
+    conditions.extend(f"({f})" for f in config.get('filters') or [])
+    return conditions
+
+
+def build_summary_sql(config, column_types):
+    """
+    根据配置生成汇总 SQL
+    :param config: 汇总配置 (见 SUMMARY_CONFIG)
+    :param column_types: 表的 {列名: DuckDB 类型}，用于确定需要排除汇总行的文本列
+    :return: SQL 字符串
+    """
+    conditions = _conditions(config, column_types)
+
+    select_parts = [_quote(g) for g in config['group_by']]
+    for name, func, column in config['measures']:
+        func = func.lower()
+        if func not in ('count', 'sum', 'avg', 'min', 'max'):
+            raise ValueError(f"不支持的聚合函数: {func}")
+        if column not in column_types:
+            # 表中没有该列: 与汇总表一致，计数和求和为 0，其余为 NULL
+            expr = _finalize(func, f"{func.upper()}(NULL::DOUBLE)")
+        elif func == 'count':
+            expr = f"COUNT({_quote(column)})"
+        else:
+            # 兼容旧版全部为 VARCHAR 的表: 无法转换的值按 NULL 处理
+            expr = _finalize(func, f"{func.upper()}({_value_expr(column, column_types)})")
+        select_parts.append(f"{expr} AS {_quote(name)}")
+
+    sql = f"SELECT {', '.join(select_parts)} FROM {_quote(config['table'])}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if config['group_by']:
+        group_sql = ", ".join(_quote(g) for g in config['group_by'])
+        sql += f" GROUP BY {group_sql} ORDER BY {group_sql}"
+    return sql
+
+
+def run_summary(con, config=SUMMARY_CONFIG):
+    """在一个数据库连接上执行汇总，返回结果行列表"""
+    column_types = {r[0]: r[1] for r in con.execute(f"DESCRIBE {_quote(config['table'])}").fetchall()}
+    return con.execute(build_summary_sql(config, column_types)).fetchall()
+
+
+def summarize_db(db_path, config=SUMMARY_CONFIG, use_summary=False):
+    """
+    以只读方式打开数据库文件并执行汇总
+    :param use_summary: 为 True 且汇总表可用时只读取汇总表，否则扫描明细表
+    """
+    con = connect(db_path, read_only=True)
+    try:
+        return _summarize(con, config, use_summary)
+    finally:
+        con.close()
+
+
+def _summarize(con, config, use_summary):
+    if use_summary and can_use_summary(config) and summary_ready(con, config):
+        return con.execute(build_rollup_sql(config, summary_table(config))).fetchall()
+    return run_summary(con, config)
+
+
+def summary_table(config=SUMMARY_CONFIG):
+    """汇总表名"""
+    return config['table'] + SUMMARY_SUFFIX
+
+
+def _rollup_dims(config):
+    """汇总表的维度 [(列名, 表达式)]"""
+    dims = []
+    for dim in config.get('rollup_by') or []:
+        if isinstance(dim, (list, tuple)):
+            name, grain = dim
+            if grain != 'day':
+                raise ValueError(f"不支持的汇总粒度: {grain}")
+            dims.append((name, f"CAST(TRY_CAST({_quote(name)} AS TIMESTAMP) AS DATE)"))
+        else:
+            dims.append((dim, _quote(dim)))
+    return dims
+
+
+def _partial_columns(config):
+    """汇总表中的部分聚合列 [(列名, 聚合函数, 源列)]，列名如 总计费重量__sum"""
+    columns = []
+    for name, func, column in config['measures']:
+        func = func.lower()
+        if func not in _PARTIALS:
+            raise ValueError(f"不支持的聚合函数: {func}")
+        for part in _PARTIALS[func]:
+            columns.append((f"{name}__{part}", part, column))
+    return columns
+
+
+def build_partial_sql(config, column_types, sources=None):
+    """
+    生成按 (来源文件, 维度) 部分聚合明细表的 SQL
+    :param sources: 只聚合这些来源文件 (以 $1 列表参数传入)；None 时聚合整张表
+    """
+    conditions = _conditions(config, column_types)
+    if sources is not None:
+        conditions.append(f"{_quote(SOURCE_COLUMN)} IN (SELECT unnest($1::VARCHAR[]))")
+    dims = _rollup_dims(config)
+    select_parts = [_quote(SOURCE_COLUMN)]
+    for name, expr in dims:
+        select_parts.append(f"{expr if name in column_types else 'NULL::VARCHAR'} AS {_quote(name)}")
+    for name, part, column in _partial_columns(config):
+        if column not in column_types:
+            # 所有文件都没有该列: 计数为 0，其余为 NULL
+            expr = "0::BIGINT" if part == 'count' else "NULL::DOUBLE"
+        elif part == 'count':
+            expr = f"COUNT({_quote(column)})"
+        else:
+            expr = f"{part.upper()}({_value_expr(column, column_types)})"
+        select_parts.append(f"{expr} AS {_quote(name)}")
+    sql = f"SELECT {', '.join(select_parts)} FROM {_quote(config['table'])}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql + " GROUP BY " + ", ".join(str(i + 1) for i in range(len(dims) + 1))
+
+
+def update_summary_table(con, config=SUMMARY_CONFIG, sources=None, removed=()):
+    """
+    维护汇总表 (与明细表在同一事务中调用)
+    :param sources: 本次新写入的来源文件键；None 时由整张明细表重建汇总表
+    :param removed: 已从明细表删除的来源文件键 (移除或变化的文件)
+    :return: 是否整体重建
+    """
+    column_types = {r[0]: r[1] for r in con.execute(f"DESCRIBE {_quote(config['table'])}").fetchall()}
+    target = _quote(summary_table(config))
+    if sources is not None:
+        # 维度类型或聚合列与现有汇总表不一致 (如配置已修改、列类型被放宽) 时整体重建
+        expected = con.execute(f"DESCRIBE {build_partial_sql(config, column_types, [])}", [[]]).fetchall()
+        try:
+            existing = con.execute(f"DESCRIBE {target}").fetchall()
+        except duckdb.CatalogException:
+            existing = None
+        if existing is not None and [r[:2] for r in existing] == [r[:2] for r in expected]:
+            stale = list(removed) + [s for s in sources if s not in removed]
+            if stale:
+                con.execute(f"DELETE FROM {target} WHERE {_quote(SOURCE_COLUMN)} IN (SELECT unnest($1::VARCHAR[]))",
+                            [stale])
+            if sources:
+                con.execute(f"INSERT INTO {target} {build_partial_sql(config, column_types, sources)}",
+                            [list(sources)])
+            return False
+    con.execute(f"CREATE OR REPLACE TABLE {target} AS {build_partial_sql(config, column_types)}")
+    return True
+
+
+def build_rollup_sql(config, relation, extra_group_by=()):
+    """
+    由汇总表 (或多个汇总表的合并视图) 生成透视结果的 SQL，结果列与 build_summary_sql 一致
+    :param extra_group_by: 加在 group_by 之前的分组列 (如合并视图中的 month_id)
+    """
+    group_by = list(extra_group_by) + list(config['group_by'])
+    select_parts = [_quote(g) for g in group_by]
+    for name, func, _ in config['measures']:
+        func = func.lower()
+        if func == 'avg':
+            expr = f'SUM({_quote(name + "__sum")}) / NULLIF(SUM({_quote(name + "__count")}), 0)'
+        else:
+            expr = f'{_COMBINE[func]}({_quote(f"{name}__{_PARTIALS[func][0]}")})'
+        select_parts.append(f"{_finalize(func, expr)} AS {_quote(name)}")
+    sql = f"SELECT {', '.join(select_parts)} FROM {_quote(relation)}"
+    if group_by:
+        group_sql = ", ".join(_quote(g) for g in group_by)
+        sql += f" GROUP BY {group_sql} ORDER BY {group_sql}"
+    return sql
+
+
+def can_use_summary(config=SUMMARY_CONFIG):
+    """透视的分组列都在汇总表维度中时可以只读汇总表"""
+    dims = {name for name, _ in _rollup_dims(config)}
+    return all(g in dims for g in config['group_by'])
+
+
+def summary_ready(con, config=SUMMARY_CONFIG):
+    """
+    返回汇总表结构与当前配置一致的数据库名集合 (含 ATTACH 的数据库)
+    汇总表不存在或缺少列 (配置修改后尚未重新导入) 的数据库不在其中
+    """
+    required = {name for name, _ in _rollup_dims(config)} | {c[0] for c in _partial_columns(config)}
+    found = {}
+    for database, column in con.execute("SELECT database_name, column_name FROM duckdb_columns() "
+                                        "WHERE table_name = ?", [summary_table(config)]).fetchall():
+        found.setdefault(database, set()).add(column)
+    return {database for database, columns in found.items() if required <= columns}
+
+
+# 多个月结卡号汇总表的合并视图名
+SUMMARY_VIEW = 'all_month_summaries'
+
+
+def _union_summary(month_dbs, config, use_summary, metrics, log):
+    """ATTACH 所有数据库一次查询完成汇总，返回 {month_id: [行]}"""
+    con = None
+    if use_summary and can_use_summary(config):
+        with metrics.stage('attach'):
+            try:
+                con = open_union(month_dbs, summary_table(config), SUMMARY_VIEW)
+            except ValueError:
+                con = None
+            if con is not None and len(summary_ready(con, config)) < len(month_dbs):
+                log("部分数据库没有可用的汇总表，改为扫描明细表")
+                con.close()
+                con = None
+    if con is not None:
+        sql = build_rollup_sql(config, SUMMARY_VIEW, [MONTH_COLUMN])
+    else:
+        with metrics.stage('attach'):
+            con = open_union(month_dbs, config['table'])
+        union_config = dict(config, table=UNION_VIEW, group_by=[MONTH_COLUMN] + list(config['group_by']))
+        column_types = {r[0]: r[1] for r in con.execute(f"DESCRIBE {_quote(UNION_VIEW)}").fetchall()}
+        sql = build_summary_sql(union_config, column_types)
+    results = {}
+    try:
+        with metrics.stage('summarize'):
+            for month_id, *row in con.execute(sql).fetchall():
+                results.setdefault(month_id, []).append(row)
+    finally:
+        con.close()
+    return results
+
+
+def summarize_months(month_dbs, config=SUMMARY_CONFIG, use_union=True, use_summary=True, metrics=None, log=print,
+                     pool=None):
+    """
+    汇总多个月结卡号数据库 (SF-2 透视和命令行 pivot 共用)
+    :param month_dbs: {month_id: 数据库路径}
+    :param use_union: True 时 ATTACH 全部数据库一次查询，否则各数据库由线程池并行汇总
+    :param use_summary: True 时优先读取汇总表，不可用时扫描明细表
+    :param metrics: StageMetrics，记录 attach/summarize 阶段耗时
+    :param pool: 逐个汇总时使用的只读连接池 (excel_to_duckdb_pool.ConnectionPool)，反复汇总同一批文件时
+                 不再重复打开数据库；None 时使用临时连接池
+    :return: [(month_id, 汇总行)]，按 month_dbs 的顺序
+    """
+    metrics = metrics or StageMetrics('summary', ','.join(month_dbs))
+    report = []
+    if use_union and month_dbs:
+        log(f"ATTACH {len(month_dbs)} 个数据库并建立合并视图 ing")
+        t1 = time.time()
+        results = _union_summary(month_dbs, config, use_summary, metrics, log)
+        log(f"汇总 {len(month_dbs)} 个数据库中表 {config['table']}，耗时{time.time() - t1:.2f}s")
+        for month_id in month_dbs:
+            rows = results.get(month_id)
+            if rows is None and not config['group_by']:
+                # 没有有效行的月结卡号与逐个汇总时一致 (计数和求和为 0，其余为空)
+                rows = [empty_row(config)]
+            report.extend((month_id, row) for row in rows or [])
+        return report
+
+    def summarize(cur, month_id):
+        # 统计和求和都在 DuckDB 中完成，只取回汇总结果 (合计行已在导入时过滤)
+        t1 = time.time()
+        rows = _summarize(cur, config, use_summary)
+        log(f"汇总数据库 {os.path.basename(month_dbs[month_id])} 中表 {config['table']}，耗时{time.time() - t1:.2f}s")
+        return rows
+
+    log(f"并行汇总 {len(month_dbs)} 个数据库 ing")
+    with metrics.stage('summarize'):
+        results = fan_out(month_dbs, summarize, pool=pool)
+    for month_id, rows in results:
+        report.extend((month_id, list(row)) for row in rows)
+    return report
@@ -0,0 +1,43 @@
+from excel_to_duckdb_clean import clean_rows, detect_header, split_sheet
+
+
+def test_keyword_row_is_header():
+    rows = [['顺丰月结账单'], ['月结卡号', 'A001'], ['序号', '运单号码', '金额'], [1, 'SF1', 2.5]]
+    assert detect_header(rows) == 2
+
+
+def test_numeric_header_cells_keep_first_row():
+    assert detect_header([['name', 2023, 2024], ['a', 'x', 'y']]) == 0
+
+
+def test_blank_header_cells_keep_first_row():
+    assert detect_header([['id', 'name', '', '', ''], ['1', 'a', 'b', 'c', 'd']]) == 0
+
+
+def test_title_rows_are_skipped():
+    rows = [['XX 公司 1 月账单', None, None], [None, None, None], ['客户', '金额', '备注'], ['a', 1, None]]
+    assert detect_header(rows) == 2
+
+
+def test_single_column_sheet():
+    assert detect_header([['name'], ['a'], ['b']]) == 0
+
+
+def test_split_sheet_drops_totals_and_empty_rows():
+    sheet = [['标题'], ['运单号码', '金额'], ['SF1', 1], [None, None], ['SF2', 2], ['合 计', 3]]
+    header, rows = split_sheet(sheet)
+    assert header == ['运单号码', '金额']
+    assert rows == [['SF1', 1], ['SF2', 2]]
+
+
+def test_split_sheet_finds_aliased_header_below_preamble():
+    sheet = [['月结卡号', 'A001'], ['运单号', '金额'], ['SF1', 1], ['合 计', 1]]
+    assert split_sheet(sheet)[0] == ['月结卡号', 'A001']
+    header, rows = split_sheet(sheet, keywords=('运单号码', '运单号', '运单编号'))
+    assert header == ['运单号', '金额']
+    assert rows == [['SF1', 1]]
+
+
+def test_clean_rows_returns_same_list_when_nothing_to_drop():
+    rows = [['SF1', 1], ['SF2', '']]
+    assert clean_rows(rows) is rows
@@ -0,0 +1,69 @@
+import duckdb
+import openpyxl
+
+from excel_to_duckdb_processor import save_excel_sheets_to_duckdb, save_excel_to_duckdb_streaming
+
+
+def _workbook(path, sheets):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def _rows(db_path, sql):
+    con = duckdb.connect(str(db_path), read_only=True)
+    try:
+        return con.execute(sql).fetchall()
+    finally:
+        con.close()
+
+
+def test_union_header_only_sheet_before_data(tmp_path):
+    excel_path, db_path = tmp_path / 'book.xlsx', tmp_path / 'out.duckdb'
+    _workbook(excel_path, {'空表': [['运单号码', '金额']],
+                           '数据': [['运单号码', '金额'], ['SF1', 1.5], ['SF2', 2.5]]})
+    counts = save_excel_sheets_to_duckdb(str(excel_path), str(db_path), 'bill', sheet_mode='union')
+    assert counts == {'空表': 0, '数据': 2}
+    assert _rows(db_path, 'SELECT "运单号码", "金额", sheet_name FROM bill ORDER BY 1') == \
+        [('SF1', 1.5, '数据'), ('SF2', 2.5, '数据')]
+
+
+def test_header_only_sheets_create_empty_tables(tmp_path):
+    excel_path, db_path = tmp_path / 'book.xlsx', tmp_path / 'out.duckdb'
+    _workbook(excel_path, {'空表': [['运单号码', '金额']],
+                           '数据': [['运单号码', '金额'], ['SF1', 1.5]]})
+    save_excel_sheets_to_duckdb(str(excel_path), str(db_path), 'bill', sheet_mode='per_sheet')
+    assert _rows(db_path, 'SELECT count(*) FROM bill_空表') == [(0,)]
+    assert [r[0] for r in _rows(db_path, 'DESCRIBE bill_空表')] == ['运单号码', '金额']
+    assert _rows(db_path, 'SELECT count(*) FROM bill_数据') == [(1,)]
+
+
+def test_union_all_sheets_header_only(tmp_path):
+    excel_path, db_path = tmp_path / 'book.xlsx', tmp_path / 'out.duckdb'
+    _workbook(excel_path, {'a': [['运单号码', '金额']], 'b': [['运单号码', '金额']]})
+    save_excel_sheets_to_duckdb(str(excel_path), str(db_path), 'bill', sheet_mode='union')
+    assert _rows(db_path, 'SELECT count(*) FROM bill') == [(0,)]
+
+
+def test_header_only_sheets_export_parquet(tmp_path):
+    excel_path, parquet_dir = tmp_path / 'book.xlsx', tmp_path / 'parquet'
+    _workbook(excel_path, {'空表': [['运单号码', '金额']]})
+    for mode in ('union', 'per_sheet'):
+        save_excel_sheets_to_duckdb(str(excel_path), str(tmp_path / 'out.duckdb'), 'bill', sheet_mode=mode,
+                                    sinks=('parquet',), parquet_dir=str(parquet_dir))
+    assert duckdb.sql(f"SELECT count(*) FROM '{parquet_dir / 'bill.parquet'}'").fetchall() == [(0,)]
+    assert duckdb.sql(f"SELECT count(*) FROM '{parquet_dir / 'bill_空表.parquet'}'").fetchall() == [(0,)]
+
+
+def test_streaming_header_only_sheet_exports_parquet(tmp_path):
+    excel_path, parquet_dir = tmp_path / 'book.xlsx', tmp_path / 'parquet'
+    _workbook(excel_path, {'Sheet1': [['运单号码', '金额'], ['合 计', 0]]})
+    row_count = save_excel_to_duckdb_streaming(str(excel_path), str(tmp_path / 'out.duckdb'), 'bill',
+                                               sinks=('duckdb', 'parquet'), parquet_dir=str(parquet_dir))
+    assert row_count == 0
+    assert _rows(tmp_path / 'out.duckdb', 'SELECT count(*) FROM bill') == [(0,)]
+    assert duckdb.sql(f"SELECT count(*) FROM '{parquet_dir / 'bill.parquet'}'").fetchall() == [(0,)]
@@ -0,0 +1,26 @@
+import duckdb
+import pytest
+
+from excel_to_duckdb_reader import iter_pages
+
+
+def _connection():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE t AS SELECT range AS id, 'SF' || range AS waybill FROM range(25)")
+    con.execute("CREATE VIEW v AS SELECT * FROM t")
+    return con
+
+
+def test_table_pages_by_rowid():
+    pages = list(iter_pages(_connection(), 't', page_size=10))
+    assert [len(rows) for rows, _ in pages] == [10, 10, 5]
+    assert pages[-1][1] == (24,)
+
+
+def test_view_requires_key_columns():
+    con = _connection()
+    with pytest.raises(ValueError, match='key_columns'):
+        list(iter_pages(con, 'v'))
+    pages = list(iter_pages(con, 'v', key_columns=['id'], columns=['waybill'], page_size=10))
+    assert [len(rows) for rows, _ in pages] == [10, 10, 5]
+    assert pages[0][0][0] == ('SF0',)
@@ -0,0 +1,61 @@
+import decimal
+
+import duckdb
+import pytest
+
+from excel_to_duckdb_schema import infer_column_type, write_typed_table
+
+
+@pytest.mark.parametrize('value', ['1234567890123456', '12345678901234567', '123456789012345678',
+                                   1234567890123456, 123456789012345678])
+def test_bigint_keeps_every_digit(value):
+    con = duckdb.connect()
+    assert infer_column_type([value]) == 'BIGINT'
+    write_typed_table(con, 't', ['a'], [[value]], ['BIGINT'])
+    assert con.execute("SELECT a FROM t").fetchone()[0] == int(value)
+    assert con.execute("SELECT COUNT(*) FROM t_rejects").fetchone()[0] == 0
+
+
+def test_nineteen_digit_integers_stay_text():
+    # 19 位数可能超出 BIGINT 范围，推断为文本
+    assert infer_column_type(['1234567890123456789']) == 'VARCHAR'
+
+
+def test_bigint_out_of_range_is_rejected():
+    con = duckdb.connect()
+    write_typed_table(con, 't', ['a'], [['9223372036854775807'], ['9223372036854775808'], [None]], ['BIGINT'])
+    assert con.execute("SELECT a FROM t").fetchall() == [(9223372036854775807,), (None,), (None,)]
+    assert con.execute("SELECT row_index, raw_value FROM t_rejects").fetchall() == [(1, '9223372036854775808')]
+
+
+def test_decimal_is_exact():
+    con = duckdb.connect()
+    values = [['12345678901234.5678'], ['99999999999999.9999'], ['0.0001'], [1612.07]]
+    write_typed_table(con, 't', ['a'], values, ['DECIMAL(18,4)'])
+    assert [r[0] for r in con.execute("SELECT a FROM t").fetchall()] == [
+        decimal.Decimal('12345678901234.5678'), decimal.Decimal('99999999999999.9999'),
+        decimal.Decimal('0.0001'), decimal.Decimal('1612.0700')]
+
+
+def test_decimal_overflow_is_rejected():
+    con = duckdb.connect()
+    write_typed_table(con, 't', ['a'], [['123456789012345.5'], ['1.5']], ['DECIMAL(18,4)'])
+    assert con.execute("SELECT a FROM t").fetchall() == [(None,), (decimal.Decimal('1.5000'),)]
+    assert con.execute("SELECT row_index FROM t_rejects").fetchall() == [(0,)]
+
+
+def test_text_column_from_numbers():
+    con = duckdb.connect()
+    write_typed_table(con, 't', ['a'], [[3.0], [2.5], [1e16], [None], ['SF1'], [7]], ['VARCHAR'])
+    assert [r[0] for r in con.execute("SELECT a FROM t").fetchall()] == [
+        '3', '2.5', '10000000000000000', None, 'SF1', '7']
+
+
+def test_bigint_mixed_cells_are_exact():
+    con = duckdb.connect()
+    values = [['123456789012345678'], [' 42 '], ['3.0'], [5.0], [None],
+              ['1.5'], ['abc']]
+    write_typed_table(con, 't', ['a'], values, ['BIGINT'])
+    assert [r[0] for r in con.execute("SELECT a FROM t").fetchall()] == [
+        123456789012345678, 42, 3, 5, None, None, None]
+    assert con.execute("SELECT row_index FROM t_rejects ORDER BY 1").fetchall() == [(5,), (6,)]
@@ -0,0 +1,24 @@
+import duckdb
+
+from excel_to_duckdb_summary import SUMMARY_CONFIG, build_rollup_sql, run_summary, update_summary_table
+
+
+def _table_without_key():
+    con = duckdb.connect()
+    con.execute('CREATE TABLE sftable ("运单号" VARCHAR, "计费重量" DECIMAL(18,2), "应付金额" DECIMAL(18,2), '
+                '_source_file VARCHAR)')
+    con.execute("INSERT INTO sftable VALUES ('SF1', 1.10, 2.20, 'a.xlsx'), ('SF2', 3.30, 4.40, 'a.xlsx')")
+    return con
+
+
+def test_summary_table_without_key_column():
+    con = _table_without_key()
+    assert update_summary_table(con, SUMMARY_CONFIG)
+    rows = con.execute(build_rollup_sql(SUMMARY_CONFIG, 'sftable_summary')).fetchall()
+    assert [tuple(map(str, r)) for r in rows] == [('0', '4.40', '6.60')]
+
+
+def test_scan_summary_without_key_column():
+    con = _table_without_key()
+    rows = run_summary(con, SUMMARY_CONFIG)
+    assert [tuple(map(str, r)) for r in rows] == [('0', '4.40', '6.60')]